@@ -68,7 +68,6 @@ from requests.adapters import HTTPAdapter, Retry
 from scgraph.geographs.marnet import marnet_geograph
 from sqlalchemy import and_, case, func, or_
 from sqlalchemy_utils import database_exists
-from timezonefinder import TimezoneFinder
 from werkzeug.exceptions import HTTPException
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
@@ -85,13 +84,11 @@ logger = logging.getLogger(__name__)
 
 
 # Local Application/Library Specific Imports
-from py import geopip_country
-from py.currency import get_available_currencies, get_exchange_rate
-from py.db_init import init_data, init_main
+from py.currency import convert_prices, get_available_currencies, get_exchange_rate
+from py.db_init import init_data, init_main, init_path
 from py.g_search import get_vessel_picture
 from py.image_generator import generate_image
 from py.sql import (
-    adminStats,
     deleteUserPath,
     deleteUserTrips,
     getAirports,
@@ -104,15 +101,13 @@ from py.sql import (
     getNumberStations,
     getOperators,
     getTags,
-    getTicket,
     getTickets,
     getTrainStations,
     getTrip,
-    getTripsCountry,
     getUniqueUserTrips,
     getUserLines,
+    getUserLinesAtResolution,
     getUserTrips,
-    initPath,
     publicStats,
     saveQuery,
     upsertPercent,
@@ -140,10 +135,8 @@ from py.utils import (
     getIpDetails,
     getRequestData,
     hex_to_rgb,
-    interpolate_great_circle,
     interpolate_points_if_gaps,
     load_config,
-    remove_diacritics,
     rgb_to_hex,
     stringSimmilarity,
     unicodedata,
@@ -188,7 +181,8 @@ from src.utils import (
     check_and_increment_fr24_usage,
     fr24_usage,
     get_default_trip_visibility,
-    current_user_is_friend_with
+    current_user_is_friend_with,
+    get_user,
 )
 from src.trips import (
     Trip,
@@ -201,7 +195,40 @@ from src.trips import (
     change_trips_visibility,
     delete_ticket_from_db,
 )
-from src.paths import Path
+from src import (
+    admin_users,
+    coverage_polygons,
+    geocoding_cache,
+    http_client,
+    place_search,
+    tile_store,
+    trip_hydration,
+    trip_pages,
+    trip_search,
+)
+from src.coverage import (
+    coverage_percent,
+    delete_coverage_polygons,
+    get_covered_polygons,
+    merge_coverage_polygons,
+)
+from src.paths import RESOLUTIONS, Path, path_summary, resolution_column
+from src.timezones import to_local_batch
+from src.visited_squares import (
+    get_visited_squares,
+    squares_percentages,
+    update_world_squares_percent,
+)
+from src.vector_tiles import (
+    BUFFER,
+    encode_trips_tile,
+    get_cached_tile,
+    store_cached_tile,
+    tile_lnglat_bounds,
+    tile_resolution,
+    trips_version,
+)
+from src.path_codec import decode_path
 from src.carbon import *
 from src.users import User, Friendship, authDb
 from src.email_parser import start_email_listener
@@ -224,8 +251,10 @@ app.register_blueprint(stats_blueprint)
 app.register_blueprint(wrapped_blueprint)
 app.register_blueprint(ai_blueprint)
 
-app.config["CACHE_TYPE"] = "SimpleCache"
+# Shared by all the workers, see src/sqlite_cache.py
+app.config["CACHE_TYPE"] = "src.sqlite_cache.SQLiteCache"
 app.config["CACHE_DEFAULT_TIMEOUT"] = 864000
+app.config["CACHE_THRESHOLD"] = 100000
 cache = Cache(app)
 
 matomo_config = load_config().get("matomo")
@@ -250,7 +279,7 @@ def getLoggedUserCurrency():
     if user == "public":
         return "EUR"
     else:
-        return User.query.filter_by(username=user).first().user_currency
+        return get_user(user).user_currency
 
 
 def generate_distinct_color(existing_hex_colors):
@@ -302,7 +331,7 @@ def fetch_and_filter_flights(flight_filter_key, flight_filter_value, target_date
         "Authorization": f"Bearer {config['FR24']['token_auth']}",
     }
     try:
-        response = requests.get(
+        response = http_client.get(
             "https://fr24api.flightradar24.com/api/flight-summary/light",
             headers=headers,
             params={
@@ -316,64 +345,61 @@ def fetch_and_filter_flights(flight_filter_key, flight_filter_value, target_date
     except requests.RequestException as e:
         return {"error": "Failed to fetch data from FR24 API", "details": str(e)}, 502
     flights = response.json().get("data", [])
-    filtered = []
+
+    icaos = {
+        icao for f in flights for icao in (f.get("orig_icao"), f.get("dest_icao")) if icao
+    }
     with managed_cursor(mainConn) as cursor:
-        for f in flights:
-            orig_icao = f.get("orig_icao")
-            dest_icao = f.get("dest_icao")
-            takeoff_str = f.get("datetime_takeoff")
-            first_seen_str = f.get("first_seen")
-            landing_str = f.get("datetime_landed")
-            last_seen_str = f.get("last_seen")
-            
-            if orig_icao and (takeoff_str or first_seen_str):
-                cursor.execute(
-                    "SELECT latitude, longitude FROM airports WHERE ident = :icao",
-                    {"icao": orig_icao},
-                )
-                orig_coords = cursor.fetchone()
-                if orig_coords:
-                    try:
-                        # Use takeoff time if available, otherwise fall back to first_seen
-                        departure_str = takeoff_str if takeoff_str else first_seen_str
-                        utc_departure = datetime.fromisoformat(
-                            departure_str.replace("Z", "+00:00")
-                        )
-                        local_departure = getLocalDatetime(
-                            orig_coords[0], orig_coords[1], utc_departure
-                        )
-                        if local_departure.date() == target_date:
-                            # Set the appropriate field based on what we used
-                            if takeoff_str:
-                                f["datetime_takeoff_local"] = local_departure.isoformat()
-                            else:
-                                f["datetime_takeoff_local"] = local_departure.isoformat()
-                                f["_used_first_seen_for_takeoff"] = True  # Optional flag for debugging
-                            
-                            if dest_icao and (landing_str or last_seen_str):
-                                cursor.execute(
-                                    "SELECT latitude, longitude FROM airports WHERE ident = :icao",
-                                    {"icao": dest_icao},
-                                )
-                                dest_coords = cursor.fetchone()
-                                if dest_coords:
-                                    # Use landing time if available, otherwise fall back to last_seen
-                                    arrival_str = landing_str if landing_str else last_seen_str
-                                    utc_landing = datetime.fromisoformat(
-                                        arrival_str.replace("Z", "+00:00")
-                                    )
-                                    local_landing = getLocalDatetime(
-                                        dest_coords[0], dest_coords[1], utc_landing
-                                    )
-                                    f["datetime_landed_local"] = (
-                                        local_landing.isoformat()
-                                    )
-                                    # Optional flag for debugging
-                                    if not landing_str:
-                                        f["_used_last_seen_for_landing"] = True
-                            filtered.append(f)
-                    except Exception:
-                        pass
+        cursor.execute(
+            "SELECT ident, latitude, longitude FROM airports WHERE ident IN ({})".format(
+                ", ".join("?" * len(icaos))
+            ),
+            tuple(icaos),
+        )
+        airports = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    def parse_utc(value):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            return None
+
+    # Use takeoff/landing times if available, otherwise fall back to first/last seen
+    departures = []
+    arrivals = []
+    for f in flights:
+        departure_str = f.get("datetime_takeoff") or f.get("first_seen")
+        arrival_str = f.get("datetime_landed") or f.get("last_seen")
+        orig_coords = airports.get(f.get("orig_icao"))
+        dest_coords = airports.get(f.get("dest_icao"))
+        departures.append(
+            (*orig_coords, parse_utc(departure_str))
+            if orig_coords and departure_str
+            else (None, None, None)
+        )
+        arrivals.append(
+            (*dest_coords, parse_utc(arrival_str))
+            if dest_coords and arrival_str
+            else (None, None, None)
+        )
+    local_departures = to_local_batch(departures)
+    local_landings = to_local_batch(arrivals)
+
+    filtered = []
+    for f, local_departure, local_landing in zip(
+        flights, local_departures, local_landings
+    ):
+        if local_departure is None or local_departure.date() != target_date:
+            continue
+        f["datetime_takeoff_local"] = local_departure.isoformat()
+        if not f.get("datetime_takeoff"):
+            f["_used_first_seen_for_takeoff"] = True  # Optional flag for debugging
+        if local_landing is not None:
+            f["datetime_landed_local"] = local_landing.isoformat()
+            # Optional flag for debugging
+            if not f.get("datetime_landed"):
+                f["_used_last_seen_for_landing"] = True
+        filtered.append(f)
     return {"data": filtered}, 200
 
 
@@ -442,7 +468,7 @@ def flight_tracks(username, fr24_id):
     url = "https://fr24api.flightradar24.com/api/flight-tracks"
 
     try:
-        response = requests.get(
+        response = http_client.get(
             url, headers=headers, params={"flight_id": fr24_id}, timeout=25
         )
         response.raise_for_status()
@@ -739,96 +765,19 @@ def hasUncommonTrips(username):
 
 
 def formatTrip(trip, public=False):
-    if trip["start_datetime"] not in (1, -1) and trip["end_datetime"] not in (
-        1,
-        -1,
-    ):
-        if trip["type"] in ("poi", "accommodation", "restaurant"):
-            trip["destination_station"] = ""
-        start_datetime = datetime.strptime(trip["start_datetime"], "%Y-%m-%d %H:%M:%S")
-        end_datetime = datetime.strptime(trip["end_datetime"], "%Y-%m-%d %H:%M:%S")
-        start_date = start_datetime.date()
-        end_date = end_datetime.date()
-        if start_datetime.second == 0 and end_datetime.second == 0:
-            start_time = start_datetime.strftime("%H:%M")
-            end_time = end_datetime.strftime("%H:%M")
-
-            if trip["utc_start_datetime"] is None:
-                trip_duration = [
-                    "calc",
-                    (end_datetime - start_datetime).total_seconds(),
-                ]
-            else:
-                utc_start_datetime = datetime.strptime(
-                    trip["utc_start_datetime"], "%Y-%m-%d %H:%M:%S"
-                )
-                utc_end_datetime = datetime.strptime(
-                    trip["utc_end_datetime"], "%Y-%m-%d %H:%M:%S"
-                )
-                trip_duration = [
-                    "calc",
-                    (utc_end_datetime - utc_start_datetime).total_seconds(),
-                ]
-
-            if end_date != start_date:
-                days_diff = end_date - start_date
-                end_time += "(+{})".format(days_diff.days)
-        else:
-            start_time = end_time = ""
-            if trip["manual_trip_duration"] is not None:
-                trip_duration = ["man", trip["manual_trip_duration"]]
-            elif trip["estimated_trip_duration"] is not None:
-                trip_duration = ["est", trip["estimated_trip_duration"]]
-
-        start_date = start_date.strftime("%Y-%m-%d")
-    else:
-        start_date = start_time = end_time = ""
-        if trip["manual_trip_duration"] is not None:
-            trip_duration = ["man", trip["manual_trip_duration"]]
-        elif trip["estimated_trip_duration"] is not None:
-            trip_duration = ["est", trip["estimated_trip_duration"]]
-        else:
-            start_date = start_time = end_time = ""
-            trip_duration = ["", ""]
-    trip["user_currency"] = getLoggedUserCurrency()
-    if trip.get("price") not in (None, ""):
-        trip["price_in_user_currency"] = get_exchange_rate(
-            base_currency=trip["currency"],
-            target_currency=trip["user_currency"],
-            date=trip["purchasing_date"],
-            price=trip["price"],
-        )
-
-    if trip["ticket_id"] not in (None, ""):
-        with managed_cursor(mainConn) as cursor:
-            cursor.execute(getTicket, (trip["ticket_id"],))
-            ticket = cursor.fetchall()[0]
-        trip["ticket"] = ticket["name"]
-        trip["ticket_price"] = ticket["price"] / ticket["trip_count"]
-        trip["ticket_currency"] = ticket["currency"]
-        trip["ticket_price_in_user_currency"] = get_exchange_rate(
-            price=trip["ticket_price"],
-            base_currency=trip["ticket_currency"],
-            target_currency=trip["user_currency"],
-            date=ticket["purchasing_date"],
-        )
+    return formatTrips([trip])[0]
 
-    if trip["operator"] is None or trip["operator"] == "":
-        trip["operator"] = ""
 
-    if trip["line_name"] is None or trip["line_name"] == "":
-        trip["line_name"] = ""
-
-    trip["start_date"] = start_date
-    trip["start_time"] = start_time
-    trip["end_time"] = end_time
-    trip["trip_duration"] = trip_duration
-    return trip
+def formatTrips(trips):
+    """
+    Format trip dicts for display (see src/trip_hydration.py)
+    """
+    trip_hydration.hydrate_trips(trips, getLoggedUserCurrency())
+    return trips
 
 
 def user_exists(username):
-    user = User.query.filter_by(username=username).first()
-    return user is not None
+    return get_user(username) is not None
 
 def saveManualStation(creator, name, lat, lng, station_type):
     if station_type in (
@@ -2815,81 +2764,23 @@ def countries(username, cc):
 @app.route("/u/<username>/countryGeoJSON/<cc>")
 @public_required
 def getCountryGeoJSON(username, cc):
-    def midpoint(point1, point2):
-        return ((point1[0] + point2[0]) / 2, (point1[1] + point2[1]) / 2)
-
-    def getPolygonFromCoordinates(cc, lat, lng):
-        return geopip_country.search(cc=cc, lat=lat, lng=lng)
-
     start_time = datetime.now()
-    # Prepare the parameters
-    if "-" in cc:
-        params = {"username": username, "country": "%" + cc.split("-")[0] + "%"}
-    else:
-        params = {"username": username, "country": "%" + cc + "%"}
-
+    traveled_ids = get_covered_polygons(username, cc)
+    percent = coverage_percent(cc, traveled_ids)
     with managed_cursor(mainConn) as cursor:
-        idList = [
-            row["uid"] for row in cursor.execute(getTripsCountry, params).fetchall()
-        ]
-
-    formattedGetUserLines = getUserLines.format(
-        trip_ids=", ".join(("?",) * len(idList))
-    )
-    with managed_cursor(pathConn) as cursor:
-        pathResult = cursor.execute(formattedGetUserLines, tuple(idList)).fetchall()
-
-    # Extract unique nodes
-    unique_nodes = set()
-    for path in pathResult:
-        nodes = json.loads(path[1])
-        for i in range(len(nodes) - 1):
-            start = (nodes[i][0], nodes[i][1])
-            end = (nodes[i + 1][0], nodes[i + 1][1])
-            mid = midpoint(start, end)
-            unique_nodes.add(mid)
-        unique_nodes.update((node[0], node[1]) for node in nodes)
-
-    exclude_ids = list(
-        dict.fromkeys(
-            [
-                coord["id"]
-                for lat, lng in unique_nodes
-                if (coord := getPolygonFromCoordinates(cc, lat, lng)) is not None
-            ]
+        cursor.execute(
+            upsertPercent, {"username": username, "cc": cc, "percent": percent}
         )
-    )
-
-    directory_path = "country_percent/countries/processed/"
-
-    file_path = os.path.join(directory_path, f"{cc}.geojson")
-    with open(file_path, "r") as file:
-        geojson_data = json.load(file)
-        # Initialize the total area
-        traveled_area = 0
-
-        for feature in geojson_data["features"]:
-            feature_id = feature["properties"].get("id")
-            feature_area = feature["properties"].get("area_m2", 0)
-
-            if feature_id in exclude_ids:
-                feature["properties"]["traveled"] = True
-                traveled_area += feature_area
-            else:
-                feature["properties"]["traveled"] = False
+    mainConn.commit()
 
-        # Compare total_area with the global total_area_m2
-        total_area = geojson_data["total_area_m2"]
-        percent = math.ceil(min((traveled_area / total_area) * 100, 100))
-        with managed_cursor(mainConn) as cursor:
-            cursor.execute(
-                upsertPercent, {"username": username, "cc": cc, "percent": percent}
-            )
-        mainConn.commit()
+    # The map is prebuilt with the compiled polygons, only the flags are set here
+    geojson = coverage_polygons.instance(cc).map(traveled_ids)
     end_time = datetime.now()  # End the timer
     render_time = end_time - start_time  # Calculate the difference
     print(render_time)
-    return jsonify([percent, geojson_data])
+    response = make_response(b"[%d,%s]" % (percent, geojson))
+    response.mimetype = "application/json"
+    return response
 
 
 @app.route("/admin/editCountries/<cc>")
@@ -2980,6 +2871,7 @@ def process_queue(cc):
                 # Update the GeoJSON data
                 geojson_data["features"] = remaining_features
                 geojson_data["total_area_m2"] -= total_area_to_subtract
+                delete_coverage_polygons(cc, polygon_ids)
                 
             elif operation_type == "merge":
                 if len(polygon_ids) != 2:
@@ -3089,6 +2981,9 @@ def process_queue(cc):
                 # Add merged polygon to remaining features
                 remaining_features.append(merged_polygon)
                 geojson_data["features"] = remaining_features
+                merge_coverage_polygons(
+                    cc, polygon_ids, merged_polygon["properties"]["id"]
+                )
         
         # Write the updated data back to the file
         with open(file_path, "w") as file:
@@ -3436,10 +3331,16 @@ def add_dummy_path(trip_id):
             }), 400
         
         # Insert dummy path
-        dummy_path_data = "[[0,0],[1,1]]"
+        dummy_path = Path(
+            path=[{"lat": 0, "lng": 0}, {"lat": 1, "lng": 1}], trip_id=trip_id
+        )
         path_cursor.execute(
-            "INSERT INTO paths (trip_id, path) VALUES (?, ?)",
-            (trip_id, dummy_path_data)
+            saveQuery.format(
+                table="paths",
+                keys="({})".format(", ".join(dummy_path.keys())),
+                values=", ".join(["?"] * len(dummy_path.keys())),
+            ),
+            dummy_path.values(),
         )
         pathConn.commit()
         
@@ -3666,8 +3567,8 @@ def convert_path_to_format(path, output_format):
     """
     Convert the path data to the specified format (GPX or GeoJSON).
     """
-    # Load path data from JSON
-    coordinates = json.loads(path)
+    # Decode the stored path
+    coordinates = decode_path(path)
 
     if output_format == "gpx":
         # Create the GPX root element
@@ -3731,7 +3632,10 @@ def download_path(trip_ids):
     """
     Download one or more paths in the specified format (GPX or GeoJSON) for
     the given trip_ids (comma-separated).
+
+    Paths are exported at full resolution unless ?resolution= asks otherwise.
     """
+    path_column = resolution_column(getRequestedResolution())
 
     # Determine requested format based on the path
     if request.path.startswith("/gpx"):
@@ -3771,7 +3675,9 @@ def download_path(trip_ids):
 
         # 2) Retrieve the path from the database
         with managed_cursor(pathConn) as cursor:
-            cursor.execute("SELECT path FROM paths WHERE trip_id = ?", (trip_id,))
+            cursor.execute(
+                f"SELECT {path_column} AS path FROM paths WHERE trip_id = ?", (trip_id,)
+            )
             path = cursor.fetchone()
 
         if path is None:
@@ -4195,7 +4101,7 @@ def get_trip(trip_id):
     formattedGetUserLines = getUserLines.format(trip_ids=trip_id)
     with managed_cursor(pathConn) as cursor:
         pathResult = cursor.execute(formattedGetUserLines).fetchone()
-    path = json.loads(pathResult["path"])
+    path = decode_path(pathResult["path"])
 
     return Trip(
         trip_id=trip_id,
@@ -4246,7 +4152,7 @@ def update_trip_values_from_form_data(trip_id, formData, update_created_ts=False
     if "path" in formData.keys():
         path = [[coord["lat"], coord["lng"]] for coord in json.loads(formData["path"])]
     else:
-        path = json.loads(pathResult["path"])
+        path = decode_path(pathResult["path"])
 
     limits = [
         {
@@ -4567,6 +4473,9 @@ def router_status_photon():
 
 @app.route("/api/airportAutocomplete/<searchPattern>")
 def airportAutocomplete(searchPattern):
+    airports = place_search.search_airports(searchPattern)
+    if airports is not None:
+        return jsonify(airports)
     with managed_cursor(mainConn) as cursor:
         airports = [
             dict(airport)
@@ -4580,6 +4489,9 @@ def airportAutocomplete(searchPattern):
 @app.route("/trainStationAutocomplete")
 def trainStationAutocomplete():
     searchPattern = request.args.get("q")
+    trainStations = place_search.search_train_stations(searchPattern)
+    if trainStations is not None:
+        return jsonify(trainStations)
     params = {
         "searchPatternStart": searchPattern + "%",
         "searchPatternAnywhere": "%" + searchPattern + "%",
@@ -4600,7 +4512,12 @@ def placeAutocomplete():
 
     # Append format=jsonv2 & addressdetails=1 to get JSON + address details
     full_url = f"{nominatim_url}?{args}&format=jsonv2&addressdetails=1"
-    data = requests.get(full_url, headers=headers).json()
+
+    def fetch():
+        data = http_client.get(full_url, headers=headers).json()
+        return data if isinstance(data, list) else None
+
+    data = geocoding_cache.geocode("nominatim", "/search", args, fetch) or []
 
     features = []
     # We'll track unique names to avoid duplicates
@@ -4676,17 +4593,21 @@ def stationAutocomplete():
     is_reverse = params.get("lat") and params.get("lon")
     endpoint = "/reverse" if is_reverse else "/api"
     
-    responseJson = None
-    for url in photonInstances.values():
-        try:
-            resp = requests.get(f"{url}{endpoint}?{args}&{en}", timeout=timeout)
-            resp.raise_for_status()
-            responseJson = resp.json()
-            if responseJson.get("features") is not None:
-                break
-        except Exception:
-            continue
-    
+    def fetch():
+        for url in photonInstances.values():
+            try:
+                resp = http_client.get(
+                    f"{url}{endpoint}?{args}&{en}", timeout=timeout, retries=0
+                )
+                resp.raise_for_status()
+                responseJson = resp.json()
+                if responseJson.get("features") is not None:
+                    return responseJson
+            except Exception:
+                continue
+        return None
+
+    responseJson = geocoding_cache.geocode("photon", endpoint, f"{args}&{en}", fetch)
     if responseJson is None:
         return "Photon Error", 500
     
@@ -4825,113 +4746,15 @@ def getAdminUsersData():
     order_column = int(request.form.get("order[0][column]", 1))
     order_dir = request.form.get("order[0][dir]", "asc")
 
-    # Column mapping for sorting
-    column_map = {
-        1: "username",
-        2: "lang",
-        3: "active",
-        4: "share_level",
-        5: "trips",
-        6: "length",
-        7: "trips_per_day",
-        8: "last_login",
-        9: "email",
-        10: "creation_date",
-    }
-
-    # Fetch all users (this could be optimized further with database-level pagination)
-    all_users = {user.username: user.toDict() for user in User.query.all()}
-
-    # Initialize trips and length for all users
-    for user in all_users.values():
-        user["trips"] = 0
-        user["length"] = 0
-
-    # Fetch users with trips from the main database
-    with managed_cursor(mainConn) as cursor:
-        for user_data in cursor.execute(adminStats).fetchall():
-            username = user_data["username"]
-            if username in all_users:
-                user = all_users[username]
-                user["trips"] = user_data["trips"]
-                user["length"] = user_data["length"]
-
-                if user["last_login"] is None:
-                    user["last_login"] = datetime.strptime(
-                        user_data["last_modified"], "%Y-%m-%d %H:%M:%S.%f"
-                    )
-
-    # Process users
-    users_list = []
-    for user in all_users.values():
-        # Determine if user is active
-        if (
-            user["trips"] > 0
-            and user["last_login"]
-            and user["last_login"] > datetime.now() - timedelta(days=90)
-            and user["username"] not in ["demo", "test"]
-        ):
-            user["active"] = True
-        else:
-            user["active"] = False
-
-        # Filter by active status
-        if not show_inactive and not user["active"]:
-            continue
-
-        # Calculate trips per day
-        days_since_creation = (datetime.now() - user["creation_date"]).days or 1
-        user["trips_per_day"] = round(user["trips"] / days_since_creation, 2)
-
-        # Convert datetime objects to ISO format strings for JSON serialization
-        if user.get("last_login"):
-            user["last_login"] = user["last_login"].isoformat()
-        if user.get("creation_date"):
-            user["creation_date"] = user["creation_date"].isoformat()
-
-        # Add to list
-        users_list.append(user)
-
-    # Apply search filter
-    if search_value:
-        search_lower = search_value.lower()
-        users_list = [
-            user
-            for user in users_list
-            if search_lower in user["username"].lower()
-            or search_lower in user.get("email", "").lower()
-            or search_lower in user.get("lang", "").lower()
-        ]
-
-    # Sort users
-    if order_column in column_map:
-        sort_key = column_map[order_column]
-        reverse = order_dir == "desc"
-
-        # Special handling for different data types
-        if sort_key in ["trips", "length", "trips_per_day"]:
-            users_list.sort(key=lambda x: x.get(sort_key, 0), reverse=reverse)
-        elif sort_key in ["last_login", "creation_date"]:
-            users_list.sort(
-                key=lambda x: x.get(sort_key) or datetime.min, reverse=reverse
-            )
-        elif sort_key == "active":
-            users_list.sort(key=lambda x: x.get(sort_key, False), reverse=reverse)
-        else:
-            users_list.sort(key=lambda x: x.get(sort_key, "").lower(), reverse=reverse)
-
-    # Get total count before pagination
-    total_filtered = len(users_list)
-
-    # Apply pagination
-    if length != -1:  # -1 means show all
-        users_list = users_list[start : start + length]
+    records_total, records_filtered, users_list = admin_users.get_users_page(
+        start, length, search_value, show_inactive, order_column, order_dir
+    )
 
     # Prepare response
     response = {
         "draw": draw,
-        "recordsTotal": len(all_users),
-        "recordsFiltered": total_filtered,
+        "recordsTotal": records_total,
+        "recordsFiltered": records_filtered,
         "data": users_list,
     }
 
@@ -4945,81 +4768,7 @@ def getAdminStats():
     Returns aggregated statistics without user data.
     This is called once on page load to populate the summary stats.
     """
-    # Initialize counters and dictionaries
-    active_users = 0
-    active_today = 0
-    total_trips = 0
-    total_km = 0
-    total_langs = {}
-    active_langs = {}
-
-    # Fetch all users from the auth database
-    all_users = {user.username: user.toDict() for user in User.query.all()}
-    total_users = len(all_users)
-
-    # Initialize trips and length for all users
-    for user in all_users.values():
-        user["trips"] = 0
-        user["length"] = 0
-
-    # Fetch users with trips from the main database
-    with managed_cursor(mainConn) as cursor:
-        for user_data in cursor.execute(adminStats).fetchall():
-            username = user_data["username"]
-            if username in all_users:
-                user = all_users[username]
-                user["trips"] = user_data["trips"]
-                user["length"] = user_data["length"]
-
-                if user["last_login"] is None:
-                    user["last_login"] = datetime.strptime(
-                        user_data["last_modified"], "%Y-%m-%d %H:%M:%S.%f"
-                    )
-
-                # Check if user was active today
-                if user["last_login"] > datetime.now() - timedelta(days=1):
-                    active_today += 1
-
-    # Calculate statistics
-    for user in all_users.values():
-        # Update total language count
-        if user["lang"] in total_langs:
-            total_langs[user["lang"]] += 1
-        else:
-            total_langs[user["lang"]] = 1
-
-        # Check if the user is active
-        if (
-            user["trips"] > 0
-            and user["last_login"]
-            and user["last_login"] > datetime.now() - timedelta(days=90)
-            and user["username"] not in ["demo", "test"]
-        ):
-            active_users += 1
-
-            # Update active language count
-            if user["lang"] in active_langs:
-                active_langs[user["lang"]] += 1
-            else:
-                active_langs[user["lang"]] = 1
-
-        # Update totals
-        total_trips += user["trips"]
-        total_km += user["length"]
-
-    # Prepare response data
-    response_data = {
-        "stats": {
-            "total_users": total_users,
-            "active_users": active_users,
-            "active_today": active_today,
-            "total_trips": total_trips,
-            "total_km": total_km,
-            "langs": {"total": total_langs, "active": active_langs},
-        }
-    }
-
-    return jsonify(response_data)
+    return jsonify({"stats": admin_users.get_stats()})
 
 
 @app.route("/getLeaderboardUsers/<type>", methods=["GET"])
@@ -5101,7 +4850,18 @@ def delete_user(uid):
     return ""
 
 
-def fetchTripsPaths(username, lastLocal, public):
+def getRequestedResolution(resolution=None):
+    """
+    Path resolution requested by the client ("full" or one of RESOLUTIONS)
+    """
+    if resolution is None:
+        resolution = request.args.get("resolution", "full")
+    if resolution != "full" and resolution not in RESOLUTIONS:
+        abort(400, description=f"Invalid resolution: {resolution}")
+    return resolution
+
+
+def fetchTripsPaths(username, lastLocal, public, resolution="full"):
     tripList = []
     now = datetime.now()
 
@@ -5135,8 +4895,9 @@ def fetchTripsPaths(username, lastLocal, public):
     tripIds = []
     for trip in trips:
         tripIds.append(trip["uid"])
-    formattedGetUserLines = getUserLines.format(
-        trip_ids=", ".join(("?",) * len(tripIds))
+    formattedGetUserLines = getUserLinesAtResolution.format(
+        trip_ids=", ".join(("?",) * len(tripIds)),
+        path_column=resolution_column(resolution),
     )
     with managed_cursor(pathConn) as cursor:
         pathResult = cursor.execute(formattedGetUserLines, tuple(tripIds)).fetchall()
@@ -5151,7 +4912,7 @@ def fetchTripsPaths(username, lastLocal, public):
         trip.pop("future")
 
         tripList.append(
-            {"trip": trip, "path": json.loads(paths.get(trip["uid"], "{}"))}
+            {"trip": trip, "path": decode_path(paths.get(trip["uid"]))}
         )
 
     print(datetime.now() - now)
@@ -5162,17 +4923,95 @@ def fetchTripsPaths(username, lastLocal, public):
 @app.route("/public/<username>/getTripsPaths/<lastLocal>", methods=["GET", "POST"])
 @public_required  # Public access check
 def public_getTripsPaths(username, lastLocal):
-    result = fetchTripsPaths(username, lastLocal, public=1)
+    result = fetchTripsPaths(
+        username, lastLocal, public=1, resolution=getRequestedResolution()
+    )
     return jsonify(result)
 
 
 @app.route("/u/<username>/getTripsPaths/<lastLocal>", methods=["GET", "POST"])
 @login_required  # Login access check
 def getTripsPaths(username, lastLocal):
-    result = fetchTripsPaths(username, lastLocal, public=0)
+    result = fetchTripsPaths(
+        username, lastLocal, public=0, resolution=getRequestedResolution()
+    )
     return jsonify(result)
 
 
+def fetchTripsTile(username, z, x, y, public):
+    """
+    Vector tile of the trips shown on the user's map, using the same selection
+    as fetchTripsPaths. Tiles are cached on disk until the selection changes.
+    The map pages still draw the trips from getTripsPaths.
+    """
+    if not (0 <= z <= 22 and 0 <= x < 2**z and 0 <= y < 2**z):
+        abort(404)
+
+    friend = current_user_is_friend_with(username)
+    with managed_cursor(mainConn) as cursor:
+        trips = cursor.execute(
+            getUniqueUserTrips,
+            {"username": username, "lastLocal": "all", "public": public, "friend": friend},
+        ).fetchall()
+
+    version = trips_version(trips, public, friend)
+    tile = get_cached_tile(username, version, z, x, y)
+
+    if tile is None:
+        # Only load the paths whose bounding box intersects the tile. Flights
+        # are drawn as great circles, which can leave the bounding box of their
+        # nodes, so they are always loaded.
+        min_lng, min_lat, max_lng, max_lat = tile_lnglat_bounds(z, x, y, buffer=BUFFER)
+        air_ids = [t["uid"] for t in trips if t["type"] in ("air", "helicopter")]
+        other_ids = [t["uid"] for t in trips if t["type"] not in ("air", "helicopter")]
+        path_column = resolution_column(tile_resolution(z))
+        pathResult = []
+        # one bound variable per trip, batched below the SQLite limit
+        batch_size = trip_hydration.BATCH_SIZE
+        with managed_cursor(pathConn) as cursor:
+            for i in range(0, len(air_ids), batch_size):
+                batch = air_ids[i : i + batch_size]
+                pathResult += cursor.execute(
+                    getUserLines.format(trip_ids=", ".join(("?",) * len(batch))),
+                    tuple(batch),
+                ).fetchall()
+            for i in range(0, len(other_ids), batch_size):
+                batch = other_ids[i : i + batch_size]
+                pathResult += cursor.execute(
+                    f"""
+                    SELECT trip_id, {path_column} AS path FROM paths
+                    WHERE trip_id IN ({", ".join(("?",) * len(batch))})
+                    AND (
+                        node_count IS NULL
+                        OR (max_lat >= ? AND min_lat <= ? AND max_lng >= ? AND min_lng <= ?)
+                    )
+                    """,
+                    (*batch, min_lat, max_lat, min_lng, max_lng),
+                ).fetchall()
+        paths = {path["trip_id"]: path["path"] for path in pathResult}
+
+        tile = encode_trips_tile(
+            [trip for trip in trips if trip["uid"] in paths], paths, z, x, y
+        )
+        store_cached_tile(username, version, z, x, y, tile)
+
+    response = make_response(tile)
+    response.mimetype = "application/vnd.mapbox-vector-tile"
+    return response
+
+
+@app.route("/public/<username>/trips/<int:z>/<int:x>/<int:y>.pbf")
+@public_required  # Public access check
+def public_trips_tile(username, z, x, y):
+    return fetchTripsTile(username, z, x, y, public=1)
+
+
+@app.route("/u/<username>/trips/<int:z>/<int:x>/<int:y>.pbf")
+@login_required  # Login access check
+def trips_tile(username, z, x, y):
+    return fetchTripsTile(username, z, x, y, public=0)
+
+
 @app.route("/u/<username>/getCurrentTrip", methods=["GET", "POST"])
 @login_required
 def getCurrentTripPath(username):
@@ -5203,8 +5042,8 @@ def getCurrentTripPath(username):
             {
                 "time": trip["time"],
                 "trip": dict(trip),
-                "path": json.loads(paths[trip["uid"]]),
-                "distances": getDistanceFromPath(json.loads(paths[trip["uid"]])),
+                "path": decode_path(paths[trip["uid"]]),
+                "distances": getDistanceFromPath(decode_path(paths[trip["uid"]])),
             }
         )
     sortedTripList = sorted(tripList, key=lambda d: d["trip"]["uid"], reverse=True)
@@ -5214,71 +5053,27 @@ def getCurrentTripPath(username):
     return jsonify(sortedTripList)
 
 
-def get_logo_url(operator, trip):
-    operator_id = operator["uid"]
-    utc_filtered_start_datetime = trip["utc_filtered_start_datetime"]
-    with managed_cursor(mainConn) as cursor:
-        if utc_filtered_start_datetime == -1:
-            # Fetch the oldest logo
-            logo = cursor.execute(
-                """
-                SELECT l.logo_url
-                FROM operator_logos l
-                WHERE l.operator_id = ?
-                ORDER BY l.effective_date ASC
-                LIMIT 1
-            """,
-                (operator_id,),
-            ).fetchone()
-        elif utc_filtered_start_datetime == 1:
-            # Fetch the latest logo
-            logo = cursor.execute(
-                """
-                SELECT l.logo_url
-                FROM operator_logos l
-                WHERE l.operator_id = ?
-                ORDER BY l.effective_date DESC
-                LIMIT 1
-            """,
-                (operator_id,),
-            ).fetchone()
-        else:
-            # Fetch the logo closest to the trip start date
-            logo = cursor.execute(
-                """
-                SELECT l.logo_url
-                FROM operator_logos l
-                WHERE l.operator_id = ?
-                  AND (l.effective_date <= ? OR l.effective_date IS NULL)
-                ORDER BY l.effective_date DESC
-                LIMIT 1
-            """,
-                (operator_id, utc_filtered_start_datetime),
-            ).fetchone()
-    if logo:
-        return logo["logo_url"]
-    else:
-        return None
-
-
-def processPublicTrips(tripIds):
+def processPublicTrips(tripIds, resolution="full"):
     user_currency = getLoggedUserCurrency()
-    for trip in tripIds.split(","):
-        with managed_cursor(mainConn) as cursor:
-            trip = cursor.execute(getTrip, {"trip_id": trip}).fetchone()
-        user = User.query.filter_by(username=trip["username"]).first()
+    tripIds = tripIds.split(",")
+    trips = trip_hydration.get_trips_by_id(tripIds)
+    if len(trips) != len(set(int(tripId) for tripId in tripIds)):
+        abort(404)
+
+    for username in {trip["username"] for trip in trips.values()}:
+        user = get_user(username)
         if (
             not session.get(user.username)
             and not user.is_public_trips()
             and not session.get(owner)
         ):
             abort(401)
-    tripIds = tripIds.split(",")
 
     tripList = []
 
-    formattedGetUserLines = getUserLines.format(
-        trip_ids=", ".join(("?",) * len(tripIds))
+    formattedGetUserLines = getUserLinesAtResolution.format(
+        trip_ids=", ".join(("?",) * len(tripIds)),
+        path_column=resolution_column(resolution),
     )
     with managed_cursor(pathConn) as cursor:
         pathResult = cursor.execute(formattedGetUserLines, tuple(tripIds)).fetchall()
@@ -5286,93 +5081,31 @@ def processPublicTrips(tripIds):
     for path in pathResult:
         paths[path["trip_id"]] = path["path"]
 
+    trips = [trips[int(tripId)] for tripId in tripIds]
+    trip_hydration.hydrate_trips(
+        trips, user_currency, multi_operators=True, carbon=True
+    )
+
     total_price = 0
     total_carbon = 0
     total_distance = 0
-    
-    for tripId in tripIds:
-        with managed_cursor(mainConn) as cursor:
-            trip = formatTrip(
-                dict(cursor.execute(getTrip, {"trip_id": tripId}).fetchone())
-            )
-
-        # Process multi operator logos
-        if "," in str(trip["operator"]):
-            operator_names = trip["operator"]
-            operator_list = [op.strip() for op in operator_names.split(",")]
-
-            operator_logos = []
-            for op_name in operator_list:
-                with managed_cursor(mainConn) as cursor:
-                    operator = cursor.execute(
-                        "SELECT * FROM operators WHERE short_name = ?", (op_name,)
-                    ).fetchone()
-                if operator:
-                    operator = dict(operator)
-                    logo_url = get_logo_url(operator, trip)
-                    operator_logos.append(
-                        {"operator_name": operator["short_name"], "logo_url": logo_url}
-                    )
-
-            trip["multi_operators"] = operator_logos
 
-            # Remove operator_name and logo_url from trip if they exist
-            trip.pop("operator_name", None)
-            trip.pop("logo_url", None)
-
-        # Process pricing
-        if trip["ticket_id"] not in (None, ""):
-            with managed_cursor(mainConn) as cursor:
-                cursor.execute(getTicket, (trip["ticket_id"],))
-                ticket = cursor.fetchall()[0]
-            trip["ticket"] = ticket["name"]
-            trip["ticket_price"] = ticket["price"] / ticket["trip_count"]
-            trip["ticket_currency"] = ticket["currency"]
-            trip["ticket_price_in_user_currency"] = get_exchange_rate(
-                price=trip["ticket_price"],
-                base_currency=trip["ticket_currency"],
-                target_currency=user_currency,
-                date=ticket["purchasing_date"],
-            )
-            if trip["ticket_price_in_user_currency"] is not None:
-                total_price += trip["ticket_price_in_user_currency"]
-
-        if trip["price"] not in (None, ""):
-            trip["price_in_user_currency"] = get_exchange_rate(
-                price=trip["price"],
-                base_currency=trip["currency"],
-                target_currency=user_currency,
-                date=trip["purchasing_date"],
-            )
-            trip["user_currency"] = user_currency
-            if trip["price_in_user_currency"] is not None:
-                total_price += trip["price_in_user_currency"]
-
-        # Calculate carbon footprint
-        path_data = json.loads(paths[trip["uid"]]) if trip["uid"] in paths else []
-        trip_carbon = calculate_carbon_footprint_for_trip(trip, path_data)
-        trip["carbon_footprint"] = round(trip_carbon, 6)
-        
-        # Add to totals
-        total_carbon += trip_carbon
+    for trip in trips:
+        for key in ("price_in_user_currency", "ticket_price_in_user_currency"):
+            if trip.get(key) is not None:
+                total_price += trip[key]
+        total_carbon += trip["carbon_footprint"]
         if trip.get('trip_length', 0) > 0:
             total_distance += trip['trip_length'] / 1000  # Convert to km
 
-        user = User.query.filter_by(username=trip["username"]).first()
-        if (
-            not session.get(user.username)
-            and not user.is_public_trips()
-            and not session.get(owner)
-        ):
-            abort(401)
         tripList.append(
             {
                 "time": trip["time"],
-                "trip": dict(trip),
-                "path": path_data,
+                "trip": trip,
+                "path": decode_path(paths.get(trip["uid"])),
             }
         )
-    
+
     sortedTripList = sorted(tripList, key=lambda d: d["trip"]["uid"], reverse=True)
     sortedTripList = sorted(
         sortedTripList,
@@ -5394,7 +5127,8 @@ def processPublicTrips(tripIds):
 def getPublicTrips():
     data = request.get_json()
     tripIds = data.get("tripIds")
-    sortedTripList, priceDict = processPublicTrips(tripIds)
+    resolution = getRequestedResolution(data.get("resolution", "full"))
+    sortedTripList, priceDict = processPublicTrips(tripIds, resolution)
     for trip in sortedTripList:
         trip["trip"].pop("username")
     return jsonify([sortedTripList, priceDict])
@@ -5573,7 +5307,7 @@ def getMultiTrips(tripIds):
     userList = set()
     anonymous = {}
     for trip in sortedTripList:
-        user = User.query.filter_by(username=trip["trip"]["username"]).first()
+        user = get_user(trip["trip"]["username"])
         if (
             not session.get(user.username)
             and not user.is_public()
@@ -5599,12 +5333,11 @@ def getTrips(username, projects):
     if projects:
         trips.reverse()
     for trip in trips:
-        trip = dict(trip)
-        trip = formatTrip(trip)
         if (projects and (trip["future"] == 1 or trip["plannedFuture"] == 1)) or (
             not projects and trip["past"] == 1
         ):
-            tripList.append(trip)
+            tripList.append(dict(trip))
+    formatTrips(tripList)
 
     return json.dumps(tripList)
 
@@ -5660,8 +5393,10 @@ def get_trips_api_internal(username, is_public=False):
 
     # Build additional WHERE conditions for column-specific searches
     additional_conditions = []
-    search_params = {"username": username, "past": past, "search": f"%{search_value}%"}
-    
+    search_params = {"username": username, "past": past}
+    # Partial searches of the text columns, answered by the full-text index
+    indexed_searches = {}
+
     # Add column-specific search conditions
     for column_index, search_data in column_searches.items():
         if column_index < len(column_names):
@@ -5670,6 +5405,14 @@ def get_trips_api_internal(username, is_public=False):
             search_term = search_data["value"]
             is_exact = search_data["exact"]
 
+            if not is_exact:
+                if search_term == "":
+                    # matches every trip
+                    continue
+                if column_name in trip_search.TABLE_COLUMNS:
+                    indexed_searches[trip_search.TABLE_COLUMNS[column_name]] = search_term
+                    continue
+
             # Choose LIKE pattern based on exact/partial matching
             if is_exact:
                 search_pattern = search_term  # Exact match
@@ -5678,127 +5421,139 @@ def get_trips_api_internal(username, is_public=False):
 
             # Map frontend column names to actual query column names in FilteredTrips
             if column_name == "type":
-                if is_exact:
-                    additional_conditions.append(f"LOWER(type) = LOWER(:{param_name})")
-                else:
-                    additional_conditions.append(f"remove_diacritics(LOWER(type)) LIKE remove_diacritics(LOWER(:{param_name}))")
+                additional_conditions.append(f"LOWER(type) = LOWER(:{param_name})")
             elif column_name == "origin_station":
-                if is_exact:
-                    additional_conditions.append(f"LOWER(origin_station) = LOWER(:{param_name})")
-                else:
-                    additional_conditions.append(f"remove_diacritics(LOWER(origin_station)) LIKE remove_diacritics(LOWER(:{param_name}))")
+                additional_conditions.append(f"LOWER(origin_station) = LOWER(:{param_name})")
             elif column_name == "destination_station":
-                if is_exact:
-                    additional_conditions.append(f"LOWER(destination_station) = LOWER(:{param_name})")
-                else:
-                    additional_conditions.append(f"remove_diacritics(LOWER(destination_station)) LIKE remove_diacritics(LOWER(:{param_name}))")
+                additional_conditions.append(f"LOWER(destination_station) = LOWER(:{param_name})")
             elif column_name == "start_datetime":
                 if is_exact:
                     additional_conditions.append(f"COALESCE(DATE(start_datetime), '') = :{param_name}")
                 else:
                     additional_conditions.append(f"COALESCE(DATE(start_datetime), '') LIKE :{param_name}")
             elif column_name == "operator":
-                if is_exact:
-                    additional_conditions.append(f"LOWER(COALESCE(operator, '')) = LOWER(:{param_name})")
-                else:
-                    additional_conditions.append(f"remove_diacritics(LOWER(COALESCE(operator, ''))) LIKE remove_diacritics(LOWER(:{param_name}))")
+                additional_conditions.append(f"LOWER(COALESCE(operator, '')) = LOWER(:{param_name})")
             elif column_name == "line_name":
-                if is_exact:
-                    additional_conditions.append(f"LOWER(COALESCE(line_name, '')) = LOWER(:{param_name})")
-                else:
-                    additional_conditions.append(f"remove_diacritics(LOWER(COALESCE(line_name, ''))) LIKE remove_diacritics(LOWER(:{param_name}))")
+                additional_conditions.append(f"LOWER(COALESCE(line_name, '')) = LOWER(:{param_name})")
             elif column_name == "countries":
-                if is_exact:
-                    additional_conditions.append(f"LOWER(countries) = LOWER(:{param_name})")
-                else:
-                    additional_conditions.append(f"remove_diacritics(LOWER(countries)) LIKE remove_diacritics(LOWER(:{param_name}))")
+                additional_conditions.append(f"LOWER(countries) = LOWER(:{param_name})")
             elif column_name == "visibility":
-                if is_exact and search_term == "":
+                if search_term == "":
                     additional_conditions.append(f"visibility IS NULL")
-                elif is_exact:
-                    additional_conditions.append(f"LOWER(visibility) = LOWER(:{param_name})")
                 else:
-                    additional_conditions.append(f"remove_diacritics(LOWER(visibility)) LIKE remove_diacritics(LOWER(:{param_name}))")
+                    additional_conditions.append(f"LOWER(visibility) = LOWER(:{param_name})")
             elif column_name == "material_type":
-                if is_exact:
-                    additional_conditions.append(f"(LOWER(COALESCE(material_type, '')) = LOWER(:{param_name}) OR LOWER(iata) = LOWER(:{param_name}) OR LOWER(manufacturer) = LOWER(:{param_name}) OR LOWER(model) = LOWER(:{param_name}))")
-                else:
-                    additional_conditions.append(f"(remove_diacritics(LOWER(COALESCE(material_type, ''))) LIKE remove_diacritics(LOWER(:{param_name})) OR remove_diacritics(LOWER(iata)) LIKE remove_diacritics(LOWER(:{param_name})) OR remove_diacritics(LOWER(manufacturer)) LIKE remove_diacritics(LOWER(:{param_name})) OR remove_diacritics(LOWER(model)) LIKE remove_diacritics(LOWER(:{param_name})))")
+                additional_conditions.append(f"(LOWER(COALESCE(material_type, '')) = LOWER(:{param_name}) OR LOWER(iata) = LOWER(:{param_name}) OR LOWER(manufacturer) = LOWER(:{param_name}) OR LOWER(model) = LOWER(:{param_name}))")
             elif column_name == "reg":
-                if is_exact:
-                    additional_conditions.append(f"LOWER(COALESCE(reg, '')) = LOWER(:{param_name})")
-                else:
-                    additional_conditions.append(f"remove_diacritics(LOWER(COALESCE(reg, ''))) LIKE remove_diacritics(LOWER(:{param_name}))")
+                additional_conditions.append(f"LOWER(COALESCE(reg, '')) = LOWER(:{param_name})")
             elif column_name == "notes":
-                if is_exact:
-                    additional_conditions.append(f"LOWER(COALESCE(notes, '')) = LOWER(:{param_name})")
-                else:
-                    additional_conditions.append(f"remove_diacritics(LOWER(COALESCE(notes, ''))) LIKE remove_diacritics(LOWER(:{param_name}))")
+                additional_conditions.append(f"LOWER(COALESCE(notes, '')) = LOWER(:{param_name})")
             else:
-                # Fallback for other columns
+                # Fallback for other columns (times, durations, numbers...)
                 if is_exact:
                     additional_conditions.append(f"LOWER(COALESCE({column_name}, '')) = LOWER(:{param_name})")
                 else:
-                    additional_conditions.append(f"remove_diacritics(LOWER(COALESCE({column_name}, ''))) LIKE remove_diacritics(LOWER(:{param_name}))")
+                    additional_conditions.append(f"COALESCE({column_name}, '') LIKE :{param_name}")
             
             search_params[param_name] = search_pattern
 
-    # Build the queries
-    base_count_query = getDynamicUserTrips + "SELECT COUNT(*) FROM FilteredTrips"
-    base_data_query = getDynamicUserTrips + "SELECT * FROM FilteredTrips"
-    
+    trip_search.refresh(username)
+    search_condition = trip_search.search_condition(
+        search_value, indexed_searches, search_params
+    )
+    userTrips = getDynamicUserTrips.format(search_condition=search_condition or "1")
+
+    # Ensure the sort direction is safe
+    if sort_direction not in ["asc", "desc"]:
+        sort_direction = "asc"
+    sort_keys = trip_pages.sort_keys(sort_column_name)
+
     # Add type filtering if needed
+    conditions = []
     if is_public and is_friend:
-        base_count_query += " WHERE visibility = 'public' OR visibility = 'friends' OR (visibility IS NULL AND type IN ('train', 'bus', 'air', 'ferry', 'helicopter', 'aerialway', 'tram', 'metro'))"
-        base_data_query += " WHERE visibility = 'public' OR visibility = 'friends' OR (visibility IS NULL AND type IN ('train', 'bus', 'air', 'ferry', 'helicopter', 'aerialway', 'tram', 'metro'))"
-
-        # Add column-specific conditions
-        if additional_conditions:
-            base_count_query += " AND " + " AND ".join(additional_conditions)
-            base_data_query += " AND " + " AND ".join(additional_conditions)
+        conditions.append("visibility = 'public' OR visibility = 'friends' OR (visibility IS NULL AND type IN ('train', 'bus', 'air', 'ferry', 'helicopter', 'aerialway', 'tram', 'metro'))")
     elif is_public:
-        base_count_query += " WHERE visibility = 'public' OR (visibility IS NULL AND type IN ('train', 'bus', 'air', 'ferry', 'helicopter', 'aerialway', 'tram', 'metro'))"
-        base_data_query += " WHERE visibility = 'public' OR (visibility IS NULL AND type IN ('train', 'bus', 'air', 'ferry', 'helicopter', 'aerialway', 'tram', 'metro'))"
-        
-        # Add column-specific conditions
-        if additional_conditions:
-            base_count_query += " AND " + " AND ".join(additional_conditions)
-            base_data_query += " AND " + " AND ".join(additional_conditions)
-    else:
-        # Add column-specific conditions
-        if additional_conditions:
-            base_count_query += " WHERE " + " AND ".join(additional_conditions)
-            base_data_query += " WHERE " + " AND ".join(additional_conditions)
+        conditions.append("visibility = 'public' OR (visibility IS NULL AND type IN ('train', 'bus', 'air', 'ferry', 'helicopter', 'aerialway', 'tram', 'metro'))")
+    # Add column-specific conditions
+    conditions += additional_conditions
 
-    count_query = base_count_query
-    
-    # Add sorting to data query
-    if sort_column_name != "start_datetime":
-        data_query = base_data_query + f" ORDER BY {sort_column_name} {sort_direction} LIMIT :limit OFFSET :offset"
-    else:
-        data_query = base_data_query + f" ORDER BY utc_filtered_start_datetime = 1 {sort_direction}, utc_filtered_start_datetime {sort_direction}, uid {sort_direction} LIMIT :limit OFFSET :offset"
+    def where(conditions):
+        if not conditions:
+            return ""
+        return " WHERE " + " AND ".join(f"({condition})" for condition in conditions)
 
-    mainConn.create_function("remove_diacritics", 1, remove_diacritics)
+    with managed_cursor(mainConn) as cursor:
+        listing = trip_pages.signature(
+            username,
+            is_public,
+            is_friend,
+            past,
+            search_value,
+            column_searches,
+            trip_pages.fingerprint(cursor, username),
+        )
+        count_key = f"trips_count:{listing}"
+        cursor_key = f"trips_cursor:{listing}:{sort_column_name}:{sort_direction}"
+        records_filtered = cache.get(count_key)
 
-    # Ensure the sort direction is safe
-    if sort_direction not in ["asc", "desc"]:
-        sort_direction = "asc"
+        # Seek from the given cursor, or the one of the page ending at start
+        page_cursor = request.form.get("cursor") or (
+            cache.get(f"{cursor_key}:{start}") if start > 0 else None
+        )
+        seek_values = (
+            trip_pages.decode_cursor(page_cursor, sort_keys) if page_cursor else None
+        )
+        page_conditions = list(conditions)
+        if seek_values is not None:
+            page_conditions.append(
+                trip_pages.seek_condition(
+                    sort_keys, sort_direction, seek_values, search_params
+                )
+            )
 
-    with managed_cursor(mainConn) as cursor:
-        # Fetch filtered count
-        cursor.execute(count_query, search_params)
-        records_filtered = cursor.fetchone()[0]
+        select = f"*, {trip_pages.sort_columns(sort_keys)}"
+        if records_filtered is None and seek_values is None:
+            # count the matching trips in the same pass
+            select += ", COUNT(*) OVER () AS _total"
+
+        data_query = (
+            userTrips
+            + f"SELECT {select} FROM FilteredTrips"
+            + where(page_conditions)
+            + f" {trip_pages.order_by(sort_keys, sort_direction)} LIMIT :limit OFFSET :offset"
+        )
 
         # Fetch the actual page data
         search_params.update({
             "limit": length,
-            "offset": start
+            "offset": start if seek_values is None else 0
         })
         cursor.execute(data_query, search_params)
         trips = cursor.fetchall()
 
+        if records_filtered is None:
+            if trips and seek_values is None:
+                records_filtered = trips[0]["_total"]
+            else:
+                cursor.execute(
+                    userTrips + "SELECT COUNT(*) FROM FilteredTrips" + where(conditions),
+                    search_params,
+                )
+                records_filtered = cursor.fetchone()[0]
+            cache.set(count_key, records_filtered, timeout=trip_pages.TIMEOUT)
+
+    next_cursor = None
+    if trips and len(trips) == length:
+        next_cursor = trip_pages.encode_cursor(trips[-1], sort_keys)
+        cache.set(
+            f"{cursor_key}:{start + len(trips)}", next_cursor, timeout=trip_pages.TIMEOUT
+        )
+
     # Convert trips to list of dictionaries
-    trip_dicts = [dict(trip) for trip in trips]
+    trip_dicts = [
+        {key: value for key, value in dict(trip).items() if not key.startswith("_")}
+        for trip in trips
+    ]
 
     air_trip_uids = [
         trip["uid"] for trip in trip_dicts if trip["type"] in ("air", "helicopter")
@@ -5808,13 +5563,19 @@ def get_trips_api_internal(username, is_public=False):
     if air_trip_uids:
         with managed_cursor(pathConn) as path_cursor:
             path_cursor.execute(
-                f"SELECT trip_id, json_extract(path, '$') as path_json FROM paths WHERE trip_id IN ({','.join(['?'] * len(air_trip_uids))})",
+                f"SELECT trip_id, node_count FROM paths WHERE trip_id IN ({','.join(['?'] * len(air_trip_uids))})",
                 air_trip_uids,
             )
             path_data = path_cursor.fetchall()
             for row in path_data:
-                path_nodes = json.loads(row["path_json"]) if row["path_json"] else []
-                direct_flight_map[row["trip_id"]] = len(path_nodes) == 2
+                node_count = row["node_count"]
+                if node_count is None:
+                    # Summary not computed yet for this path
+                    path_cursor.execute(
+                        "SELECT path FROM paths WHERE trip_id = ?", (row["trip_id"],)
+                    )
+                    node_count = len(decode_path(path_cursor.fetchone()["path"]))
+                direct_flight_map[row["trip_id"]] = node_count == 2
 
     # Add is_geodesic flag to each trip
     for trip in trip_dicts:
@@ -5829,7 +5590,7 @@ def get_trips_api_internal(username, is_public=False):
             trip.pop("price", None)
 
     # Format trips for display
-    trip_list = [formatTrip(trip) for trip in trip_dicts]
+    trip_list = formatTrips(trip_dicts)
 
     # Return the JSON for DataTables
     return jsonify(
@@ -5838,6 +5599,7 @@ def get_trips_api_internal(username, is_public=False):
             "recordsTotal": records_filtered,
             "recordsFiltered": records_filtered,
             "data": trip_list,
+            "cursor": next_cursor,
         }
     )
 
@@ -6085,7 +5847,7 @@ def edit_copy_trip(username, tripId, edit_copy_type):
     with managed_cursor(mainConn) as cursor:
         trip = cursor.execute(getTrip, {"trip_id": tripId}).fetchone()
     with managed_cursor(pathConn) as cursor:
-        path = json.loads(
+        path = decode_path(
             list(cursor.execute(formattedGetUserLines, (tripId,)).fetchone())[1]
         )
     user = User.query.filter_by(username=trip["username"]).first()
@@ -6239,7 +6001,7 @@ def export(username):
             )
             rowP = list(row.values())
 
-            rowP.append(polyline.encode(json.loads(paths[row["uid"]])))
+            rowP.append(polyline.encode(decode_path(paths[row["uid"]])))
             processedRows.append(rowP)
         cw.writerows(processedRows)
         response = make_response(si.getvalue())
@@ -7083,6 +6845,7 @@ def editStation(id):
             with managed_cursor(mainConn) as cursor:
                 cursor.execute("DELETE FROM train_stations WHERE id=?", (id,))
             mainConn.commit()
+            place_search.reindex_train_station(id)
             return redirect(url_for("stations"))
         else:
             # Update the station details
@@ -7106,6 +6869,7 @@ def editStation(id):
                     ),
                 )
             mainConn.commit()
+            place_search.reindex_train_station(id)
             return redirect(url_for("stations"))
     else:
         # Fetch the station details
@@ -8167,102 +7931,9 @@ def active_users():
 
 
 def generate_visited_squares_geojson(username):
-    land_squares = set()
-    air_squares = set()
-    visited_squares = {}
-    current_utc_datetime = datetime.now()
-
-    with managed_cursor(mainConn) as cursor:
-        cursor.execute(
-            """
-                SELECT uid, type
-                FROM trip
-                WHERE username = ?
-                AND start_datetime NOT IN (1)
-                AND (
-                    CASE
-                        WHEN utc_start_datetime IS NOT NULL THEN utc_start_datetime
-                        ELSE start_datetime
-                    END
-                ) < ?
-            """,
-            (username, current_utc_datetime),
-        )
-        trips = cursor.fetchall()
-
-        for trip in trips:
-            trip_id = trip["uid"]
-            trip_type = trip["type"]
-
-            with managed_cursor(pathConn) as cursor:
-                cursor.execute("SELECT path FROM paths WHERE trip_id = ?", (trip_id,))
-                paths = cursor.fetchall()
-
-            for path in paths:
-                coordinates = json.loads(path["path"])
-
-                for i in range(len(coordinates)):
-                    lat, lon = coordinates[i]
-                    square = (math.floor(lat), math.floor(lon))
-
-                    if trip_type in ("air", "helicopter"):
-                        if (
-                            visited_squares.get(square) not in ("stopped", "passed")
-                            and square not in land_squares
-                        ):
-                            visited_squares[square] = "air"
-                            air_squares.add(square)
-                    else:
-                        if visited_squares.get(square) != "stopped":
-                            visited_squares[square] = "passed"
-                        land_squares.add(square)
-                        air_squares.discard(square)
-
-                    # Override with "stopped" on first/last point
-                    if i == 0 or i == len(coordinates) - 1:
-                        visited_squares[square] = "stopped"
-                        land_squares.add(square)
-                        air_squares.discard(square)
-
-                    # Interpolate between points (only for air trips)
-                    if (
-                        trip_type in ("air", "helicopter")
-                        and len(coordinates) > 2
-                        and i < len(coordinates) - 1
-                    ):
-                        next_lat, next_lon = coordinates[i + 1]
-                        intermediates = interpolate_great_circle(
-                            (lat, lon), (next_lat, next_lon), max_distance_km=50
-                        )
-
-                        for inter_lat, inter_lon in intermediates:
-                            inter_square = (
-                                math.floor(inter_lat),
-                                math.floor(inter_lon),
-                            )
-
-                            if (
-                                visited_squares.get(inter_square)
-                                not in ("stopped", "passed")
-                                and inter_square not in land_squares
-                            ):
-                                visited_squares[inter_square] = "air"
-                                air_squares.add(inter_square)
-
-    total_squares = 180 * 360  # entire world grid
-    land_percentage = (len(land_squares) / total_squares) * 100
-    air_percentage = (len(air_squares) / total_squares) * 100
-
-    with managed_cursor(mainConn) as cursor:
-        cursor.execute(
-            upsertPercent,
-            {
-                "username": username,
-                "cc": "world_squares",
-                "percent": round(land_percentage, 2),
-            },
-        )
-    mainConn.commit()
+    visited_squares = get_visited_squares(username)
+    land_percentage, air_percentage = squares_percentages(visited_squares)
+    update_world_squares_percent(username, land_percentage)
 
     features = []
     for square, status in visited_squares.items():
@@ -8292,47 +7963,21 @@ def generate_visited_squares_geojson(username):
 @app.route("/tile/<style>/<x>/<y>/<z>/")
 @app.route("/tile/<style>/<x>/<y>/<z>/<r>")
 def tiles(style, x, y, z, r="@1x"):
-    # Create a unique cache key based on the request parameters
-    cache_key = f"{style}_{x}_{y}_{z}_{r}"
-
-    # Try to get the response from cache
-    cached_response = cache.get(cache_key)
-    if cached_response:
-        return cached_response, 200, {"Content-Type": "image/png"}
-
-    config = load_config()
-    jawg_key = config.get("jawg", {}).get("api_key", "")
-    thunderforest_key = config.get("thunderforest", {}).get("api_key", "")
-
-    # Build URLs with keys (may be empty, which is fine)
-    jawg_url = (
-        f"https://tile.jawg.io/{style}/{z}/{x}/{y}{r}.png?access-token={jawg_key}"
-    )
-    thunderforest_url = f"https://tile.thunderforest.com/transport/{z}/{x}/{y}.png?apikey={thunderforest_key}"
-
-    style_map = {
-        "jawg-streets": jawg_url,
-        "jawg-lagoon": jawg_url,
-        "jawg-sunny": jawg_url,
-        "jawg-light": jawg_url,
-        "jawg-terrain": jawg_url,
-        "jawg-dark": jawg_url,
-        "thunderforest-transport": thunderforest_url,
-    }
-
     # Fallback for unknown style
-    api_url = style_map.get(style)
-    if not api_url:
+    if style not in tile_store.STYLES:
         return "Unknown style", 400
 
-    # Fetch from external API
-    response = requests.get(api_url)
+    try:
+        z, x, y = int(z), int(x), int(y)
+    except ValueError:
+        return f"Tile not found for style {style}", 404
+    if not tile_store.valid_tile(z, x, y):
+        return f"Tile not found for style {style}", 404
 
-    if response.status_code == 200:
-        cache.set(cache_key, response.content)
-        return response.content, 200, {"Content-Type": "image/png"}
-    else:
+    tile = tile_store.instance().get_tile(style, z, x, y, r)
+    if tile is None:
         return f"Tile not found for style {style}", 404
+    return tile, 200, {"Content-Type": "image/png"}
 
 
 @app.route("/flag_sprite.png")
@@ -8725,18 +8370,24 @@ def get_bounds(username):
         timeout = 10
         en = "lang=en"
         
-        responseJson = None
-        for url in photonInstances.values():
-            try:
-                resp = requests.get(f"{url}/reverse?{args}&{en}", timeout=timeout)
-                resp.raise_for_status()
-                responseJson = resp.json()
-                if responseJson.get("features") is not None:
-                    break
-            except Exception:
-                continue
-        
-        if responseJson is not None and responseJson["features"] is not None:
+        def fetch():
+            for url in photonInstances.values():
+                try:
+                    resp = http_client.get(
+                        f"{url}/reverse?{args}&{en}", timeout=timeout, retries=0
+                    )
+                    resp.raise_for_status()
+                    responseJson = resp.json()
+                    if responseJson.get("features") is not None:
+                        return responseJson
+                except Exception:
+                    continue
+            return None
+
+        responseJson = geocoding_cache.geocode(
+            "photon", "/reverse", f"{args}&{en}", fetch
+        )
+        if responseJson is not None:
             properties = {}
             if responseJson["features"] != []:
                 properties = responseJson["features"][0]["properties"]
@@ -8810,49 +8461,64 @@ def get_bounds(username):
         return jsonify({"error": "No trips found for this user"}), 404
 
     with managed_cursor(pathConn) as path_cursor:
-        # Fetch all paths associated with the user's trips using IN
+        # Fetch the geometry summary of the user's trips using IN
         path_cursor.execute(
-            f"SELECT trip_id, path FROM paths WHERE trip_id IN ({','.join(['?'] * len(trip_ids_with_type))})",
+            f"""
+            SELECT trip_id, node_count, min_lat, max_lat, min_lng, max_lng,
+                first_lat, first_lng, last_lat, last_lng
+            FROM paths
+            WHERE trip_id IN ({','.join(['?'] * len(trip_ids_with_type))})
+            """,
             [trip_id for trip_id in trip_ids_with_type.keys()],
         )
-        paths = path_cursor.fetchall()
+        summaries = [dict(row) for row in path_cursor.fetchall()]
 
-    if not paths:
+    if not summaries:
         return jsonify({"error": "No paths found for this user's trips"}), 404
 
-    # Process each path to update the boundary values
-    for trip_id, path_row in paths:
-        path = json.loads(path_row)  # path is a list of lists with coordinates
-        if trip_ids_with_type[trip_id] == "air":
-            path = [path[0], path[-1]]  # Only consider start and end points for flights
+    def load_path(trip_id):
+        with managed_cursor(pathConn) as path_cursor:
+            path_cursor.execute("SELECT path FROM paths WHERE trip_id = ?", (trip_id,))
+            return decode_path(path_cursor.fetchone()["path"])
+
+    # (axis, sign): the extreme of a direction is the point maximizing sign * coord[axis]
+    directions = {"north": (0, 1), "west": (1, -1), "south": (0, -1), "east": (1, 1)}
+    bbox_columns = {"north": "max_lat", "west": "min_lng", "south": "min_lat", "east": "max_lng"}
+
+    # Process each summary to update the boundary values. Flights only consider
+    # their start and end points, other trips use their bounding box and the
+    # exact coordinates are looked up afterwards for the winning trips only.
+    for summary in summaries:
+        trip_id = summary["trip_id"]
+        if summary["node_count"] is None:
+            # Summary not computed yet for this path
+            summary.update(path_summary(load_path(trip_id)))
+        if not summary["node_count"]:
+            continue
 
-        for coord in path:
-            lat, lon = coord
-            # Update bounds with coordinates, place information, and trip_id
-            if (
-                bounds["north"]["coordinates"] is None
-                or lat > bounds["north"]["coordinates"][0]
-            ):
-                bounds["north"]["coordinates"] = (lat, lon)
-                bounds["north"]["trip_id"] = trip_id
-            if (
-                bounds["west"]["coordinates"] is None
-                or lon < bounds["west"]["coordinates"][1]
-            ):
-                bounds["west"]["coordinates"] = (lat, lon)
-                bounds["west"]["trip_id"] = trip_id
-            if (
-                bounds["south"]["coordinates"] is None
-                or lat < bounds["south"]["coordinates"][0]
-            ):
-                bounds["south"]["coordinates"] = (lat, lon)
-                bounds["south"]["trip_id"] = trip_id
-            if (
-                bounds["east"]["coordinates"] is None
-                or lon > bounds["east"]["coordinates"][1]
-            ):
-                bounds["east"]["coordinates"] = (lat, lon)
-                bounds["east"]["trip_id"] = trip_id
+        is_air = trip_ids_with_type[trip_id] == "air"
+        for direction, (axis, sign) in directions.items():
+            if is_air:
+                candidates = [
+                    (summary["first_lat"], summary["first_lng"]),
+                    (summary["last_lat"], summary["last_lng"]),
+                ]
+                coords = max(candidates, key=lambda c: sign * c[axis])
+                value = coords[axis]
+            else:
+                coords = None
+                value = summary[bbox_columns[direction]]
+
+            current = bounds[direction]
+            if current["trip_id"] is None or sign * value > sign * current["value"]:
+                current.update(coordinates=coords, trip_id=trip_id, value=value)
+
+    for direction, (axis, sign) in directions.items():
+        current = bounds[direction]
+        current.pop("value", None)
+        if current["trip_id"] is not None and current["coordinates"] is None:
+            path = load_path(current["trip_id"])
+            current["coordinates"] = tuple(max(path, key=lambda c: sign * c[axis]))
 
     # Fetch place names for each boundary using the stored coordinates
     for direction in bounds:
@@ -8954,7 +8620,7 @@ def get_current_trips_data(public_only=True):
     
     result = []
     for trip in filtered_trips:
-        path = json.loads(paths.get(trip["uid"], "[]"))
+        path = decode_path(paths.get(trip["uid"]))
         result.append(
             {
                 "username": trip["username"],
@@ -9124,8 +8790,8 @@ with app.app_context():
         create_authDb()
     init_main(DbNames.MAIN_DB.value)
     init_data(DbNames.MAIN_DB.value)
+    place_search.build_indexes()
     authDb.create_all()
-with managed_cursor(pathConn) as cursor:
-    cursor.execute(initPath)
+init_path(DbNames.PATH_DB.value)
 
 setup_db()
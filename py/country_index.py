@@ -0,0 +1,133 @@
+"""
+Batch country lookups over static/data/countries-filtered.geojson
+
+The polygons are loaded once per process into a shapely STRtree, so whole paths
+can be classified with a single vectorized query instead of one point-in-polygon
+search per node.
+"""
+
+import json
+
+import numpy as np
+import shapely
+from geopip._geo_fkt import bbox_hash
+from shapely.geometry import shape
+
+COUNTRIES_FILE = "static/data/countries-filtered.geojson"
+
+_INSTANCE = None
+
+
+def geopip_rank(bounds):
+    """
+    Rank of each geometry when several contain a point, lowest first, as in
+    geopip: geometries are searched from the finest geohash covering their
+    bbox (so smaller ones first), then in the order of the file
+
+    bounds are the (min lng, min lat, max lng, max lat) of the geometries.
+    """
+    depths = np.array([len(bbox_hash(tuple(bbox))) for bbox in bounds])
+    ranks = np.empty(len(depths), dtype=np.int64)
+    ranks[np.lexsort((np.arange(len(depths)), -depths))] = np.arange(len(depths))
+    return ranks
+
+
+class CountryIndex:
+    def __init__(self, filename=COUNTRIES_FILE):
+        with open(filename, "r", encoding="utf-8") as f:
+            features = json.load(f)["features"]
+
+        self.properties = [feature["properties"] for feature in features]
+        self.codes = np.array(
+            [properties.get("countryCode", "UN") for properties in self.properties],
+            dtype=object,
+        )
+        self.geometries = np.array([shape(feature["geometry"]) for feature in features])
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.rank = geopip_rank(shapely.bounds(self.geometries))
+
+    def lookup(self, lats, lngs):
+        """
+        Index of the feature containing each point, -1 if none does.
+
+        When features overlap, the one geopip would return wins (see
+        geopip_rank).
+        """
+        points = shapely.points(
+            np.asarray(lngs, dtype=float), np.asarray(lats, dtype=float)
+        )
+        result = np.full(len(points), -1, dtype=np.int64)
+        if len(points) == 0:
+            return result
+
+        point_idx, feature_idx = self.tree.query(points, predicate="intersects")
+        if len(point_idx):
+            # keep the best ranked feature for each point
+            order = np.lexsort((self.rank[feature_idx], point_idx))
+            point_idx, feature_idx = point_idx[order], feature_idx[order]
+            first = np.unique(point_idx, return_index=True)[1]
+            result[point_idx[first]] = feature_idx[first]
+        return result
+
+    def lookup_codes(self, lats, lngs):
+        """
+        Country code of each point, None where no country contains it
+        """
+        indices = self.lookup(lats, lngs)
+        codes = np.full(len(indices), None, dtype=object)
+        found = indices >= 0
+        codes[found] = self.codes[indices[found]]
+        return codes
+
+    def segment_shares(self, lats, lngs):
+        """
+        Share of each segment of the path lying in each country
+
+        Returns (segment_idx, codes, shares) arrays: segment i of the path goes
+        from node i to node i + 1, shares are fractions of its (planar) length.
+        The part of a segment outside of any country is not returned.
+        """
+        coords = np.column_stack(
+            (np.asarray(lngs, dtype=float), np.asarray(lats, dtype=float))
+        )
+        segments = shapely.linestrings(np.stack((coords[:-1], coords[1:]), axis=1))
+        lengths = shapely.length(segments)
+
+        segment_idx, feature_idx = self.tree.query(segments, predicate="intersects")
+        shares = np.zeros(len(segment_idx))
+
+        # segments fully inside a country don't need the (costly) intersection
+        inside = shapely.contains_properly(
+            self.geometries[feature_idx], segments[segment_idx]
+        )
+        shares[inside] = 1.0
+
+        crossing = ~inside & (lengths[segment_idx] > 0)
+        if crossing.any():
+            clipped = shapely.intersection(
+                segments[segment_idx[crossing]], self.geometries[feature_idx[crossing]]
+            )
+            shares[crossing] = shapely.length(clipped) / lengths[segment_idx[crossing]]
+
+        # overlapping features could claim more than the whole segment
+        totals = np.bincount(segment_idx, weights=shares, minlength=len(segments))
+        shares /= np.maximum(totals[segment_idx], 1.0)
+
+        return segment_idx, self.codes[feature_idx], shares
+
+
+def instance():
+    """Singleton CountryIndex instance (lazy loading)"""
+    global _INSTANCE
+    if _INSTANCE is None:
+        _INSTANCE = CountryIndex()
+    return _INSTANCE
+
+
+def search(lng, lat):
+    """
+    Properties of the country containing the point, None if no country does
+    """
+    index = instance().lookup([lat], [lng])[0]
+    return instance().properties[index] if index >= 0 else None
@@ -1,4 +1,13 @@
 import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DB_PATH = "databases/main.db"
+
+# How often (in seconds) workers check whether the exchanges table was updated
+REFRESH_INTERVAL = 300
 
 
 def get_available_currencies():
@@ -38,57 +47,138 @@ def get_available_currencies():
     return available_currencies
 
 
-def get_exchange_rate(price, base_currency, target_currency, date):
-    # Return the unconverted price if the base and target currencies are the same
-    if base_currency == target_currency:
-        return price
-
-    # Ensure the price is a float
-    price = float(price)
-    db_path = "databases/main.db"
-
-    # Attempt to connect to the SQLite database
-    try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-    except sqlite3.Error as e:
-        print(f"Database connection error: {e}")
-        return None
-
-    # Select the closest date for the rate, either before or after the given date
-    date_query = """
-        SELECT 
-            COALESCE(MAX(rate_date) FILTER (WHERE rate_date <= ?), MIN(rate_date) FILTER (WHERE rate_date >= ?)) AS relevant_date
-        FROM exchanges;
+class ExchangeRates:
     """
-    cursor.execute(date_query, (date, date))
-    relevant_date = cursor.fetchone()[0]
-
-    if relevant_date:
-        # Fetch the rates for the closest date, using SQL parameters to handle the currency codes properly
-        rate_query = f"""
-            SELECT 
-                ({"1" if base_currency == "EUR" else f'"{base_currency}"'}) AS base_rate,
-                ({"1" if target_currency == "EUR" else f'"{target_currency}"'}) AS target_rate
-            FROM exchanges
-            WHERE rate_date = ?;
-        """
-        cursor.execute(rate_query, (relevant_date,))
-        row = cursor.fetchone()
+    The exchanges table, loaded once per process as a date x currency matrix of
+    rates against EUR
 
-        if row:
-            base_rate, target_rate = (float(row[0]), float(row[1]))
+    The table is only reloaded when its content changed, which is checked at
+    most every REFRESH_INTERVAL seconds (or forced by refresh_exchange_rates,
+    called after py/update_currency.py writes new rates).
+    """
 
-            if base_currency == "EUR":
-                rate = target_rate
-            elif target_currency == "EUR":
-                rate = 1 / base_rate if base_rate != 0 else None
-            else:
-                rate = (1 / base_rate * target_rate) if base_rate != 0 else None
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.dates = np.array([], dtype=str)
+        self.currencies = {"EUR": 0}
+        self.rates = np.ones((0, 1))
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
 
-            if rate is not None:
-                converted_price = round(price * rate, 2)
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if (
+            not force
+            and self._checked_at is not None
+            and now - self._checked_at < REFRESH_INTERVAL
+        ):
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                conn = sqlite3.connect(self.db_path)
+            except sqlite3.Error as e:
+                print(f"Database connection error: {e}")
+                return
+            try:
+                version = conn.execute(
+                    "SELECT COUNT(*), MAX(rate_date) FROM exchanges"
+                ).fetchone()
+                if force or version != self._version:
+                    cursor = conn.execute("SELECT * FROM exchanges ORDER BY rate_date")
+                    columns = [column[0] for column in cursor.description]
+                    rows = cursor.fetchall()
+                    self._load(columns, rows)
+                    self._version = version
+            except sqlite3.Error as e:
+                print(f"Could not load exchange rates: {e}")
+            finally:
                 conn.close()
-                return converted_price
-    conn.close()
-    return None
+
+    def _load(self, columns, rows):
+        date_column = columns.index("rate_date")
+        currency_columns = [i for i in range(len(columns)) if i != date_column]
+        rates = np.ones((len(rows), len(currency_columns) + 1))
+        # NULL rates become NaN, conversions using them give None
+        rates[:, 1:] = np.array(
+            [[row[i] for i in currency_columns] for row in rows], dtype=float
+        ).reshape(len(rows), len(currency_columns))
+
+        self.dates = np.array([str(row[date_column]) for row in rows])
+        self.currencies = {
+            "EUR": 0,
+            **{columns[i]: idx + 1 for idx, i in enumerate(currency_columns)},
+        }
+        self.rates = rates
+
+    def convert(self, items, target_currency):
+        """
+        Convert (price, currency, date) items to target_currency, at the rate of
+        the closest date at or before the given date (or the first known date).
+
+        Returns the converted prices rounded to 2 decimals, None where no rate
+        is known. Prices already in target_currency are returned unchanged.
+        """
+        self.refresh()
+        items = list(items)
+        results = [None] * len(items)
+        target_idx = self.currencies.get(target_currency)
+
+        indices, prices, base_indices, keys = [], [], [], []
+        for i, (price, base_currency, date) in enumerate(items):
+            if base_currency == target_currency:
+                results[i] = price
+                continue
+            base_idx = self.currencies.get(base_currency)
+            if target_idx is None or base_idx is None or date is None:
+                continue
+            try:
+                prices.append(float(price))
+            except (TypeError, ValueError):
+                continue
+            indices.append(i)
+            base_indices.append(base_idx)
+            keys.append(date if isinstance(date, str) else str(date))
+
+        if not indices or len(self.dates) == 0:
+            return results
+
+        date_idx = np.searchsorted(self.dates, np.array(keys), side="right") - 1
+        date_idx[date_idx < 0] = 0
+        base_rates = self.rates[date_idx, base_indices]
+        target_rates = self.rates[date_idx, target_idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            converted = np.array(prices) * (1 / base_rates * target_rates)
+
+        valid = (base_rates != 0) & np.isfinite(converted)
+        for i, value, is_valid in zip(indices, converted.tolist(), valid.tolist()):
+            if is_valid:
+                results[i] = round(value, 2)
+        return results
+
+
+_RATES = None
+
+
+def exchange_rates():
+    """Singleton ExchangeRates instance (lazy loading)"""
+    global _RATES
+    if _RATES is None:
+        _RATES = ExchangeRates()
+    return _RATES
+
+
+def refresh_exchange_rates():
+    exchange_rates().refresh(force=True)
+
+
+def convert_prices(items, target_currency):
+    """
+    Bulk get_exchange_rate of (price, base_currency, date) items
+    """
+    return exchange_rates().convert(items, target_currency)
+
+
+def get_exchange_rate(price, base_currency, target_currency, date):
+    return convert_prices([(price, base_currency, date)], target_currency)[0]
@@ -3,6 +3,8 @@ import sqlite3
 
 import pandas as pd
 
+from py.sql import adminStats
+
 
 def table_exists(cursor, table_name):
     cursor.execute(
@@ -269,6 +271,21 @@ def init_main(path):
         ("trip_id", "INTEGER NOT NULL"),
     ]
 
+    # Coverage polygons traversed by each rail trip (see src/coverage.py)
+    trip_coverage_columns = [
+        ("trip_id", "INTEGER NOT NULL"),
+        ("cc", "TEXT NOT NULL"),
+        ("polygon_id", "INTEGER NOT NULL"),
+    ]
+
+    # 1°x1° squares visited by each trip (see src/visited_squares.py)
+    visited_squares_columns = [
+        ("trip_id", "INTEGER NOT NULL"),
+        ("lat", "INTEGER NOT NULL"),
+        ("lng", "INTEGER NOT NULL"),
+        ("status", "INTEGER NOT NULL"),
+    ]
+
     operator_columns = [
         ("uid", "INTEGER PRIMARY KEY AUTOINCREMENT"),
         ("operator_type", "VARCHAR(100) NOT NULL"),
@@ -333,6 +350,8 @@ def init_main(path):
         ("tickets", "uid", tickets_columns),
         ("tags", "tag_id", tags_columns),
         ("tags_associations", "tag_id, trip_id", tags_associations_columns),
+        ("trip_coverage", "trip_id, cc, polygon_id", trip_coverage_columns),
+        ("visited_squares", "trip_id, lat, lng", visited_squares_columns),
         ("ship_pictures", "uid", ship_pictures_columns),
         ("here_api_operators", "here_operator", here_api_operators_columns),
         ("gpx", "uid", gpx_columns),
@@ -346,6 +365,199 @@ def init_main(path):
 
     # Setup database (create tables and columns if not exist)
     db_manager.setup_database()
+    # Covering index of the fingerprint of the trips of a user (see
+    # src/trip_pages.py)
+    db_manager.db_connection.execute(
+        "CREATE INDEX IF NOT EXISTS trip_username_idx ON trip (username, last_modified)"
+    )
+    setup_trip_search(db_manager.db_connection)
+    setup_user_stats(db_manager.db_connection)
 
     # Close the connection when all operations are done
     db_manager.close()
+
+
+# Columns of the full-text index of the trips, filled with lowercased text
+# without diacritics by src/trip_search.py
+TRIP_SEARCH_COLUMNS = (
+    "type",
+    "origin_station",
+    "destination_station",
+    "operator",
+    "line_name",
+    "countries",
+    "visibility",
+    "material",
+    "reg",
+    "seat",
+    "notes",
+    "start_datetime",
+    "end_datetime",
+    "tags",
+)
+
+
+def setup_trip_search(conn):
+    """
+    Create the full-text index of the trips (trigram tokens, so that any
+    substring of 3 characters or more is found through the index), and the
+    triggers marking the trips to reindex whenever they are written by
+    something else than src/trips.py
+    """
+    cursor = conn.cursor()
+    created = not table_exists(cursor, "trip_search")
+    cursor.executescript(
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS trip_search USING fts5(
+            {", ".join(TRIP_SEARCH_COLUMNS)}, tokenize = 'trigram'
+        );
+        CREATE TABLE IF NOT EXISTS trip_search_stale (trip_id INTEGER PRIMARY KEY);
+
+        CREATE TRIGGER IF NOT EXISTS trip_search_trip_insert AFTER INSERT ON trip
+        BEGIN
+            INSERT OR IGNORE INTO trip_search_stale (trip_id) VALUES (new.uid);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trip_search_trip_update AFTER UPDATE OF
+            type, origin_station, destination_station, operator, line_name,
+            countries, visibility, material_type, reg, seat, notes,
+            start_datetime, end_datetime
+        ON trip
+        BEGIN
+            INSERT OR IGNORE INTO trip_search_stale (trip_id) VALUES (new.uid);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trip_search_trip_delete AFTER DELETE ON trip
+        BEGIN
+            DELETE FROM trip_search WHERE rowid = old.uid;
+            DELETE FROM trip_search_stale WHERE trip_id = old.uid;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trip_search_tag_insert
+        AFTER INSERT ON tags_associations
+        BEGIN
+            INSERT OR IGNORE INTO trip_search_stale (trip_id) VALUES (new.trip_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trip_search_tag_delete
+        AFTER DELETE ON tags_associations
+        BEGIN
+            INSERT OR IGNORE INTO trip_search_stale (trip_id) VALUES (old.trip_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trip_search_tag_rename AFTER UPDATE OF name ON tags
+        BEGIN
+            INSERT OR IGNORE INTO trip_search_stale (trip_id)
+            SELECT trip_id FROM tags_associations WHERE tag_id = new.uid;
+        END;
+        """
+    )
+    if created:
+        # the existing trips are indexed on the next search of their owner
+        cursor.execute("INSERT OR IGNORE INTO trip_search_stale (trip_id) SELECT uid FROM trip")
+    conn.commit()
+
+
+def setup_user_stats(conn):
+    """
+    Create the per user aggregate of the trips read by the admin pages (number
+    of trips, total length, last modification), and the triggers keeping it up
+    to date on every write of the trips
+    """
+    cursor = conn.cursor()
+    created = not table_exists(cursor, "user_stats")
+    cursor.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            username TEXT PRIMARY KEY,
+            trips INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            last_modified DATETIME
+        );
+
+        CREATE TRIGGER IF NOT EXISTS user_stats_trip_insert AFTER INSERT ON trip
+        BEGIN
+            INSERT INTO user_stats (username, trips, length, last_modified)
+            VALUES (new.username, 1, coalesce(new.trip_length, 0), new.last_modified)
+            ON CONFLICT (username) DO UPDATE SET
+                trips = trips + 1,
+                length = length + excluded.length,
+                last_modified = max(
+                    coalesce(last_modified, excluded.last_modified),
+                    coalesce(excluded.last_modified, last_modified)
+                );
+        END;
+        CREATE TRIGGER IF NOT EXISTS user_stats_trip_update AFTER UPDATE OF
+            username, trip_length, last_modified
+        ON trip
+        BEGIN
+            UPDATE user_stats SET
+                trips = trips - 1,
+                length = length - coalesce(old.trip_length, 0)
+            WHERE username = old.username;
+            INSERT INTO user_stats (username, trips, length)
+            VALUES (new.username, 1, coalesce(new.trip_length, 0))
+            ON CONFLICT (username) DO UPDATE SET
+                trips = trips + 1,
+                length = length + excluded.length;
+            UPDATE user_stats SET last_modified = (
+                SELECT max(last_modified) FROM trip WHERE username = user_stats.username
+            )
+            WHERE username IN (old.username, new.username);
+            DELETE FROM user_stats WHERE username = old.username AND trips <= 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS user_stats_trip_delete AFTER DELETE ON trip
+        BEGIN
+            UPDATE user_stats SET
+                trips = trips - 1,
+                length = length - coalesce(old.trip_length, 0),
+                last_modified = (
+                    SELECT max(last_modified) FROM trip WHERE username = old.username
+                )
+            WHERE username = old.username;
+            DELETE FROM user_stats WHERE username = old.username AND trips <= 0;
+        END;
+        """
+    )
+    if created:
+        cursor.execute(
+            f"INSERT INTO user_stats (username, trips, length, last_modified) {adminStats}"
+        )
+    conn.commit()
+
+
+def init_path(path):
+    db_manager = DatabaseManager(path)
+
+    paths_columns = [
+        ("uid", "INTEGER NOT NULL"),
+        ("trip_id", "INTEGER NOT NULL"),
+        ("path", "BLOB NOT NULL"),
+        # Geometry summary, kept up to date on every write (see src/paths.py)
+        ("node_count", "INTEGER"),
+        ("length", "FLOAT"),
+        ("min_lat", "FLOAT"),
+        ("max_lat", "FLOAT"),
+        ("min_lng", "FLOAT"),
+        ("max_lng", "FLOAT"),
+        ("first_lat", "FLOAT"),
+        ("first_lng", "FLOAT"),
+        ("last_lat", "FLOAT"),
+        ("last_lng", "FLOAT"),
+        ("hull", "BLOB"),
+        # Simplified copies of the path (see src/paths.RESOLUTIONS)
+        ("path_high", "BLOB"),
+        ("path_medium", "BLOB"),
+        ("path_low", "BLOB"),
+    ]
+
+    db_manager.add_table(DatabaseTable("paths", "uid", paths_columns))
+    db_manager.setup_database()
+
+    # Covering index so that bounds and node counts can be read without
+    # touching the path itself
+    db_manager.db_connection.execute(
+        """
+        CREATE INDEX IF NOT EXISTS paths_summary_idx ON paths (
+            trip_id, node_count, min_lat, max_lat, min_lng, max_lng,
+            first_lat, first_lng, last_lat, last_lng
+        )
+        """
+    )
+    db_manager.db_connection.commit()
+    db_manager.close()
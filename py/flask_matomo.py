@@ -4,11 +4,14 @@ import random
 import re
 import time
 import typing
+from urllib.parse import urlencode
 
 import flask
 import httpx
 from flask import g, request
 
+from src.event_queue import EventQueue
+
 logger = logging.getLogger("flask_matomo2")
 
 class Matomo:
@@ -92,6 +95,8 @@ class Matomo:
             routes_details or {}
         )
         self.client = client or httpx.Client()
+        # hits are sent in bulk by a background thread, not during the request
+        self.queue = EventQueue("matomo", self.send_bulk)
         self.ignored_patterns = []
         if ignored_patterns:
             self.ignored_patterns = [
@@ -207,7 +212,7 @@ class Matomo:
         *,
         tracking_data: typing.Dict,
     ):
-        """Send request to Matomo
+        """Queue a request to Matomo, sent with the next bulk request
 
         Parameters
         ----------
@@ -227,9 +232,29 @@ class Matomo:
         if "cvar" in tracking_data:
             cvar = tracking_data.pop("cvar")
             tracking_data["cvar"] = json.dumps(cvar)
-        logger.debug("calling '%s' with '%s'", self.matomo_url, tracking_data)
+        # the hit is sent later, keep the time of the request
+        tracking_data.setdefault("cdt", int(time.time()))
+        self.queue.put(tracking_data)
+
+    def send_bulk(self, hits: typing.List[typing.Dict]):
+        """Send queued hits to Matomo with one bulk tracking request"""
+        requests = [
+            "?"
+            + urlencode(
+                {
+                    key: str(value)
+                    for key, value in hit.items()
+                    if value is not None and key != "token_auth"
+                }
+            )
+            for hit in hits
+        ]
+        payload = {"requests": requests}
+        if self.token_auth:
+            payload["token_auth"] = self.token_auth
+        logger.debug("calling '%s' with %d hits", self.matomo_url, len(hits))
         try:
-            r = self.client.post(self.matomo_url, data=tracking_data)
+            r = self.client.post(self.matomo_url, json=payload)
 
             if r.status_code >= 300:
                 logger.error(
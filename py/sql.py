@@ -1,13 +1,15 @@
 # Load SQL queries as variables
 
-initPath = open("sql/initPath.sql", "r").read()
 saveQuery = open("sql/save.sql", "r").read()
 getTrip = open("sql/getTrip.sql", "r").read()
+getTripsById = open("sql/getTripsById.sql", "r").read()
 getTripsCountry = open("sql/getTripsCountry.sql", "r").read()
+getCoveredPolygons = open("sql/getCoveredPolygons.sql", "r").read()
 updateTripQuery = open("sql/updateTrip.sql", "r").read()
 updatePath = open("sql/updatePath.sql", "r").read()
 deletePathQuery = open("sql/deletePath.sql", "r").read()
 getUserLines = open("sql/getUserLines.sql", "r").read()
+getUserLinesAtResolution = open("sql/getUserLinesAtResolution.sql", "r").read()
 getUserTrips = open("sql/getUserTrips.sql", "r").read()
 getUniqueUserTrips = open("sql/getUniqueUserTrips.sql", "r").read()
 getOperators = open("sql/getOperators.sql", "r").read()
@@ -73,6 +75,7 @@ distinctStatYears = open("sql/stats/distinctStatYears.sql", "r").read()
 getTickets = open("sql/getTickets.sql", "r").read()
 getTags = open("sql/getTags.sql", "r").read()
 getTicket = open("sql/getTicket.sql", "r").read()
+getTicketsById = open("sql/getTicketsById.sql", "r").read()
 getDynamicUserTrips = open("sql/getDynamicUserTrips.sql", "r").read()
 getNumberStations = open("sql/getNumberStations.sql", "r").read()
 countriesLeaderboard = open("sql/stats/countriesLeaderboard.sql", "r").read()
@@ -6,6 +6,8 @@ from datetime import datetime, timedelta
 
 import requests
 
+from py.currency import refresh_exchange_rates
+
 
 def fill_missing_rates(db_path, table_name):
     # Connect to the SQLite database
@@ -250,4 +252,10 @@ def run_currency_update():
     all_rates, all_rates_dates = get_rates_from_bottom_in_memory(
         unzipped_file, selected_currencies
     )
-    return process_currency_combinations_daily(db_path, all_rates, all_rates_dates)
+    last_registered_date = process_currency_combinations_daily(
+        db_path, all_rates, all_rates_dates
+    )
+    # Reload the rates of this process now, other workers pick them up on their
+    # next periodic check
+    refresh_exchange_rates()
+    return last_registered_date
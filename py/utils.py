@@ -6,11 +6,12 @@ import unicodedata
 from urllib.request import urlopen
 from datetime import datetime, timezone
 
+import numpy as np
 import pycountry
 import yaml
 from geopy.distance import geodesic
 
-from py import geopip_perso
+from py import country_index
 
 
 def remove_accents(input_str):
@@ -19,18 +20,20 @@ def remove_accents(input_str):
 
 
 def longest_common_substring(s1, s2):
-    m = [[0] * (1 + len(s2)) for _ in range(1 + len(s1))]
-    longest, x_longest = 0, 0
-    for x in range(1, 1 + len(s1)):
-        for y in range(1, 1 + len(s2)):
-            if s1[x - 1] == s2[y - 1]:
-                m[x][y] = m[x - 1][y - 1] + 1
-                if m[x][y] > longest:
-                    longest = m[x][y]
-                    x_longest = x
-            else:
-                m[x][y] = 0
-    return len(s1[x_longest - longest : x_longest])
+    """
+    Length of the longest common substring, found by binary search on the
+    length: s1 and s2 share a substring of length n if a slice of s2 is in the
+    set of the slices of s1 of that length
+    """
+    low, high = 0, min(len(s1), len(s2))
+    while low < high:
+        length = (low + high + 1) // 2
+        substrings = {s1[i : i + length] for i in range(len(s1) - length + 1)}
+        if any(s2[j : j + length] in substrings for j in range(len(s2) - length + 1)):
+            low = length
+        else:
+            high = length - 1
+    return low
 
 
 def stringSimmilarity(a, b):
@@ -49,7 +52,7 @@ def stringSimmilarity(a, b):
 
 
 def getCountryFromCoordinates(lat, lng):
-    country = geopip_perso.search(lat=lat, lng=lng)
+    country = country_index.search(lat=lat, lng=lng)
     if not country:
         country = {"countryCode": "UN"}
     return country
@@ -214,23 +217,31 @@ def getDistance(orig, dest):
     return distance
 
 
+def getDistances(lats, lngs):
+    """Vectorized getDistance between consecutive points of a path, in meters."""
+    R = 6373000.0
+    lat = np.radians(lats)
+    lng = np.radians(lngs)
+    a = (
+        np.sin(np.diff(lat) / 2) ** 2
+        + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2
+    )
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
 def getCountriesFromPath(path, type, routing_details=None, powerType=None):
     countries = {}
-    country = None
+    index = country_index.instance()
+    lats = np.array([node["lat"] for node in path], dtype=float)
+    lngs = np.array([node["lng"] for node in path], dtype=float)
+    segment_distances = getDistances(lats, lngs)
+
     if type in ["air", "helicopter"]:
-        total_distance = 0
-        for index in range(1, len(path)):
-            total_distance += getDistance(path[index - 1], path[index])
-        start_country_data = getCountryFromCoordinates(
-            lat=path[0]["lat"], lng=path[0]["lng"]
-        )
-        end_country_data = getCountryFromCoordinates(
-            lat=path[-1]["lat"], lng=path[-1]["lng"]
-        )
-        start_country = (
-            start_country_data["countryCode"] if start_country_data else "UN"
+        total_distance = float(segment_distances.sum())
+        start_country, end_country = (
+            code if code is not None else "UN"
+            for code in index.lookup_codes(lats[[0, -1]], lngs[[0, -1]])
         )
-        end_country = end_country_data["countryCode"] if end_country_data else "UN"
         countries[start_country] = total_distance / 2
         countries[end_country] = countries.get(end_country, 0) + total_distance / 2
         return json.dumps(countries)
@@ -249,70 +260,56 @@ def getCountriesFromPath(path, type, routing_details=None, powerType=None):
          (routing_details and (power_type != "auto" or "electrified" in routing_details)))
     )
    
-    # Create electrification lookup for train routes (only used when power_type is "auto")
-    electrification_map = {}
+    # Electrification status of each segment (segment i goes from node i to i + 1)
+    electrified = np.full(len(segment_distances), power_type == "electric")
     if use_electrification and power_type == "auto" and routing_details:
-        for elec_segment in routing_details["electrified"]:
-            start_idx, end_idx, elec_type = elec_segment
-            for i in range(start_idx, end_idx):
-                electrification_map[i] = elec_type
-   
-    for index in range(1, len(path)):
-        segment_distance = getDistance(path[index - 1], path[index])
-       
-        # Determine electrification status for this segment
-        is_electrified = False
+        for start_idx, end_idx, elec_type in routing_details["electrified"]:
+            electrified[start_idx:end_idx] = elec_type in ["contact_line", "rail", "yes"]
+
+    if type == "ferry":
+        # Split each segment between the countries it crosses, the rest is at sea
+        segment_idx, segment_codes, shares = index.segment_shares(lats, lngs)
+        sea = 1 - np.bincount(
+            segment_idx, weights=shares, minlength=len(segment_distances)
+        )
+        at_sea = np.flatnonzero(sea > 1e-9)
+        segment_idx = np.concatenate((segment_idx, at_sea))
+        segment_codes = np.concatenate(
+            (segment_codes, np.full(len(at_sea), "UN", dtype=object))
+        )
+        shares = np.concatenate((shares, sea[at_sea]))
+        order = np.argsort(segment_idx, kind="stable")
+        segment_idx, segment_codes, shares = (
+            segment_idx[order], segment_codes[order], shares[order]
+        )
+    else:
+        # Each segment counts for the country of its last node. Nodes outside of
+        # any country keep the country of the previous segment.
+        segment_codes = index.lookup_codes(lats[1:], lngs[1:])
+        country = "UN"
+        for i, code in enumerate(segment_codes):
+            if code is None:
+                segment_codes[i] = country
+            else:
+                country = code
+        segment_idx = np.arange(len(segment_distances))
+        shares = np.ones(len(segment_distances))
+
+    contributions = segment_distances[segment_idx] * shares
+    for country in dict.fromkeys(segment_codes):
+        in_country = segment_codes == country
         if use_electrification:
-            if power_type == "electric":
-                is_electrified = True
-            elif power_type == "thermic":
-                is_electrified = False
-            elif power_type == "auto" and index - 1 in electrification_map:
-                elec_status = electrification_map[index - 1]
-                is_electrified = elec_status in ["contact_line", "rail", "yes"]
-       
-        if type == "ferry" and segment_distance > 10:
-            num_fake_points = int(segment_distance / 10)
-            interpolated_points = interpolate_points(
-                path[index - 1], path[index], num_fake_points
-            )
+            is_electrified = electrified[segment_idx]
+            countries[country] = {
+                "elec": float(contributions[in_country & is_electrified].sum()),
+                "nonelec": float(contributions[in_country & ~is_electrified].sum()),
+            }
         else:
-            interpolated_points = [path[index]]
-        segment_countries = {}
-        for node in interpolated_points:
-            precountry = getCountryFromCoordinates(lat=node["lat"], lng=node["lng"])
-            if precountry is not None:
-                country = precountry["countryCode"]
-            else:
-                if type == "ferry":
-                    country = "UN"
-                else:
-                    if country is None:
-                        country = "UN"
-            segment_countries[country] = segment_countries.get(country, 0) + 1
-        for country, count in segment_countries.items():
-            if country not in countries:
-                if use_electrification:
-                    countries[country] = {"elec": 0, "nonelec": 0}
-                else:
-                    countries[country] = 0
-           
-            segment_country_distance = (segment_distance * count) / len(interpolated_points)
-           
-            if use_electrification:
-                if is_electrified:
-                    countries[country]["elec"] += segment_country_distance
-                else:
-                    countries[country]["nonelec"] += segment_country_distance
-            else:
-                if isinstance(countries[country], dict):
-                    countries[country] = segment_country_distance
-                else:
-                    countries[country] += segment_country_distance
+            countries[country] = float(contributions[in_country].sum())
    
     if countries == {}:
-        country_data = getCountryFromCoordinates(lat=path[0]["lat"], lng=path[0]["lng"])
-        country = country_data["countryCode"] if country_data else "UN"
+        code = index.lookup_codes(lats[:1], lngs[:1])[0]
+        country = code if code is not None else "UN"
         if use_electrification:
             countries = {country: {"elec": 0, "nonelec": 0}}
         else:
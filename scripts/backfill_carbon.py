@@ -1,115 +1,221 @@
 """
-Backfill carbon footprint for all existing trips
+Backfill the carbon footprint of the trips that don't have it yet, or of all the
+trips with --all (e.g. after changing emission factors)
+
+Trip ids are read from Postgres in pages, the trips are computed by worker
+processes from bulk SQLite reads, and each page is written back with one UPDATE
+per chunk. The last trip id written is kept in a checkpoint file, so an
+interrupted run resumes where it stopped.
 """
+import argparse
+import json
 import logging
+import multiprocessing
+import os
+import sqlite3
+
+from src.carbon import calculate_carbon_footprints
+from src.consts import DbNames
 from src.pg import pg_session
-from src.utils import mainConn, managed_cursor, pathConn
-from src.carbon import calculate_carbon_footprint_for_trip
-from src.paths import Path
-import json
-import traceback
 
 logger = logging.getLogger(__name__)
 
+CHECKPOINT_FILE = "databases/backfill_carbon.checkpoint"
+
+# SQLite limits the number of variables of a query
+SQLITE_MAX_VARIABLES = 900
+
+TRIP_COLUMNS = (
+    "uid",
+    "type",
+    "trip_length",
+    "countries",
+    "start_datetime",
+    "material_type",
+)
+
+_main_conn = None
+_path_conn = None
+
+
+def read_checkpoint(checkpoint_file):
+    try:
+        with open(checkpoint_file, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(checkpoint_file, checkpoint):
+    tmp_path = f"{checkpoint_file}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_file)
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_worker(main_db, path_db):
+    """Open read-only SQLite connections of a worker process"""
+    global _main_conn, _path_conn
+    _main_conn = _connect(main_db)
+    _path_conn = _connect(path_db)
+
 
-def backfill_carbon_for_all_trips():
+def _select_in(conn, query, ids):
+    rows = []
+    for start in range(0, len(ids), SQLITE_MAX_VARIABLES):
+        batch = ids[start : start + SQLITE_MAX_VARIABLES]
+        rows.extend(
+            conn.execute(query.format(", ".join("?" * len(batch))), batch).fetchall()
+        )
+    return rows
+
+
+def compute_chunk(trip_ids):
+    """
+    (trip_id, carbon) of the trips of the chunk, trips missing from SQLite or
+    without a path are left out
+    """
+    trips = _select_in(
+        _main_conn,
+        f"SELECT {', '.join(TRIP_COLUMNS)} FROM trip WHERE uid IN ({{}})",
+        trip_ids,
+    )
+    with_path = {
+        row["trip_id"]
+        for row in _select_in(
+            _path_conn, "SELECT trip_id FROM paths WHERE trip_id IN ({})", trip_ids
+        )
+    }
+    trips = [dict(trip) for trip in trips if trip["uid"] in with_path]
+    if len(trips) < len(trip_ids):
+        logger.warning(
+            f"{len(trip_ids) - len(trips)} trips of the chunk are missing from "
+            "SQLite or have no path"
+        )
+
+    carbons = calculate_carbon_footprints(trips)
+    return [(trip["uid"], carbon) for trip, carbon in zip(trips, carbons)]
+
+
+def update_carbon(pg, results):
+    """Write the (trip_id, carbon) pairs with a single UPDATE"""
+    values = ", ".join(
+        f"(CAST(:trip_id_{i} AS BIGINT), CAST(:carbon_{i} AS REAL))"
+        for i in range(len(results))
+    )
+    params = {}
+    for i, (trip_id, carbon) in enumerate(results):
+        params[f"trip_id_{i}"] = trip_id
+        params[f"carbon_{i}"] = carbon
+    pg.execute(
+        f"""
+        UPDATE trips SET carbon = v.carbon
+        FROM (VALUES {values}) AS v(trip_id, carbon)
+        WHERE trips.trip_id = v.trip_id
+        """,
+        params,
+    )
+
+
+def backfill_carbon_for_all_trips(
+    recompute_all=False,
+    workers=None,
+    chunk_size=1000,
+    checkpoint_file=CHECKPOINT_FILE,
+    restart=False,
+    main_db=DbNames.MAIN_DB.value,
+    path_db=DbNames.PATH_DB.value,
+):
     """
-    Calculate and update carbon footprint for all trips that don't have it set
+    Calculate and update the carbon footprint of the trips
     """
-    with pg_session() as pg:
-        # Get all trips without carbon values (or all trips if you want to recalculate)
-        result = pg.execute(
-            "SELECT trip_id FROM trips WHERE carbon IS NULL ORDER BY trip_id"
-        ).fetchall()
-        
-        trip_ids = [row['trip_id'] for row in result]
-        total = len(trip_ids)
-        
+    checkpoint = None if restart else read_checkpoint(checkpoint_file)
+    if checkpoint is not None and checkpoint["all"] != recompute_all:
+        logger.info("Checkpoint is from a run with a different --all, ignoring it")
+        checkpoint = None
+    last_trip_id = checkpoint["last_trip_id"] if checkpoint else 0
+    done = checkpoint["done"] if checkpoint else 0
+    if checkpoint:
+        logger.info(f"Resuming after trip {last_trip_id} ({done} trips already done)")
+
+    workers = workers or os.cpu_count()
+    page_size = chunk_size * workers
+    condition = "" if recompute_all else "AND carbon IS NULL"
+
+    with multiprocessing.Pool(
+        workers, initializer=init_worker, initargs=(main_db, path_db)
+    ) as pool, pg_session() as pg:
+        total = pg.execute(
+            f"SELECT COUNT(*) FROM trips WHERE trip_id > :last_trip_id {condition}",
+            {"last_trip_id": last_trip_id},
+        ).scalar()
         logger.info(f"Found {total} trips to backfill")
-        
-        for idx, trip_id in enumerate(trip_ids, 1):
-            # Fetch trip data from SQLite
-            with managed_cursor(mainConn) as cursor:
-                cursor.execute(
-                    "SELECT * FROM trip WHERE uid = ?", (trip_id,)
-                )
-                row = cursor.fetchone()
-            
-            if not row:
-                logger.warning(f"Trip {trip_id} not found in SQLite")
-                continue
-            
-            # Convert sqlite3.Row to dict explicitly
-            sqlite_trip = {key: row[key] for key in row.keys()}
-            
-            # Fetch path data
-            with managed_cursor(pathConn) as cursor:
-                cursor.execute(
-                    "SELECT path FROM paths WHERE trip_id = ?", (trip_id,)
-                )
-                path_row = cursor.fetchone()
-            
-            if not path_row:
-                logger.warning(f"Path not found for trip {trip_id}")
-                continue
-            
-            path_data = json.loads(path_row['path']) if isinstance(path_row['path'], str) else path_row['path']
-            
-            # Convert path data to the format Path expects
-            # Path data might be [[lat, lng], [lat, lng]] or [{"lat": x, "lng": y}, ...]
-            if path_data and isinstance(path_data[0], list):
-                # Convert [[lat, lng], ...] to [{"lat": lat, "lng": lng}, ...]
-                path_data_formatted = [{"lat": coord[0], "lng": coord[1]} for coord in path_data]
-            else:
-                path_data_formatted = path_data
-            
-            # Create Path object for any operations that might need it
-            path = Path(path=path_data_formatted, trip_id=trip_id)
-            
-            # Create a dict with trip data for carbon calculation
-            trip_data = {
-                'trip_id': trip_id,
-                'type': sqlite_trip['type'],
-                'trip_length': sqlite_trip['trip_length'],
-                'origin_station': sqlite_trip['origin_station'],
-                'destination_station': sqlite_trip['destination_station'],
-                'operator': sqlite_trip['operator'],
-                'countries': sqlite_trip['countries'],
-                'start_datetime': sqlite_trip.get('start_datetime'),
-                'end_datetime': sqlite_trip.get('end_datetime'),
-                'estimated_trip_duration': sqlite_trip.get('estimated_trip_duration'),
-                'manual_trip_duration': sqlite_trip.get('manual_trip_duration'),
-                'line_name': sqlite_trip.get('line_name'),
-                'material_type': sqlite_trip.get('material_type'),
-                'seat': sqlite_trip.get('seat'),
-                'reg': sqlite_trip.get('reg'),
-                'waypoints': sqlite_trip.get('waypoints'),
-                'notes': sqlite_trip.get('notes'),
-            }
-            
-            # Calculate carbon - pass the formatted path data, not the Path object
-            carbon = calculate_carbon_footprint_for_trip(trip_data, path_data_formatted)
-            
-            # Update in PostgreSQL
-            pg.execute(
-                "UPDATE trips SET carbon = :carbon WHERE trip_id = :trip_id",
-                {"carbon": carbon, "trip_id": trip_id}
+
+        while True:
+            trip_ids = [
+                row[0]
+                for row in pg.execute(
+                    f"""
+                    SELECT trip_id FROM trips
+                    WHERE trip_id > :last_trip_id {condition}
+                    ORDER BY trip_id
+                    LIMIT :limit
+                    """,
+                    {"last_trip_id": last_trip_id, "limit": page_size},
+                ).fetchall()
+            ]
+            if not trip_ids:
+                break
+
+            chunks = [
+                trip_ids[start : start + chunk_size]
+                for start in range(0, len(trip_ids), chunk_size)
+            ]
+            for results in pool.imap(compute_chunk, chunks):
+                if results:
+                    update_carbon(pg, results)
+                    done += len(results)
+            pg.commit()
+
+            last_trip_id = trip_ids[-1]
+            write_checkpoint(
+                checkpoint_file,
+                {"all": recompute_all, "last_trip_id": last_trip_id, "done": done},
             )
-            
-            # Commit every 100 trips to avoid losing too much progress
-            if idx % 100 == 0:
-                pg.commit()
-                logger.info(f"Progress: {idx}/{total} trips processed and committed")
-        
-        # Final commit for any remaining trips
-        pg.commit()
-        logger.info(f"Backfill complete: {total} trips processed")
+            logger.info(f"Progress: {done} trips backfilled, up to trip {last_trip_id}")
+
+    # the run is complete, the next one starts from scratch
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    logger.info(f"Backfill complete: {done} trips processed")
 
 
 def main():
-    logging.basicConfig(level=logging.DEBUG)
-    backfill_carbon_for_all_trips()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--all", action="store_true", dest="recompute_all")
+    parser.add_argument("--workers", type=int, help="defaults to the number of CPUs")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore the checkpoint of a previous run"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    backfill_carbon_for_all_trips(
+        args.recompute_all,
+        args.workers,
+        args.chunk_size,
+        args.checkpoint,
+        args.restart,
+    )
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,57 @@
+"""
+Build the trip_coverage index (see src/coverage.py) for existing rail trips and
+refresh the percents table from it
+"""
+
+import argparse
+import logging
+from collections import defaultdict
+
+from src.coverage import RAIL_TYPES, index_trip_coverage, trip_ccs, update_percents
+from src.utils import mainConn, managed_cursor
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_coverage(username=None):
+    query = "SELECT uid, username, countries FROM trip WHERE type IN ({})".format(
+        ", ".join("?" * len(RAIL_TYPES))
+    )
+    params = list(RAIL_TYPES)
+    if username is not None:
+        query += " AND username = ?"
+        params.append(username)
+
+    with managed_cursor(mainConn) as cursor:
+        trips = cursor.execute(query + " ORDER BY uid", params).fetchall()
+    logger.info(f"Found {len(trips)} trips to index")
+
+    user_ccs = defaultdict(set)
+    for idx, trip in enumerate(trips, 1):
+        try:
+            index_trip_coverage(trip["uid"], refresh_percents=False)
+        except Exception as e:
+            logger.warning(f"Could not index trip {trip['uid']}: {e}")
+            continue
+        user_ccs[trip["username"]].update(trip_ccs(trip["countries"]))
+        if idx % 1000 == 0:
+            logger.info(f"Progress: {idx}/{len(trips)} trips indexed")
+
+    logger.info(f"Refreshing percents of {len(user_ccs)} users")
+    for user, ccs in user_ccs.items():
+        update_percents(user, ccs)
+
+    logger.info("Backfill complete")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--username", help="only index the trips of this user")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    backfill_coverage(args.username)
+
+
+if __name__ == "__main__":
+    main()
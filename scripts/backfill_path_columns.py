@@ -0,0 +1,83 @@
+"""
+Compute the derived columns of path.db (geometry summary and simplified copies)
+for paths that don't have them yet, or for all paths with --all (e.g. after
+changing the simplification tolerances)
+"""
+
+import argparse
+import logging
+import sqlite3
+
+from py.db_init import init_path
+from src.consts import DbNames
+from src.path_codec import decode_path
+from src.paths import DERIVED_COLUMNS, derive_path_columns
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_path_columns(
+    db_path=DbNames.PATH_DB.value, batch_size=1000, recompute_all=False
+):
+    # make sure the derived columns exist
+    init_path(db_path)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    condition = "1 = 1" if recompute_all else "node_count IS NULL"
+    total = cursor.execute(f"SELECT COUNT(*) FROM paths WHERE {condition}").fetchone()[
+        0
+    ]
+    logger.info(f"Found {total} paths to backfill")
+
+    update_query = "UPDATE paths SET {} WHERE uid = :uid".format(
+        ", ".join(f"{column} = :{column}" for column in DERIVED_COLUMNS)
+    )
+
+    done = 0
+    last_uid = 0
+    while True:
+        rows = cursor.execute(
+            f"""
+            SELECT uid, path FROM paths
+            WHERE {condition} AND uid > ?
+            ORDER BY uid
+            LIMIT ?
+            """,
+            (last_uid, batch_size),
+        ).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for uid, path in rows:
+            try:
+                updates.append({"uid": uid, **derive_path_columns(decode_path(path))})
+            except Exception as e:
+                logger.warning(f"Could not compute derived columns of path {uid}: {e}")
+
+        cursor.executemany(update_query, updates)
+        conn.commit()
+
+        done += len(updates)
+        last_uid = rows[-1][0]
+        logger.info(f"Progress: {done}/{total} paths backfilled")
+
+    logger.info(f"Backfill complete: {done} paths processed")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=DbNames.PATH_DB.value)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--all", action="store_true", dest="recompute_all")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    backfill_path_columns(args.db, args.batch_size, args.recompute_all)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Build the visited_squares index (see src/visited_squares.py) for existing trips
+and refresh the world_squares percents from it
+"""
+
+import argparse
+import logging
+
+from src.utils import mainConn, managed_cursor
+from src.visited_squares import index_trip_squares, update_world_squares_percent
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_visited_squares(username=None):
+    query = "SELECT uid, username FROM trip"
+    params = []
+    if username is not None:
+        query += " WHERE username = ?"
+        params.append(username)
+
+    with managed_cursor(mainConn) as cursor:
+        trips = cursor.execute(query + " ORDER BY uid", params).fetchall()
+    logger.info(f"Found {len(trips)} trips to index")
+
+    usernames = set()
+    for idx, trip in enumerate(trips, 1):
+        try:
+            index_trip_squares(trip["uid"], refresh_percent=False)
+        except Exception as e:
+            logger.warning(f"Could not index trip {trip['uid']}: {e}")
+            continue
+        usernames.add(trip["username"])
+        if idx % 1000 == 0:
+            logger.info(f"Progress: {idx}/{len(trips)} trips indexed")
+
+    logger.info(f"Refreshing percents of {len(usernames)} users")
+    for user in usernames:
+        update_world_squares_percent(user)
+
+    logger.info("Backfill complete")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--username", help="only index the trips of this user")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    backfill_visited_squares(args.username)
+
+
+if __name__ == "__main__":
+    main()
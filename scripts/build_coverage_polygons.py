@@ -0,0 +1,66 @@
+"""
+Compile the coverage geojson files of country_percent/countries/processed into
+the memory-mapped format of src/coverage_polygons.py
+
+Files are otherwise compiled on first use, running this at deploy time avoids
+doing it in a web worker.
+"""
+
+import argparse
+import logging
+import os
+
+from src.coverage_polygons import (
+    GEOJSON_DIR,
+    build_coverage_file,
+    compiled_file,
+    geojson_file,
+    is_compiled,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def build_coverage_polygons(ccs=None, force=False):
+    if not ccs:
+        ccs = sorted(
+            os.path.splitext(filename)[0]
+            for filename in os.listdir(GEOJSON_DIR)
+            if filename.endswith(".geojson")
+        )
+
+    built = 0
+    for cc in ccs:
+        source, destination = geojson_file(cc), compiled_file(cc)
+        if not force and is_compiled(cc):
+            continue
+        try:
+            build_coverage_file(source, destination)
+        except Exception as e:
+            logger.warning(f"Could not compile {source}: {e}")
+            continue
+        built += 1
+        logger.info(
+            f"Compiled {cc}: {os.path.getsize(source) / 1024 / 1024:.1f} MB -> "
+            f"{os.path.getsize(destination) / 1024 / 1024:.1f} MB"
+        )
+
+    logger.info(f"Compiled {built} coverage files")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "ccs", nargs="*", help="coverage files to compile (default: all)"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="compile up to date files too"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    build_coverage_polygons(args.ccs, args.force)
+
+
+if __name__ == "__main__":
+    main()
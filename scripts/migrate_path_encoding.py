@@ -0,0 +1,85 @@
+"""
+Convert the paths stored in path.db from the legacy text format to the binary
+format of src/path_codec.py
+
+Rows are converted in batches and the script can be interrupted and run again:
+only rows still stored as text are picked up.
+"""
+
+import argparse
+import logging
+import sqlite3
+
+from src.consts import DbNames
+from src.path_codec import decode_path, encode_path
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_paths(db_path=DbNames.PATH_DB.value, batch_size=1000, vacuum=False):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    total = cursor.execute(
+        "SELECT COUNT(*) FROM paths WHERE typeof(path) = 'text'"
+    ).fetchone()[0]
+    logger.info(f"Found {total} paths to migrate")
+
+    migrated = 0
+    saved_bytes = 0
+    last_uid = 0
+    while True:
+        rows = cursor.execute(
+            """
+            SELECT uid, path FROM paths
+            WHERE typeof(path) = 'text' AND uid > ?
+            ORDER BY uid
+            LIMIT ?
+            """,
+            (last_uid, batch_size),
+        ).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for uid, text in rows:
+            try:
+                encoded = encode_path(decode_path(text))
+            except Exception as e:
+                logger.warning(f"Could not migrate path {uid}: {e}")
+                continue
+            saved_bytes += len(text.encode("utf-8")) - len(encoded)
+            updates.append((encoded, uid))
+
+        cursor.executemany("UPDATE paths SET path = ? WHERE uid = ?", updates)
+        conn.commit()
+
+        migrated += len(updates)
+        last_uid = rows[-1][0]
+        logger.info(f"Progress: {migrated}/{total} paths migrated")
+
+    logger.info(
+        f"Migration complete: {migrated} paths migrated, "
+        f"{saved_bytes / 1024 / 1024:.1f} MB saved"
+    )
+
+    if vacuum:
+        logger.info("Running VACUUM to reclaim disk space")
+        conn.execute("VACUUM")
+
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=DbNames.PATH_DB.value)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--vacuum", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    migrate_paths(args.db, args.batch_size, args.vacuum)
+
+
+if __name__ == "__main__":
+    main()
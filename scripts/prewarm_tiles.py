@@ -0,0 +1,102 @@
+"""
+Fill the tile store (see src/tile_store.py) with the tiles of the most viewed
+zoom levels, so that they are served without waiting for the tile servers
+"""
+
+import argparse
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from src import tile_store
+
+logger = logging.getLogger(__name__)
+
+
+def tile_range(z, bbox):
+    """x and y ranges of the tiles of zoom level z covering bbox (west, south, east, north)"""
+    west, south, east, north = bbox
+
+    def tile_x(lng):
+        return min(max(int((lng + 180) / 360 * 2**z), 0), 2**z - 1)
+
+    def tile_y(lat):
+        lat = max(min(lat, 85.0511287798), -85.0511287798)
+        y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * 2**z
+        return min(max(int(y), 0), 2**z - 1)
+
+    return (
+        range(tile_x(west), tile_x(east) + 1),
+        range(tile_y(north), tile_y(south) + 1),
+    )
+
+
+def prewarm_tiles(styles, min_zoom, max_zoom, bbox, scale="@1x", workers=8):
+    store = tile_store.instance()
+
+    def fetch(tile):
+        style, z, x, y = tile
+        if store.has_tile(style, z, x, y, scale):
+            return False
+        try:
+            store.get_tile(style, z, x, y, scale)
+        except Exception as e:
+            logger.warning(f"Could not fetch tile {style}/{z}/{x}/{y}: {e}")
+            return False
+        return True
+
+    tiles = [
+        (style, z, x, y)
+        for style in styles
+        for z in range(min_zoom, max_zoom + 1)
+        for xs, ys in [tile_range(z, bbox)]
+        for x in xs
+        for y in ys
+    ]
+    logger.info(f"Prewarming {len(tiles)} tiles")
+
+    fetched = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for idx, result in enumerate(executor.map(fetch, tiles), 1):
+            fetched += result
+            if idx % 1000 == 0:
+                logger.info(f"Progress: {idx}/{len(tiles)} tiles, {fetched} fetched")
+
+    logger.info(f"Prewarm complete: {fetched} tiles fetched")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--style",
+        action="append",
+        dest="styles",
+        choices=tile_store.STYLES,
+        help="can be repeated, defaults to all the styles",
+    )
+    parser.add_argument("--min-zoom", type=int, default=0)
+    parser.add_argument("--max-zoom", type=int, default=6)
+    parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+        default=(-180, -85.0511287798, 180, 85.0511287798),
+    )
+    parser.add_argument("--scale", default="@1x")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    prewarm_tiles(
+        args.styles or tile_store.STYLES,
+        args.min_zoom,
+        args.max_zoom,
+        args.bbox,
+        args.scale,
+        args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+WITH UTC_Filtered AS (
+    SELECT uid,
+    CASE
+        WHEN utc_start_datetime IS NOT NULL
+        THEN utc_start_datetime
+        ELSE start_datetime 
+    END AS 'utc_filtered_start_datetime'
+    FROM trip
+    WHERE username = :username
+    AND type IN ('train', 'tram', 'metro')
+)
+
+SELECT DISTINCT trip_coverage.polygon_id
+FROM UTC_Filtered
+JOIN trip_coverage ON trip_coverage.trip_id = UTC_Filtered.uid
+WHERE trip_coverage.cc = :cc
+AND CASE
+	WHEN julianday('now') <= julianday(utc_filtered_start_datetime)
+	THEN 1
+	ELSE 0 
+END = 0
+AND CASE
+	WHEN utc_filtered_start_datetime=1
+	THEN 1
+	ELSE 0 
+END = 0
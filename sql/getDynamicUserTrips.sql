@@ -3,6 +3,7 @@ WITH UTC_Filtered AS (
         COALESCE(utc_start_datetime, start_datetime) AS utc_filtered_start_datetime,
         COALESCE(utc_end_datetime, end_datetime) AS utc_filtered_end_datetime
     FROM trip
+    WHERE username = :username AND {search_condition}
 ),
 Subquery AS (
     SELECT 
@@ -51,24 +52,6 @@ FilteredTrips AS (
     LEFT JOIN airliners ON Subquery.material_type = airliners.iata
     LEFT JOIN tags_associations ON Subquery.uid = tags_associations.trip_id
     LEFT JOIN tags ON tag_id = tags.uid
-    WHERE Subquery.username = :username
-      AND past = :past
-      AND (
-          remove_diacritics(LOWER(origin_station)) LIKE remove_diacritics(LOWER(:search)) OR
-          remove_diacritics(LOWER(destination_station)) LIKE remove_diacritics(LOWER(:search)) OR
-          remove_diacritics(LOWER(operator)) LIKE remove_diacritics(LOWER(:search)) OR
-          remove_diacritics(LOWER(countries)) LIKE remove_diacritics(LOWER(:search)) OR
-          remove_diacritics(LOWER(line_name)) LIKE remove_diacritics(LOWER(:search)) OR
-          remove_diacritics(LOWER(start_datetime)) LIKE remove_diacritics(LOWER(:search)) OR
-          remove_diacritics(LOWER(end_datetime)) LIKE remove_diacritics(LOWER(:search)) OR
-          remove_diacritics(LOWER(Subquery.type)) LIKE remove_diacritics(LOWER(:search)) OR
-          remove_diacritics(LOWER(Subquery.notes)) LIKE remove_diacritics(LOWER(:search)) OR
-          remove_diacritics(LOWER(Subquery.reg)) LIKE remove_diacritics(LOWER(:search)) OR
-          remove_diacritics(LOWER(material_type)) LIKE remove_diacritics(LOWER(:search)) OR 
-          remove_diacritics(LOWER(airliners.iata)) LIKE remove_diacritics(LOWER(:search)) OR 
-          remove_diacritics(LOWER(airliners.manufacturer)) LIKE remove_diacritics(LOWER(:search)) OR 
-          remove_diacritics(LOWER(airliners.model)) LIKE remove_diacritics(LOWER(:search)) OR 
-          remove_diacritics(LOWER(tags.name)) LIKE remove_diacritics(LOWER(:search))
-      )
+    WHERE past = :past
     GROUP BY Subquery.uid
 )
\ No newline at end of file
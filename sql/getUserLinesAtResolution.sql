@@ -0,0 +1,3 @@
+SELECT trip_id, {path_column} AS path
+FROM paths
+WHERE trip_id IN ({trip_ids})
\ No newline at end of file
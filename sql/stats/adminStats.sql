@@ -1,3 +1,3 @@
-SELECT username, count(*) as 'trips' , sum(trip_length) as 'length', max(last_modified) as 'last_modified'
+SELECT username, count(*) as 'trips' , coalesce(sum(trip_length), 0) as 'length', max(last_modified) as 'last_modified'
 FROM trip
-GROUP BY username
\ No newline at end of file
+GROUP BY username
@@ -1,3 +1,17 @@
 UPDATE paths
-SET path = :path
+SET path = :path,
+    node_count = :node_count,
+    length = :length,
+    min_lat = :min_lat,
+    max_lat = :max_lat,
+    min_lng = :min_lng,
+    max_lng = :max_lng,
+    first_lat = :first_lat,
+    first_lng = :first_lng,
+    last_lat = :last_lat,
+    last_lng = :last_lng,
+    hull = :hull,
+    path_high = :path_high,
+    path_medium = :path_medium,
+    path_low = :path_low
 WHERE trip_id = :trip_id
\ No newline at end of file
@@ -0,0 +1,201 @@
+"""
+Users table and statistics of the admin page, computed in SQL
+
+The users (auth database) are joined with the user_stats aggregate of their
+trips (main database, kept up to date by triggers, see
+py/db_init.setup_user_stats), so that the filters, the sort order and the page
+window of the DataTables table are applied by SQLite instead of loading every
+user in Python on each draw.
+"""
+
+from datetime import datetime, timedelta
+
+from src.utils import adminConn, managed_cursor
+
+# Users with trips who logged in within this delay are active
+ACTIVE_DELAY = timedelta(days=90)
+ACTIVE_TODAY_DELAY = timedelta(days=1)
+
+# Format of the dates stored by SQLAlchemy and of trip.last_modified, which
+# compare as strings
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+USERS = """
+    WITH users AS (
+        SELECT
+            user.uid,
+            user.username,
+            user.email,
+            user.lang,
+            user.leaderboard,
+            user.admin,
+            user.alpha,
+            user.translator,
+            user.creation_date,
+            coalesce(user.last_login, user_stats.last_modified) AS last_login,
+            user.reset_token,
+            user.share_level,
+            user.user_currency,
+            user.tileserver,
+            user.globe,
+            user.premium,
+            coalesce(user_stats.trips, 0) AS trips,
+            coalesce(user_stats.length, 0) AS length
+        FROM user
+        LEFT JOIN trips.user_stats ON user_stats.username = user.username
+    ),
+    users_activity AS (
+        SELECT
+            *,
+            trips > 0
+                AND last_login > :active_since
+                AND username NOT IN ('demo', 'test') AS active,
+            round(
+                trips * 1.0 / coalesce(
+                    nullif(CAST(julianday(:now) - julianday(creation_date) AS INTEGER), 0),
+                    1
+                ),
+                2
+            ) AS trips_per_day
+        FROM users
+    )
+    SELECT *, COUNT(*) OVER () AS _total
+    FROM users_activity
+    WHERE {where}
+    ORDER BY {order_by}
+    LIMIT :length OFFSET :start
+"""
+
+USERS_COUNT = "SELECT COUNT(*) FROM user"
+
+STATS = """
+    SELECT
+        COUNT(*) AS total_users,
+        TOTAL(
+            user_stats.trips > 0
+            AND coalesce(user.last_login, user_stats.last_modified) > :active_since
+            AND user.username NOT IN ('demo', 'test')
+        ) AS active_users,
+        TOTAL(
+            user_stats.username IS NOT NULL
+            AND coalesce(user.last_login, user_stats.last_modified) > :active_today_since
+        ) AS active_today,
+        TOTAL(user_stats.trips) AS total_trips,
+        TOTAL(user_stats.length) AS total_km
+    FROM user
+    LEFT JOIN trips.user_stats ON user_stats.username = user.username
+"""
+
+LANGS = """
+    SELECT
+        user.lang,
+        COUNT(*) AS total,
+        TOTAL(
+            user_stats.trips > 0
+            AND coalesce(user.last_login, user_stats.last_modified) > :active_since
+            AND user.username NOT IN ('demo', 'test')
+        ) AS active
+    FROM user
+    LEFT JOIN trips.user_stats ON user_stats.username = user.username
+    GROUP BY user.lang
+"""
+
+# Sort expression of each column of the table
+SORT_COLUMNS = {
+    1: "lower(username)",
+    2: "lower(lang)",
+    3: "active",
+    4: "share_level",
+    5: "trips",
+    6: "length",
+    7: "trips_per_day",
+    8: "last_login",
+    9: "lower(email)",
+    10: "creation_date",
+}
+
+BOOLEAN_COLUMNS = (
+    "leaderboard",
+    "admin",
+    "alpha",
+    "translator",
+    "globe",
+    "premium",
+    "active",
+)
+
+
+def _dates(now):
+    return {
+        "now": now.strftime(DATE_FORMAT),
+        "active_since": (now - ACTIVE_DELAY).strftime(DATE_FORMAT),
+        "active_today_since": (now - ACTIVE_TODAY_DELAY).strftime(DATE_FORMAT),
+    }
+
+
+def _isoformat(value):
+    return datetime.fromisoformat(value).isoformat() if value else value
+
+
+def _user(row):
+    user = {key: row[key] for key in row.keys() if not key.startswith("_")}
+    for key in BOOLEAN_COLUMNS:
+        user[key] = bool(user[key])
+    user["last_login"] = _isoformat(user["last_login"])
+    user["creation_date"] = _isoformat(user["creation_date"])
+    return user
+
+
+def get_users_page(start, length, search_value, show_inactive, order_column, order_dir):
+    """
+    (total number of users, number of users matching the filters, users of the
+    page), length -1 meaning all the users
+    """
+    params = {**_dates(datetime.now()), "start": start, "length": length}
+
+    conditions = []
+    if not show_inactive:
+        conditions.append("active")
+    if search_value:
+        params["search"] = search_value.lower()
+        conditions.append(
+            "(instr(lower(username), :search) OR instr(lower(email), :search)"
+            " OR instr(lower(lang), :search))"
+        )
+
+    # equal users stay in uid order, whatever the direction
+    order_by = "uid"
+    if order_column in SORT_COLUMNS:
+        direction = "DESC" if order_dir == "desc" else "ASC"
+        order_by = f"{SORT_COLUMNS[order_column]} {direction}, uid"
+
+    with managed_cursor(adminConn) as cursor:
+        total = cursor.execute(USERS_COUNT).fetchone()[0]
+        query = USERS.format(where=" AND ".join(conditions) or "1", order_by=order_by)
+        rows = cursor.execute(query, params).fetchall()
+        if rows:
+            filtered = rows[0]["_total"]
+        elif start > 0:
+            # past the last page, count without the window
+            params["start"], params["length"] = 0, 1
+            row = cursor.execute(query, params).fetchone()
+            filtered = row["_total"] if row else 0
+        else:
+            filtered = 0
+
+    return total, filtered, [_user(row) for row in rows]
+
+
+def get_stats():
+    """Number of users, active users, trips and kilometers, and languages"""
+    params = _dates(datetime.now())
+    with managed_cursor(adminConn) as cursor:
+        stats = dict(cursor.execute(STATS, params).fetchone())
+        langs = cursor.execute(LANGS, params).fetchall()
+
+    stats = {key: int(value) for key, value in stats.items()}
+    stats["langs"] = {
+        "total": {row["lang"]: row["total"] for row in langs},
+        "active": {row["lang"]: int(row["active"]) for row in langs if row["active"]},
+    }
+    return stats
@@ -10,6 +10,7 @@ from icalendar import Calendar
 
 from py.utils import load_config, getCountryFromCoordinates, get_flag_emoji, getDistance
 from src.trips import Trip, create_trip
+from src import geocoding_cache, http_client
 from src.routing import forward_routing_core
 from src.utils import get_default_trip_visibility
 
@@ -78,16 +79,20 @@ def geocode_station(query, trip_type="train", fallback_coords=None):
     for tag in osm_tags.get(trip_type, []):
         params.append(("osm_tag", tag))
     
-    data = None
-    for url in ["https://photon.chiel.uk/api", "https://photon.komoot.io/api"]:
-        try:
-            resp = requests.get(url, params=params, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            if data.get("features"):
-                break
-        except Exception as e:
-            logger.debug(f"Geocoding {url} failed: {e}")
+    def fetch():
+        data = None
+        for url in ["https://photon.chiel.uk/api", "https://photon.komoot.io/api"]:
+            try:
+                resp = http_client.get(url, params=params, timeout=10, retries=0)
+                resp.raise_for_status()
+                data = resp.json()
+                if data.get("features"):
+                    break
+            except Exception as e:
+                logger.debug(f"Geocoding {url} failed: {e}")
+        return data
+    
+    data = geocoding_cache.geocode("photon", "/api", params, fetch)
     
     if (not data or not data.get("features")) and fallback_coords:
         lat, lng = fallback_coords
@@ -320,8 +325,8 @@ def enrich_parsed_trip(parsed_trip):
     return parsed_trip
 
 def create_trip_from_parsed(user, parsed_trip, purchase_date=None, source="ai"):
-    from timezonefinder import TimezoneFinder
     import pytz
+    from src.timezones import timezone_name
     from src.utils import getLocalDatetime
     
     trip_type = parsed_trip.get("type", "train")
@@ -377,7 +382,6 @@ def create_trip_from_parsed(user, parsed_trip, purchase_date=None, source="ai"):
         countries = "{}"
         material_type = None
     
-    tf = TimezoneFinder()
     start_datetime = end_datetime = utc_start_datetime = utc_end_datetime = estimated_duration = None
     
     utc_start = parsed_trip.get("utc_start_datetime")
@@ -400,7 +404,7 @@ def create_trip_from_parsed(user, parsed_trip, purchase_date=None, source="ai"):
         if trip_date:
             if dep_time:
                 start_datetime = datetime.strptime(f"{trip_date} {dep_time}", "%Y-%m-%d %H:%M")
-                tz_name = tf.timezone_at(lat=path[0]["lat"], lng=path[0]["lng"])
+                tz_name = timezone_name(path[0]["lat"], path[0]["lng"])
                 if tz_name:
                     local_start = pytz.timezone(tz_name).localize(start_datetime)
                     utc_start_datetime = local_start.astimezone(pytz.UTC).replace(tzinfo=None)
@@ -409,13 +413,13 @@ def create_trip_from_parsed(user, parsed_trip, purchase_date=None, source="ai"):
             
             if arr_time:
                 end_datetime = datetime.strptime(f"{arrival_date} {arr_time}", "%Y-%m-%d %H:%M")
-                tz_name = tf.timezone_at(lat=path[-1]["lat"], lng=path[-1]["lng"])
+                tz_name = timezone_name(path[-1]["lat"], path[-1]["lng"])
                 if tz_name:
                     local_end = pytz.timezone(tz_name).localize(end_datetime)
                     utc_end_datetime = local_end.astimezone(pytz.UTC).replace(tzinfo=None)
             elif arrival_date != trip_date:
                 end_datetime = datetime.strptime(f"{arrival_date} 23:59", "%Y-%m-%d %H:%M")
-                tz_name = tf.timezone_at(lat=path[-1]["lat"], lng=path[-1]["lng"])
+                tz_name = timezone_name(path[-1]["lat"], path[-1]["lng"])
                 if tz_name:
                     local_end = pytz.timezone(tz_name).localize(end_datetime)
                     utc_end_datetime = local_end.astimezone(pytz.UTC).replace(tzinfo=None)
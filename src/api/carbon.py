@@ -1,5 +1,5 @@
 from flask import jsonify, request, render_template
-from src.carbon import calculate_carbon_footprint_for_trip
+from src.carbon import calculate_carbon_footprint_for_trip, calculate_carbon_footprints
 import json
 from flask import Blueprint
 
@@ -99,7 +99,7 @@ def api_calculate_carbon():
                 }
         
         # Calculate carbon emissions with country information
-        carbon_kg = calculate_carbon_footprint_for_trip(trip, formatted_path)
+        carbon_kg = calculate_carbon_footprint_for_trip(trip)
         
         # Prepare response with additional context
         response = {
@@ -148,21 +148,12 @@ def api_batch_calculate_carbon():
         total_carbon = 0
         total_distance = 0
         
-        for segment in data['segments']:
-            trip = segment.get('trip', {})
-            path = segment.get('path', [])
-            
-            # Format path
-            formatted_path = []
-            for point in path:
-                if isinstance(point, dict):
-                    formatted_path.append((point.get('lat', 0), point.get('lng', 0)))
-                elif isinstance(point, (list, tuple)) and len(point) >= 2:
-                    formatted_path.append((point[0], point[1]))
-            
-            # Calculate carbon
-            carbon_kg = calculate_carbon_footprint_for_trip(trip, formatted_path)
-            
+        trips = [segment.get('trip', {}) for segment in data['segments']]
+        
+        # Calculate carbon of all the segments at once
+        carbon_footprints = calculate_carbon_footprints(trips)
+        
+        for trip, carbon_kg in zip(trips, carbon_footprints):
             segment_result = {
                 'carbon': round(carbon_kg, 6),
                 'trip_type': trip.get('type'),
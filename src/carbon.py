@@ -1,7 +1,6 @@
 import json, os, math
+import numpy as np
 import pandas as pd
-from geopy.distance import geodesic
-from datetime import datetime
 
 def load_aircraft_emissions():
     filepath = os.path.join("base_data/carbon", "aircraft_emissions.json")
@@ -40,29 +39,32 @@ def get_year_from_datetime(start_datetime):
     else:
         return 2024  # Default fallback
 
-def get_grid_intensity_for_country_year(country_code, year):
-    """Get grid intensity for a specific country and year"""
-    global GRID_INTENSITY_DF
-    
-    min_year = GRID_INTENSITY_DF.index.min()
-    max_year = GRID_INTENSITY_DF.index.max()
-    
-    # Clamp year to available range
-    if year > max_year:
-        year = max_year  # Use last present year for future dates
-    elif year < min_year:
-        year = min_year  # Use earliest available year for past dates
-    
-    # Get intensity for the year and country
-    if country_code in GRID_INTENSITY_DF.columns:
-        intensity = GRID_INTENSITY_DF.loc[year, country_code]
-        if pd.notna(intensity):
-            return float(intensity)
-    
-    # Fallback to 445g default if country not present
-    return 445.0
+# Fallback to 445g default if country not present
+DEFAULT_GRID_INTENSITY = 445.0
+
+def compile_grid_intensity(df):
+    """
+    Dense (years x countries) array of GRID_INTENSITY_DF, missing values replaced
+    by the default intensity. The extra last column is used for unknown countries.
+    """
+    years = df.index.to_numpy(dtype=int)
+    countries = {country_code: i for i, country_code in enumerate(df.columns)}
+    values = df.to_numpy(dtype=float)
+    values = np.where(np.isnan(values), DEFAULT_GRID_INTENSITY, values)
+    values = np.column_stack((values, np.full(len(years), DEFAULT_GRID_INTENSITY)))
+    return years, countries, values
+
+def grid_year_index(years):
+    """Row of GRID_INTENSITY of each year, clamped to the available range"""
+    years = np.clip(np.asarray(years, dtype=int), GRID_YEARS[0], GRID_YEARS[-1])
+    return np.searchsorted(GRID_YEARS, years)
+
+def grid_country_index(country_code):
+    """Column of GRID_INTENSITY of a country"""
+    return GRID_COUNTRIES.get(country_code, len(GRID_COUNTRIES))
 
 GRID_INTENSITY_DF = load_grid_intensity_df()
+GRID_YEARS, GRID_COUNTRIES, GRID_INTENSITY = compile_grid_intensity(GRID_INTENSITY_DF)
 TRAIN_FACTORS = load_train_emissions()
 FLIGHT_CATEGORIES, AIRCRAFT_CATEGORY_CO2 = load_aircraft_emissions()
 
@@ -90,13 +92,6 @@ EMISSION_FACTORS = {
     'aerialway': {'construction': 1.0, 'infrastructure': 4.0}
 }
 
-def calculate_great_circle_distance(p1, p2):
-    return geodesic(p1, p2).meters
-
-def calculate_path_distance(path):
-    if len(path) < 2: return 0
-    return sum(calculate_great_circle_distance(path[i], path[i+1]) for i in range(len(path)-1))
-
 def get_flight_category(distance_km, categories=FLIGHT_CATEGORIES):
     cand = []
     for name, b in categories.items():
@@ -113,14 +108,6 @@ def get_aircraft_co2_value(aircraft_code, distance_km):
     cat = get_flight_category(distance_km)
     return per_cat.get(cat) if cat and cat in per_cat else per_cat.get("all")
 
-def calculate_air_emissions(distance_km, path_points, aircraft_code=''):
-    f = EMISSION_FACTORS['air']
-    v = get_aircraft_co2_value(aircraft_code, distance_km)
-    if v is not None:
-        return distance_km * v * f['non_co2_factor']
-    cat = 'short' if distance_km < 1000 else ('medium' if distance_km < 3500 else 'long')
-    return distance_km * f[cat]['base_co2_per_km'] * f['non_co2_factor']
-
 def split_km_for_country(cc, value_m):
     """Split distance into electric and diesel kilometers based on country's diesel share"""
     if isinstance(value_m, dict):
@@ -141,142 +128,124 @@ def split_km_for_country(cc, value_m):
     
     return electric_km, diesel_km
 
-def calculate_rail_emissions(distance_km, countries, rail_type='train', start_datetime=None, force_electric=False):
+RAIL_TYPES = ['train', 'metro', 'tram', 'aerialway']
+
+# Emissions in g per km of the transport types that only depend on the distance
+PER_KM_EMISSIONS = {
+    'bus': sum(EMISSION_FACTORS['bus'].values()),
+    'ferry': sum(EMISSION_FACTORS['ferry'].values()),
+    'cycle': sum(EMISSION_FACTORS['cycle'].values()),
+    'walk': EMISSION_FACTORS['walk']['human_fuel'],
+}
+
+def rail_segments(countries, distance_km, force_electric):
     """
-    Calculate rail transport CO2 emissions in kg CO2e (train/metro/tram/aerialway)
-   
-    Args:
-        distance_km: Total distance (not used when countries dict provided)
-        countries: Dict of country codes and distances/breakdown, or JSON string
-                  Old format: {"FR": 100} (distance in km)
-                  New format: {"FR": {"elec": 773939.89, "nonelec": 62488.40}} (distances in meters)
-        rail_type: Type of rail transport ('train', 'metro', 'tram', 'aerialway')
-        start_datetime: Trip date (yyyy-mm-dd string, -1, or 1)
-        force_electric: If True, treat all trains as electric
-    
-    Returns:
-        float: Total CO2 emissions in kg CO2e
+    (country_code, electric_km, diesel_km) of each country crossed by a rail trip
     """
-    # Get rail base emissions (construction + infrastructure) based on type
-    rail_base = EMISSION_FACTORS.get(rail_type, EMISSION_FACTORS['train'])
-    base_emissions_g_per_km = rail_base['construction'] + rail_base['infrastructure']
-    
-    # Extract year from start_datetime
-    year = get_year_from_datetime(start_datetime)
-    
-    # Handle case where no countries specified - use default values
     if not countries:
-        factors = TRAIN_FACTORS['default']
-        electric_km = distance_km
-        diesel_km = 0 if force_electric else distance_km * factors['diesel_share']
-        electric_km = distance_km - diesel_km if not force_electric else distance_km
-        
-        # Use global average grid intensity for the year
-        grid_intensity_g_per_kwh = get_grid_intensity_for_country_year('default', year)
-        
-        # Calculate operational emissions (grid electricity + diesel fuel)
-        electric_emissions = electric_km * ELECTRIC_TRAIN_KWH_PER_KM * grid_intensity_g_per_kwh / 1000
-        diesel_emissions = diesel_km * DIESEL_TRAIN_LITERS_PER_KM * DIESEL_CO2_KG_PER_LITER
-        
-        # Add base emissions (construction + infrastructure)
-        base_emissions = distance_km * base_emissions_g_per_km / 1000
-        
-        return electric_emissions + diesel_emissions + base_emissions
-    
+        diesel_km = 0 if force_electric else distance_km * TRAIN_FACTORS['default']['diesel_share']
+        return [('default', distance_km - diesel_km, diesel_km)]
+
     # Parse countries if it's a JSON string
     if isinstance(countries, str):
         try:
             countries = json.loads(countries)
-        except:
+        except (TypeError, ValueError):
             countries = {}
-    
-    total_emissions = 0.0
-    
-    # Process each country
+
+    segments = []
     for country_code, distance_value in countries.items():
-        # Determine if this is old format (number) or new format (dict)
-        if isinstance(distance_value, (int, float)):
-            # Old format: {"FR": 200}
-            # Get country-specific diesel share
-            factors = TRAIN_FACTORS.get(country_code, TRAIN_FACTORS['default'])
-            
-            # Split into electric and diesel kilometers using existing logic
-            electric_km, diesel_km = split_km_for_country(country_code, distance_value)
-            
-        elif isinstance(distance_value, dict):
-            # New format: {"FR": {"elec": 120, "nonelec": 80}} 
+        if isinstance(distance_value, dict):
+            # New format: {"FR": {"elec": 120, "nonelec": 80}}
             electric_km = distance_value.get('elec', 0) / 1000
             diesel_km = distance_value.get('nonelec', 0) / 1000
-            
         else:
-            # Fallback - treat as old format
-            factors = TRAIN_FACTORS.get(country_code, TRAIN_FACTORS['default'])
+            # Old format: {"FR": 200}
             electric_km, diesel_km = split_km_for_country(country_code, distance_value)
-       
-        # Get country-specific grid intensity for the year
-        grid_intensity_g_per_kwh = get_grid_intensity_for_country_year(country_code, year)
-       
-        # Force all to electric if requested
         if force_electric:
-            electric_km += diesel_km
-            diesel_km = 0
-        
-        total_km = electric_km + diesel_km
-        
-        # Calculate operational emissions (grid electricity + diesel fuel)
-        electric_emissions = electric_km * ELECTRIC_TRAIN_KWH_PER_KM * grid_intensity_g_per_kwh / 1000
-        diesel_emissions = diesel_km * DIESEL_TRAIN_LITERS_PER_KM * DIESEL_CO2_KG_PER_LITER
-        
-        # Add base emissions (construction + infrastructure) for this segment
-        base_emissions = total_km * base_emissions_g_per_km / 1000
-        
-        total_emissions += electric_emissions + diesel_emissions + base_emissions
-    return total_emissions
-
-def calculate_bus_emissions(distance_km):
-    g = EMISSION_FACTORS['bus']
-    return distance_km * (g['construction'] + g['fuel'] + g['infrastructure']) / 1000
-
-def calculate_car_emissions(distance_km, passengers=1):
-    g = EMISSION_FACTORS['car']
-    total = distance_km * (g['construction'] + g['fuel'] + g['infrastructure'])
-    if passengers > 1:
-        total += distance_km * g['fuel'] * g['additional_passenger_factor'] * (passengers - 1)
-    return (total / passengers) / 1000
-
-def calculate_ferry_emissions(distance_km):
-    g = EMISSION_FACTORS['ferry']
-    return distance_km * (g['combustion'] + g['services'] + g['construction']) / 1000
+            electric_km, diesel_km = electric_km + diesel_km, 0
+        segments.append((country_code, electric_km, diesel_km))
+    return segments
 
-def calculate_cycle_emissions(distance_km):
-    g = EMISSION_FACTORS['cycle']
-    return distance_km * (g['construction'] + g['human_fuel']) / 1000
-
-def calculate_walk_emissions(distance_km):
-    g = EMISSION_FACTORS['walk']
-    return distance_km * g['human_fuel'] / 1000
+def calculate_carbon_footprints(trips):
+    """
+    Carbon footprint in kg CO2e of each trip, computed in one vectorized pass
 
-def calculate_carbon_footprint_for_trip(trip, path):
-    t = trip.get('type', '').lower()
-    if t not in ['train','bus','air','helicopter','ferry','cycle','walk','metro','tram','aerialway','car']:
-        return 0
-    if t == 'helicopter': t = 'air'
-    distance_km = float(trip.get("trip_length", 0))/1000
-    if distance_km == 0: return 0
-    if t == 'air':
-        return calculate_air_emissions(distance_km, len(path), trip.get('material_type',''))
-    if t in ['train']:
-        return calculate_rail_emissions(distance_km, trip.get('countries'), 'train', trip.get("start_datetime"), force_electric=False)
-    if t in ['metro','tram','aerialway']:
-        return calculate_rail_emissions(distance_km, trip.get('countries'), t, trip.get("start_datetime"), force_electric=True)
-    if t == 'bus':
-        return calculate_bus_emissions(distance_km)
-    if t == 'car':
-        return calculate_car_emissions(distance_km, trip.get('passengers', 1))
-    if t == 'ferry':
-        return calculate_ferry_emissions(distance_km)
-    if t == 'cycle':
-        return calculate_cycle_emissions(distance_km)
-    if t == 'walk':
-        return calculate_walk_emissions(distance_km)
-    return 0
\ No newline at end of file
+    The rail trips are split into one segment per country, and the grid
+    intensities of all the segments are read at once from GRID_INTENSITY.
+    """
+    count = len(trips)
+    types = np.array([(trip.get('type') or '').lower() for trip in trips], dtype=object)
+    types[types == 'helicopter'] = 'air'
+    distance_km = np.array([float(trip.get('trip_length') or 0) for trip in trips]) / 1000
+    footprints = np.zeros(count)
+
+    for t, g_per_km in PER_KM_EMISSIONS.items():
+        mask = types == t
+        footprints[mask] = distance_km[mask] * g_per_km / 1000
+
+    # Car
+    mask = types == 'car'
+    if mask.any():
+        g = EMISSION_FACTORS['car']
+        d = distance_km[mask]
+        passengers = np.array(
+            [max(int(trip.get('passengers', 1) or 1), 1) for trip, m in zip(trips, mask) if m]
+        )
+        total = d * (g['construction'] + g['fuel'] + g['infrastructure'])
+        total += d * g['fuel'] * g['additional_passenger_factor'] * (passengers - 1)
+        footprints[mask] = (total / passengers) / 1000
+
+    # Air
+    mask = types == 'air'
+    if mask.any():
+        f = EMISSION_FACTORS['air']
+        d = distance_km[mask]
+        default_per_km = np.select(
+            [d < 1000, d < 3500],
+            [f['short']['base_co2_per_km'], f['medium']['base_co2_per_km']],
+            f['long']['base_co2_per_km'],
+        )
+        aircraft_per_km = np.array(
+            [
+                get_aircraft_co2_value(trip.get('material_type', ''), km)
+                for trip, km in zip((trip for trip, m in zip(trips, mask) if m), d)
+            ],
+            dtype=float,
+        )
+        per_km = np.where(np.isnan(aircraft_per_km), default_per_km, aircraft_per_km)
+        footprints[mask] = d * per_km * f['non_co2_factor']
+
+    # Rail
+    segment_trips, segment_countries, electric_km, diesel_km = [], [], [], []
+    base_g_per_km, years = np.zeros(count), np.zeros(count, dtype=int)
+    for i in np.flatnonzero(np.isin(types, RAIL_TYPES) & (distance_km != 0)):
+        trip = trips[i]
+        rail_base = EMISSION_FACTORS[types[i]]
+        base_g_per_km[i] = rail_base['construction'] + rail_base['infrastructure']
+        years[i] = get_year_from_datetime(trip.get('start_datetime'))
+        for country_code, e_km, d_km in rail_segments(
+            trip.get('countries'), distance_km[i], force_electric=types[i] != 'train'
+        ):
+            segment_trips.append(i)
+            segment_countries.append(grid_country_index(country_code))
+            electric_km.append(e_km)
+            diesel_km.append(d_km)
+
+    if segment_trips:
+        segment_trips = np.array(segment_trips)
+        electric_km = np.array(electric_km, dtype=float)
+        diesel_km = np.array(diesel_km, dtype=float)
+        intensity = GRID_INTENSITY[grid_year_index(years[segment_trips]), segment_countries]
+        emissions = (
+            electric_km * ELECTRIC_TRAIN_KWH_PER_KM * intensity / 1000
+            + diesel_km * DIESEL_TRAIN_LITERS_PER_KM * DIESEL_CO2_KG_PER_LITER
+            + (electric_km + diesel_km) * base_g_per_km[segment_trips] / 1000
+        )
+        footprints += np.bincount(segment_trips, weights=emissions, minlength=count)
+
+    footprints[distance_km == 0] = 0
+    return footprints.tolist()
+
+def calculate_carbon_footprint_for_trip(trip):
+    return calculate_carbon_footprints([trip])[0]
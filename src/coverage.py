@@ -0,0 +1,209 @@
+"""
+Per-user index of the rail coverage polygons (country_percent/countries/processed)
+traversed by each trip
+
+The polygons crossed by a trip are computed once, when its path is written, and
+stored in the trip_coverage table. The country maps and the percents table are
+then built from the index instead of looking up every node of every trip.
+"""
+
+import json
+import math
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from py.sql import getCoveredPolygons, upsertPercent
+from src import coverage_polygons
+from src.path_codec import decode_path
+from src.utils import mainConn, managed_cursor, pathConn
+
+RAIL_TYPES = ("train", "tram", "metro")
+
+# The coverage of any of these countries includes the trips in all of them
+GROUPED_COUNTRIES = {"CN", "HK", "MO"}
+
+
+@lru_cache(maxsize=1)
+def available_ccs():
+    """
+    Countries and subdivisions that have a coverage file
+    """
+    return tuple(
+        os.path.splitext(filename)[0]
+        for filename in sorted(os.listdir(coverage_polygons.GEOJSON_DIR))
+        if filename.endswith(".geojson")
+    )
+
+
+def trip_ccs(countries):
+    """
+    Coverage files concerned by a trip, from its countries column
+    """
+    codes = {code.upper() for code in json.loads(countries or "{}")}
+    if codes & GROUPED_COUNTRIES:
+        codes |= GROUPED_COUNTRIES
+    return [cc for cc in available_ccs() if cc.split("-")[0].upper() in codes]
+
+
+def coverage_points(path):
+    """
+    Nodes of the path and middles of its segments, as (lats, lngs) arrays
+    """
+    coords = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+    points = np.concatenate((coords, (coords[:-1] + coords[1:]) / 2))
+    return points[:, 0], points[:, 1]
+
+
+def traversed_polygons(cc, path):
+    """
+    Ids of the polygons of the coverage of cc traversed by the path
+    """
+    if not path:
+        return []
+    return coverage_polygons.instance(cc).search_ids(*coverage_points(path))
+
+
+def coverage_percent(cc, polygon_ids):
+    polygons = coverage_polygons.instance(cc)
+    traveled_area = polygons.area(polygon_ids)
+    return math.ceil(min((traveled_area / polygons.total_area) * 100, 100))
+
+
+def get_covered_polygons(username, cc):
+    """
+    Ids of the polygons of the coverage of cc traversed by the past rail trips
+    of the user
+    """
+    with managed_cursor(mainConn) as cursor:
+        return {
+            row["polygon_id"]
+            for row in cursor.execute(
+                getCoveredPolygons, {"username": username, "cc": cc}
+            ).fetchall()
+        }
+
+
+def update_percents(username, ccs):
+    with managed_cursor(mainConn) as cursor:
+        for cc in ccs:
+            percent = coverage_percent(cc, get_covered_polygons(username, cc))
+            cursor.execute(
+                upsertPercent, {"username": username, "cc": cc, "percent": percent}
+            )
+    mainConn.commit()
+
+
+def _trip_coverage_ccs(cursor, trip_id):
+    return {
+        row["cc"]
+        for row in cursor.execute(
+            "SELECT DISTINCT cc FROM trip_coverage WHERE trip_id = ?", (trip_id,)
+        ).fetchall()
+    }
+
+
+def index_trip_coverage(trip_id, refresh_percents=True):
+    """
+    (Re)compute the coverage polygons traversed by a trip, to be called whenever
+    its path, type or countries change
+    """
+    with managed_cursor(mainConn) as cursor:
+        trip = cursor.execute(
+            "SELECT username, type, countries FROM trip WHERE uid = ?", (trip_id,)
+        ).fetchone()
+        previous_ccs = _trip_coverage_ccs(cursor, trip_id)
+
+    rows = []
+    if trip is not None and trip["type"] in RAIL_TYPES:
+        with managed_cursor(pathConn) as cursor:
+            path_row = cursor.execute(
+                "SELECT path FROM paths WHERE trip_id = ?", (trip_id,)
+            ).fetchone()
+        path = decode_path(path_row["path"]) if path_row else []
+        for cc in trip_ccs(trip["countries"]):
+            rows.extend(
+                (trip_id, cc, polygon_id) for polygon_id in traversed_polygons(cc, path)
+            )
+
+    with managed_cursor(mainConn) as cursor:
+        cursor.execute("DELETE FROM trip_coverage WHERE trip_id = ?", (trip_id,))
+        cursor.executemany(
+            "INSERT OR IGNORE INTO trip_coverage (trip_id, cc, polygon_id) "
+            "VALUES (?, ?, ?)",
+            rows,
+        )
+    mainConn.commit()
+
+    if refresh_percents and trip is not None:
+        update_percents(trip["username"], previous_ccs | {cc for _, cc, _ in rows})
+
+
+def refresh_trip_percents(trip_id):
+    """
+    Update the percents of the coverage traversed by a trip, without looking up
+    its path again
+    """
+    with managed_cursor(mainConn) as cursor:
+        trip = cursor.execute(
+            "SELECT username FROM trip WHERE uid = ?", (trip_id,)
+        ).fetchone()
+        ccs = _trip_coverage_ccs(cursor, trip_id)
+    if trip is not None:
+        update_percents(trip["username"], ccs)
+
+
+def duplicate_trip_coverage(trip_id, new_trip_id):
+    with managed_cursor(mainConn) as cursor:
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO trip_coverage (trip_id, cc, polygon_id)
+            SELECT ?, cc, polygon_id FROM trip_coverage WHERE trip_id = ?
+            """,
+            (new_trip_id, trip_id),
+        )
+    mainConn.commit()
+
+
+def delete_trip_coverage(trip_id, username):
+    with managed_cursor(mainConn) as cursor:
+        ccs = _trip_coverage_ccs(cursor, trip_id)
+        cursor.execute("DELETE FROM trip_coverage WHERE trip_id = ?", (trip_id,))
+    mainConn.commit()
+    update_percents(username, ccs)
+
+
+def delete_coverage_polygons(cc, polygon_ids):
+    """
+    Follow the deletion of polygons from the coverage of cc
+    """
+    with managed_cursor(mainConn) as cursor:
+        cursor.executemany(
+            "DELETE FROM trip_coverage WHERE cc = ? AND polygon_id = ?",
+            [(cc, polygon_id) for polygon_id in polygon_ids],
+        )
+    mainConn.commit()
+
+
+def merge_coverage_polygons(cc, polygon_ids, merged_id):
+    """
+    Follow the merge of polygons of the coverage of cc into merged_id
+    """
+    with managed_cursor(mainConn) as cursor:
+        for polygon_id in polygon_ids:
+            if polygon_id == merged_id:
+                continue
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO trip_coverage (trip_id, cc, polygon_id)
+                SELECT trip_id, cc, ? FROM trip_coverage
+                WHERE cc = ? AND polygon_id = ?
+                """,
+                (merged_id, cc, polygon_id),
+            )
+            cursor.execute(
+                "DELETE FROM trip_coverage WHERE cc = ? AND polygon_id = ?",
+                (cc, polygon_id),
+            )
+    mainConn.commit()
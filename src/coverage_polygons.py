@@ -0,0 +1,460 @@
+"""
+Compiled, memory-mapped coverage polygons
+
+Each country_percent/countries/processed/{cc}.geojson is compiled once into a
+binary file holding the polygon ids and areas, the packed ring coordinates, a
+prebuilt packed R-tree and the serialized map. Workers mmap these files, so the
+polygons are parsed once and shared through the page cache instead of being
+loaded by every process.
+
+The map is the geojson FeatureCollection with a "traveled": false property
+first in each feature. A user's map is a copy of it with the flags of the
+traveled polygons overwritten by "true " (same width, valid JSON).
+
+Layout (little-endian, each array aligned on 8 bytes after the header):
+
+    header          MAGIC, NODE_SIZE, polygons, rings, coords, nodes, levels,
+                    flags, total area, map size
+    ids             int64[polygons]
+    areas           float64[polygons]       area_m2 of each polygon
+    polygon_rings   int32[polygons + 1]     offsets in ring_coords
+    ring_coords     int32[rings + 1]        offsets in coords
+    coords          float32[coords, 2]      lng, lat
+    order           int32[polygons]         polygon of each leaf of the tree
+    boxes           float64[nodes, 4]       bboxes of the tree, leaves first
+    level_offsets   int32[levels + 1]       first node of each level of the tree
+    flag_ids        int64[flags]            id of each feature of the map
+    flag_offsets    int64[flags]            offset of its traveled flag in map
+    map             bytes[map size]         FeatureCollection, nothing traveled
+"""
+
+import json
+import math
+import mmap
+import os
+import struct
+
+import numpy as np
+from pyproj import Geod
+from shapely.geometry import shape
+
+from py.country_index import geopip_rank
+
+MAGIC = b"TLC2"
+HEADER = struct.Struct("<4sIIIIIIIdQ")
+NODE_SIZE = 16
+
+GEOJSON_DIR = "country_percent/countries/processed"
+COMPILED_DIR = "country_percent/countries/compiled"
+
+# Start of each feature of the map, followed by its traveled flag
+FEATURE_START = '{"type":"Feature","properties":{"traveled":'
+TRAVELED = b"true "
+
+# Maximum number of edges tested at once, bounds the memory used by lookups
+EDGES_CHUNK = 1 << 21
+
+_INSTANCES = {}
+
+
+def geojson_file(cc):
+    return os.path.join(GEOJSON_DIR, f"{cc}.geojson")
+
+
+def compiled_file(cc):
+    return os.path.join(COMPILED_DIR, f"{cc}.cov")
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _polygon_rings(geometry):
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        return []
+    rings = []
+    for polygon in polygons:
+        for ring in polygon:
+            if len(ring) < 3:
+                continue
+            if ring[0] != ring[-1]:
+                ring = ring + [ring[0]]
+            rings.append(np.asarray(ring, dtype=np.float64)[:, :2])
+    return rings
+
+
+def _pack_tree(boxes):
+    """
+    Sort-tile-recursive packing of the polygon bboxes
+
+    Returns the order of the polygons in the leaves, the boxes of all the nodes
+    (leaves first, root last) and the offsets of each level.
+    """
+    count = len(boxes)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    slice_count = max(1, math.ceil(math.sqrt(count / NODE_SIZE)))
+    slice_size = math.ceil(count / slice_count)
+    order = np.argsort(centers[:, 0], kind="stable")
+    for start in range(0, count, slice_size):
+        part = order[start : start + slice_size]
+        order[start : start + slice_size] = part[
+            np.argsort(centers[part, 1], kind="stable")
+        ]
+
+    levels = [boxes[order]]
+    while len(levels[-1]) > 1:
+        children = levels[-1]
+        starts = np.arange(0, len(children), NODE_SIZE)
+        levels.append(
+            np.column_stack(
+                (
+                    np.minimum.reduceat(children[:, 0], starts),
+                    np.minimum.reduceat(children[:, 1], starts),
+                    np.maximum.reduceat(children[:, 2], starts),
+                    np.maximum.reduceat(children[:, 3], starts),
+                )
+            )
+        )
+    level_offsets = np.cumsum([0] + [len(level) for level in levels])
+    return order, np.concatenate(levels), level_offsets
+
+
+def build_coverage_file(source, destination):
+    """
+    Compile a coverage geojson into the binary format above
+    """
+    with open(source, "r") as file:
+        geojson_data = json.load(file)
+
+    geod = Geod(ellps="WGS84")
+    ids, areas, boxes = [], [], []
+    polygon_rings, ring_coords, coords = [0], [0], []
+    for feature in geojson_data["features"]:
+        rings = _polygon_rings(feature["geometry"])
+        if not rings:
+            continue
+        properties = feature["properties"]
+        area = properties.get("area_m2")
+        if area is None:
+            area = abs(geod.geometry_area_perimeter(shape(feature["geometry"]))[0])
+        ids.append(properties["id"])
+        areas.append(area)
+        all_coords = np.concatenate(rings)
+        boxes.append((*all_coords.min(axis=0), *all_coords.max(axis=0)))
+        for ring in rings:
+            coords.append(ring)
+            ring_coords.append(ring_coords[-1] + len(ring))
+        polygon_rings.append(polygon_rings[-1] + len(rings))
+
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes):
+        order, nodes, level_offsets = _pack_tree(boxes)
+    else:
+        order, nodes, level_offsets = [], np.empty((0, 4)), [0]
+    total_area = geojson_data.get("total_area_m2", float(sum(areas)))
+    geojson, flag_ids, flag_offsets = _serialize_map(geojson_data)
+
+    arrays = (
+        np.asarray(ids, dtype="<i8"),
+        np.asarray(areas, dtype="<f8"),
+        np.asarray(polygon_rings, dtype="<i4"),
+        np.asarray(ring_coords, dtype="<i4"),
+        np.concatenate(coords).astype("<f4") if coords else np.empty((0, 2), "<f4"),
+        np.asarray(order, dtype="<i4"),
+        nodes.astype("<f8"),
+        np.asarray(level_offsets, dtype="<i4"),
+        np.asarray(flag_ids, dtype="<i8"),
+        np.asarray(flag_offsets, dtype="<i8"),
+    )
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    # write to a temporary file first so that other workers never map a partial file
+    tmp_path = f"{destination}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(
+            HEADER.pack(
+                MAGIC,
+                NODE_SIZE,
+                len(ids),
+                len(ring_coords) - 1,
+                len(arrays[4]),
+                len(nodes),
+                len(level_offsets) - 1,
+                len(flag_ids),
+                total_area,
+                len(geojson),
+            )
+        )
+        for array in arrays:
+            file.write(b"\0" * (_align(file.tell()) - file.tell()))
+            file.write(array.tobytes())
+        file.write(geojson)
+    os.replace(tmp_path, destination)
+
+
+def _serialize_map(geojson_data):
+    """
+    The FeatureCollection with an untraveled flag in each feature, and the id
+    and flag offset of the features having an id
+    """
+    head = json.dumps(
+        {key: value for key, value in geojson_data.items() if key != "features"},
+        separators=(",", ":"),
+    )[:-1]
+    head += ',"features":[' if len(head) > 1 else '"features":['
+
+    features, flag_ids, flag_offsets = [], [], []
+    offset = len(head)
+    for feature in geojson_data["features"]:
+        properties = {
+            key: value
+            for key, value in feature["properties"].items()
+            if key != "traveled"
+        }
+        rest = {
+            key: value
+            for key, value in feature.items()
+            if key not in ("type", "properties")
+        }
+        text = json.dumps(
+            {
+                "type": "Feature",
+                "properties": {"traveled": False, **properties},
+                **rest,
+            },
+            separators=(",", ":"),
+        )
+        if properties.get("id") is not None:
+            flag_ids.append(properties["id"])
+            flag_offsets.append(offset + len(FEATURE_START))
+        features.append(text)
+        offset += len(text) + 1  # and the comma
+
+    # json.dumps escapes the non-ASCII characters, so offsets are byte offsets
+    geojson = head + ",".join(features) + "]}"
+    return geojson.encode("ascii"), flag_ids, flag_offsets
+
+
+class CoveragePolygons:
+    def __init__(self, filename):
+        with open(filename, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{filename} is not a compiled coverage file")
+
+        (
+            _,
+            self.node_size,
+            polygon_count,
+            ring_count,
+            coord_count,
+            node_count,
+            level_count,
+            flag_count,
+            self.total_area,
+            map_size,
+        ) = HEADER.unpack_from(self._mmap)
+
+        offset = HEADER.size
+
+        def read(dtype, count, shape=None):
+            nonlocal offset
+            offset = _align(offset)
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array.reshape(shape) if shape else array
+
+        self.ids = read("<i8", polygon_count)
+        self.areas = read("<f8", polygon_count)
+        self.polygon_rings = read("<i4", polygon_count + 1)
+        self.ring_coords = read("<i4", ring_count + 1)
+        self.coords = read("<f4", coord_count * 2, (coord_count, 2))
+        self.order = read("<i4", polygon_count)
+        self.boxes = read("<f8", node_count * 4, (node_count, 4))
+        self.level_offsets = read("<i4", level_count + 1)
+        self.flag_ids = read("<i8", flag_count)
+        self.flag_offsets = read("<i8", flag_count)
+        self._map = memoryview(self._mmap)[offset : offset + map_size]
+
+        # last coordinate of each ring, edges starting there link two rings
+        self._ring_last = np.zeros(coord_count, dtype=bool)
+        self._ring_last[self.ring_coords[1:] - 1] = True
+        self._rank = None
+
+    def _candidates(self, x, y):
+        """
+        (point, polygon) pairs whose polygon bbox contains the point
+        """
+        point_idx = np.arange(len(x))
+        if len(self.boxes) == 0:
+            return point_idx[:0], point_idx[:0]
+        level = len(self.level_offsets) - 2
+        node_idx = np.full(len(x), self.level_offsets[level])
+
+        while True:
+            box = self.boxes[node_idx]
+            inside = (
+                (box[:, 0] <= x[point_idx])
+                & (x[point_idx] <= box[:, 2])
+                & (box[:, 1] <= y[point_idx])
+                & (y[point_idx] <= box[:, 3])
+            )
+            point_idx, node_idx = point_idx[inside], node_idx[inside]
+            if level == 0:
+                return point_idx, self.order[node_idx]
+
+            # expand each node into its children on the level below
+            first_child = self.level_offsets[level - 1] + self.node_size * (
+                node_idx - self.level_offsets[level]
+            )
+            child_count = (
+                np.minimum(first_child + self.node_size, self.level_offsets[level])
+                - first_child
+            )
+            starts = np.repeat(np.cumsum(child_count) - child_count, child_count)
+            point_idx = np.repeat(point_idx, child_count)
+            node_idx = np.repeat(first_child, child_count) + (
+                np.arange(len(point_idx)) - starts
+            )
+            level -= 1
+
+    def _contains(self, x, y, polygon_idx):
+        """
+        Even-odd point in polygon test of each point against its polygon
+        """
+        first = self.ring_coords[self.polygon_rings[polygon_idx]]
+        edge_count = self.ring_coords[self.polygon_rings[polygon_idx + 1]] - first - 1
+        result = np.zeros(len(x), dtype=bool)
+
+        cumulative = np.cumsum(edge_count)
+        start = 0
+        while start < len(x):
+            done = cumulative[start - 1] if start else 0
+            end = max(
+                int(np.searchsorted(cumulative, done + EDGES_CHUNK, side="right")),
+                start + 1,
+            )
+            counts = edge_count[start:end]
+            pair = np.repeat(np.arange(start, end), counts)
+            edge = first[pair] + (
+                np.arange(len(pair)) - np.repeat(np.cumsum(counts) - counts, counts)
+            )
+            valid = ~self._ring_last[edge]
+            pair, edge = pair[valid], edge[valid]
+
+            x1, y1 = self.coords[edge, 0].astype(np.float64), self.coords[edge, 1]
+            x2, y2 = (
+                self.coords[edge + 1, 0].astype(np.float64),
+                self.coords[edge + 1, 1],
+            )
+            px, py = x[pair], y[pair]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossing = ((y1 > py) != (y2 > py)) & (
+                    px < (x2 - x1) * (py - y1) / (y2 - y1) + x1
+                )
+            result[start:end] = (
+                np.bincount(pair[crossing] - start, minlength=end - start) % 2 == 1
+            )
+            start = end
+        return result
+
+    @property
+    def rank(self):
+        """
+        Rank of each polygon when several contain a point, see geopip_rank
+        """
+        if self._rank is None:
+            bounds = np.empty((len(self.ids), 4))
+            bounds[self.order] = self.boxes[: len(self.ids)]
+            self._rank = geopip_rank(bounds)
+        return self._rank
+
+    def lookup(self, lats, lngs):
+        """
+        Index of the polygon containing each point, -1 if none does
+
+        When polygons overlap, the one geopip would return wins (see rank).
+        """
+        x = np.asarray(lngs, dtype=np.float64)
+        y = np.asarray(lats, dtype=np.float64)
+        result = np.full(len(x), -1, dtype=np.int64)
+
+        point_idx, polygon_idx = self._candidates(x, y)
+        inside = self._contains(x[point_idx], y[point_idx], polygon_idx)
+        point_idx, polygon_idx = point_idx[inside], polygon_idx[inside]
+        if len(point_idx):
+            order = np.lexsort((self.rank[polygon_idx], point_idx))
+            point_idx, polygon_idx = point_idx[order], polygon_idx[order]
+            first = np.unique(point_idx, return_index=True)[1]
+            result[point_idx[first]] = polygon_idx[first]
+        return result
+
+    def search_ids(self, lats, lngs):
+        """
+        Ids of the polygons containing any of the points
+        """
+        found = self.lookup(lats, lngs)
+        return self.ids[np.unique(found[found >= 0])].tolist()
+
+    def map(self, traveled_ids):
+        """
+        Serialized FeatureCollection, with the given polygons traveled
+        """
+        geojson = bytearray(self._map)
+        traveled = np.isin(self.flag_ids, list(traveled_ids))
+        for offset in self.flag_offsets[traveled].tolist():
+            geojson[offset : offset + len(TRAVELED)] = TRAVELED
+        return bytes(geojson)
+
+    def area(self, polygon_ids):
+        """
+        Total area of the given polygons
+        """
+        return float(self.areas[np.isin(self.ids, list(polygon_ids))].sum())
+
+
+def is_compiled(cc):
+    """
+    Whether the compiled file of cc is up to date with its geojson and with the
+    format above
+    """
+    source, destination = geojson_file(cc), compiled_file(cc)
+    if not os.path.exists(destination):
+        return False
+    if os.path.getmtime(destination) < os.path.getmtime(source):
+        return False
+    with open(destination, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def instance(cc):
+    """
+    Mapped coverage polygons of cc, compiled first if the geojson is newer than
+    the compiled file (e.g. after an edit from the admin coverage editor)
+    """
+    source = geojson_file(cc)
+    destination = compiled_file(cc)
+    try:
+        compiled_mtime = os.path.getmtime(destination)
+    except FileNotFoundError:
+        compiled_mtime = None
+    if compiled_mtime is None or compiled_mtime < os.path.getmtime(source):
+        build_coverage_file(source, destination)
+        compiled_mtime = os.path.getmtime(destination)
+
+    cached = _INSTANCES.get(cc)
+    if cached is None or cached[0] != compiled_mtime:
+        try:
+            polygons = CoveragePolygons(destination)
+        except ValueError:
+            # compiled in an older format
+            build_coverage_file(source, destination)
+            compiled_mtime = os.path.getmtime(destination)
+            polygons = CoveragePolygons(destination)
+        cached = (compiled_mtime, polygons)
+        _INSTANCES[cc] = cached
+    return cached[1]
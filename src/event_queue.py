@@ -0,0 +1,138 @@
+"""
+In-process queue of events (analytics hits, audit log rows...) handled in the
+background
+
+Events are appended to a bounded buffer and handed in batches to a handler by a
+flusher thread, once batch_size events are waiting or every flush_interval
+seconds, so that the requests producing them don't wait for the HTTP calls or
+database inserts. When the handler can't keep up and the buffer is full, the
+oldest events are dropped (and counted) rather than growing the memory of the
+worker or blocking the requests. Whatever is left is flushed when the process
+exits.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from itertools import chain
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+# A warning is logged for the first dropped event, then once every this many
+DROP_LOG_INTERVAL = 1000
+
+# Guards the start of the queues in a process
+_start_lock = threading.Lock()
+
+
+def _reset_start_lock():
+    # the lock may have been held by another thread of the parent during fork
+    global _start_lock
+    _start_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_start_lock)
+
+
+class EventQueue:
+    def __init__(
+        self,
+        name,
+        handler,
+        max_size=DEFAULT_MAX_SIZE,
+        batch_size=DEFAULT_BATCH_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+    ):
+        """
+        handler is called with a list of at most batch_size events, from the
+        flusher thread (or the caller of flush)
+        """
+        self.name = name
+        self.handler = handler
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._pid = None
+        atexit.register(self.flush)
+
+    def _ensure_started(self):
+        # the queue may be created before gunicorn forks: each worker needs its
+        # own buffer, locks and flusher thread
+        if self._pid == os.getpid():
+            return
+        with _start_lock:
+            if self._pid == os.getpid():
+                return
+            self._events = deque()
+            # batch taken from the buffer and being handled
+            self._handling = []
+            self._condition = threading.Condition()
+            self._handler_lock = threading.Lock()
+            # published last, other threads only use the queue once it is set
+            self._pid = os.getpid()
+            threading.Thread(
+                target=self._run, name=f"{self.name}-flusher", daemon=True
+            ).start()
+
+    def put(self, event):
+        self._ensure_started()
+        with self._condition:
+            if len(self._events) >= self.max_size:
+                self._events.popleft()
+                self.dropped += 1
+                if self.dropped % DROP_LOG_INTERVAL == 1:
+                    logger.warning(
+                        f"{self.name} queue full, {self.dropped} events dropped so far"
+                    )
+            self._events.append(event)
+            if len(self._events) >= self.batch_size:
+                self._condition.notify()
+
+    def _take_batch(self):
+        with self._condition:
+            self._handling = [
+                self._events.popleft()
+                for _ in range(min(self.batch_size, len(self._events)))
+            ]
+            return self._handling
+
+    def _handle(self, batch):
+        try:
+            self.handler(batch)
+        except Exception as e:
+            # the events are lost, but the next batches must still be handled
+            logger.error(f"Could not handle {len(batch)} {self.name} events: {e}")
+
+    def flush(self):
+        """Handle all the waiting events in the calling thread"""
+        if self._pid != os.getpid():
+            return
+        with self._handler_lock:
+            while batch := self._take_batch():
+                self._handle(batch)
+
+    def pending(self, predicate):
+        """
+        Number of the events of this process matching predicate which are not
+        handled yet, waiting or in the batch being handled
+        """
+        if self._pid != os.getpid():
+            return 0
+        with self._condition:
+            return sum(
+                1 for event in chain(self._handling, self._events) if predicate(event)
+            )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if len(self._events) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+            self.flush()
@@ -0,0 +1,143 @@
+"""
+Local cache of the geocoder (Photon, Nominatim) responses
+
+Responses are stored in a SQLite database shared by all the workers, keyed on
+the service and its parameters (language, tags, bias point rounded to
+BIAS_PRECISION decimals...) and on the normalized query, so that a search typed
+again (by anyone, in any worker) is answered without calling the geocoder. Only
+exact queries are answered: the geocoders match whole words and deduplicate
+their results, so the results of a longer query can't be derived from those of
+a shorter one.
+"""
+
+import json
+import logging
+import sqlite3
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode
+
+from py.utils import remove_accents
+from src.sqlite_store import SQLiteStore, per_process
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "cache/geocoding.db"
+TTL = 30 * 24 * 3600
+MAX_ENTRIES = 200000
+
+# About 10 km for the search bias, 10 m for reverse geocoding
+BIAS_PRECISION = 1
+REVERSE_PRECISION = 4
+
+
+def normalize_query(query):
+    return " ".join(remove_accents(query).lower().split())
+
+
+def cache_key(service, endpoint, params):
+    """
+    (context, query) of a request, params being a list of (name, value) pairs
+    or a query string
+    """
+    if isinstance(params, str):
+        params = parse_qsl(params, keep_blank_values=True)
+    reverse = endpoint.endswith("reverse")
+    query = None
+    context_params = []
+    for name, value in params:
+        if name == "q":
+            query = normalize_query(str(value))
+        elif name in ("lat", "lon"):
+            try:
+                value = round(
+                    float(value), REVERSE_PRECISION if reverse else BIAS_PRECISION
+                )
+            except ValueError:
+                pass
+            context_params.append((name, str(value)))
+        else:
+            context_params.append((name, str(value)))
+    context = f"{service}{endpoint}?{urlencode(sorted(context_params))}"
+    return context, query or ""
+
+
+class GeocodingCache(SQLiteStore):
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS responses (
+            context TEXT NOT NULL,
+            query TEXT NOT NULL,
+            body BLOB NOT NULL,
+            created REAL NOT NULL,
+            PRIMARY KEY (context, query)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS responses_created ON responses (created)",
+    )
+
+    def __init__(self, filename=CACHE_FILE):
+        super().__init__(filename)
+
+    def get(self, context, query):
+        """
+        Cached response of the query, None if there is none
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT body FROM responses WHERE context = ? AND query = ? AND created > ?",
+                (context, query, time.time() - TTL),
+            ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def set(self, context, query, data):
+        now = time.time()
+        body = zlib.compress(json.dumps(data).encode("utf-8"))
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO responses (context, query, body, created)
+                VALUES (?, ?, ?, ?)
+                """,
+                (context, query, body, now),
+            )
+            self.conn.commit()
+            self._inserted(now)
+
+    def evict(self, now):
+        self.conn.execute("DELETE FROM responses WHERE created < ?", (now - TTL,))
+        self.evict_least_recent("responses", "created", max_entries=MAX_ENTRIES)
+
+
+@per_process
+def instance():
+    """Singleton GeocodingCache instance (lazy loading), one per process"""
+    return GeocodingCache()
+
+
+def geocode(service, endpoint, params, fetch):
+    """
+    Response of a geocoder, from the cache when possible
+
+    service is "photon" or "nominatim", params the parameters of the request
+    (list of pairs or query string) and fetch a function calling the geocoder,
+    returning the parsed response or None on failure (which is not cached).
+    """
+    context, query = cache_key(service, endpoint, params)
+    try:
+        cache = instance()
+        data = cache.get(context, query)
+        if data is not None:
+            return data
+    except sqlite3.Error as e:
+        # the cache must never prevent geocoding
+        logger.warning(f"Geocoding cache read failed: {e}")
+        cache = None
+
+    data = fetch()
+    if data is not None and cache is not None:
+        try:
+            cache.set(context, query, data)
+        except sqlite3.Error as e:
+            logger.warning(f"Geocoding cache write failed: {e}")
+    return data
@@ -0,0 +1,118 @@
+"""
+Shared HTTP client for the upstream services (routers, geocoders, tile servers,
+FR24...)
+
+All the requests of a process go through one requests.Session, which keeps a
+pool of keep-alive connections per host, so repeated calls to the same service
+skip the TCP and TLS handshakes. Failed requests are retried within a per-host
+retry budget: retries are limited to a share of the recent requests of the host,
+so an upstream that is down doesn't receive a multiple of the normal traffic.
+"""
+
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Hosts with an open pool, and connections kept per host
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 16
+
+# (connect, read) timeouts in seconds, used when the caller gives none
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Statuses worth retrying, the others won't change on a second try
+RETRY_STATUSES = {502, 503, 504}
+RETRY_BACKOFF = 0.1
+
+# Each request earns RETRY_RATIO retries, up to RETRY_BUDGET_MAX saved up.
+# The budget refills with the requests, plus RETRY_MIN_PER_SECOND over time so
+# that rarely used hosts can still retry.
+RETRY_RATIO = 0.1
+RETRY_BUDGET_MAX = 10
+RETRY_MIN_PER_SECOND = 0.5
+
+_SESSION = None
+
+
+class RetryBudget:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._balances = {}
+
+    def _balance(self, host, now):
+        balance, updated = self._balances.get(host, (RETRY_BUDGET_MAX, now))
+        return min(RETRY_BUDGET_MAX, balance + (now - updated) * RETRY_MIN_PER_SECOND)
+
+    def deposit(self, host):
+        now = time.monotonic()
+        with self._lock:
+            balance = min(RETRY_BUDGET_MAX, self._balance(host, now) + RETRY_RATIO)
+            self._balances[host] = (balance, now)
+
+    def withdraw(self, host):
+        """Take one retry from the budget of the host, False if it is spent"""
+        now = time.monotonic()
+        with self._lock:
+            balance = self._balance(host, now)
+            if balance < 1:
+                self._balances[host] = (balance, now)
+                return False
+            self._balances[host] = (balance - 1, now)
+            return True
+
+
+retry_budget = RetryBudget()
+
+
+def session():
+    """Process-wide pooled session (lazy loading, recreated after a fork)"""
+    global _SESSION
+    if _SESSION is None or _SESSION[0] != os.getpid():
+        s = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0
+        )
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        _SESSION = (os.getpid(), s)
+    return _SESSION[1]
+
+
+def request(method, url, timeout=DEFAULT_TIMEOUT, retries=1, **kwargs):
+    """
+    Send a request through the pooled session
+
+    Connection errors, timeouts and RETRY_STATUSES are retried up to retries
+    times, as long as the retry budget of the host allows it. The last response
+    is returned, or the last exception raised, like requests.request would.
+    """
+    host = urlsplit(url).netloc
+    retry_budget.deposit(host)
+    attempt = 0
+    while True:
+        try:
+            response = session().request(method, url, timeout=timeout, **kwargs)
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            error = None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            response, error = None, e
+
+        if attempt >= retries or not retry_budget.withdraw(host):
+            if error is not None:
+                raise error
+            return response
+        attempt += 1
+        time.sleep(RETRY_BACKOFF * attempt)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
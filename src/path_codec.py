@@ -0,0 +1,54 @@
+import json
+import zlib
+
+import numpy as np
+
+# Binary paths start with this header so they can be told apart from the legacy
+# text format (str([[lat, lng], ...])) that older rows still contain.
+MAGIC = b"TLP1"
+
+# Coordinates are stored as fixed point integers with 1e-6 degree precision
+# (about 11 cm), which is more than enough for any path we store.
+SCALE = 1_000_000
+
+
+def is_encoded(value):
+    """
+    Return True if the value read from the paths table uses the binary format
+    """
+    return isinstance(value, (bytes, memoryview)) and bytes(value[:4]) == MAGIC
+
+
+def encode_path(path):
+    """
+    Encode a path ([[lat, lng], ...] or [{"lat": x, "lng": y}, ...]) as bytes.
+
+    Layout: MAGIC followed by the zlib compressed little-endian int32 deltas
+    between consecutive (lat, lng) pairs, the first pair being stored as is.
+    """
+    if path and isinstance(path[0], dict):
+        path = [[node["lat"], node["lng"]] for node in path]
+
+    coords = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+    fixed = np.rint(coords * SCALE).astype(np.int64)
+    deltas = np.diff(fixed, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+
+    return MAGIC + zlib.compress(deltas.astype("<i4").tobytes())
+
+
+def decode_path(value):
+    """
+    Decode a path read from the paths table into [[lat, lng], ...]
+
+    Both the binary format and the legacy JSON text are supported, so callers
+    don't need to know whether the row has been migrated yet.
+    """
+    if value is None:
+        return []
+    if is_encoded(value):
+        raw = zlib.decompress(bytes(value[len(MAGIC) :]))
+        deltas = np.frombuffer(raw, dtype="<i4").reshape(-1, 2)
+        return (np.cumsum(deltas, axis=0, dtype=np.int64) / SCALE).tolist()
+    if isinstance(value, (bytes, memoryview)):
+        value = bytes(value).decode("utf-8")
+    return json.loads(value)
@@ -1,3 +1,134 @@
+import numpy as np
+from shapely.geometry import LineString, MultiPoint
+
+from src.path_codec import encode_path
+
+# Same earth radius as py.utils.getDistance, so lengths match trip_length
+EARTH_RADIUS = 6373000.0
+
+# Tolerance (in degrees) used to simplify the stored hull
+HULL_TOLERANCE = 0.01
+
+SUMMARY_COLUMNS = (
+    "node_count",
+    "length",
+    "min_lat",
+    "max_lat",
+    "min_lng",
+    "max_lng",
+    "first_lat",
+    "first_lng",
+    "last_lat",
+    "last_lng",
+    "hull",
+)
+
+# Douglas-Peucker tolerances (in degrees) of the simplified copies stored for each
+# path, from the finest to the coarsest
+RESOLUTIONS = {
+    "high": 0.0001,
+    "medium": 0.001,
+    "low": 0.01,
+}
+
+SIMPLIFIED_COLUMNS = tuple(f"path_{resolution}" for resolution in RESOLUTIONS)
+
+# All the columns of the paths table computed from the path itself
+DERIVED_COLUMNS = SUMMARY_COLUMNS + SIMPLIFIED_COLUMNS
+
+
+def path_length(coords):
+    """
+    Great-circle length in meters of an (n, 2) array of [lat, lng]
+    """
+    if len(coords) < 2:
+        return 0.0
+    lat = np.radians(coords[:, 0])
+    lng = np.radians(coords[:, 1])
+    a = (
+        np.sin(np.diff(lat) / 2) ** 2
+        + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2
+    )
+    return float(np.sum(2 * EARTH_RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))))
+
+
+def path_hull(coords):
+    """
+    Simplified convex hull of the path, as [[lat, lng], ...]
+    """
+    hull = MultiPoint(coords[:, ::-1]).convex_hull.simplify(HULL_TOLERANCE)
+    if hull.geom_type == "Polygon":
+        hull = hull.exterior
+    return [[lat, lng] for lng, lat in hull.coords]
+
+
+def path_summary(path):
+    """
+    Compute the geometry summary stored alongside each path in path.db
+
+    Accepts [[lat, lng], ...] and returns a dict keyed by SUMMARY_COLUMNS.
+    """
+    if not path:
+        return {**dict.fromkeys(SUMMARY_COLUMNS), "node_count": 0}
+
+    coords = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+    return {
+        "node_count": len(coords),
+        "length": path_length(coords),
+        "min_lat": float(coords[:, 0].min()),
+        "max_lat": float(coords[:, 0].max()),
+        "min_lng": float(coords[:, 1].min()),
+        "max_lng": float(coords[:, 1].max()),
+        "first_lat": float(coords[0, 0]),
+        "first_lng": float(coords[0, 1]),
+        "last_lat": float(coords[-1, 0]),
+        "last_lng": float(coords[-1, 1]),
+        "hull": encode_path(path_hull(coords)),
+    }
+
+
+def path_simplifications(path):
+    """
+    Simplified copies of the path, as a dict keyed by SIMPLIFIED_COLUMNS
+
+    A level is only stored if it has fewer nodes than the finer one, otherwise
+    it is None and readers fall back to the finer level (see resolution_column).
+    """
+    simplifications = dict.fromkeys(SIMPLIFIED_COLUMNS)
+    if len(path) < 3:
+        return simplifications
+
+    line = LineString([(lat, lng) for lat, lng in path])
+    node_count = len(path)
+    for resolution, tolerance in RESOLUTIONS.items():
+        simplified = line.simplify(tolerance, preserve_topology=False)
+        if len(simplified.coords) < node_count:
+            simplifications[f"path_{resolution}"] = encode_path(list(simplified.coords))
+            node_count = len(simplified.coords)
+    return simplifications
+
+
+def derive_path_columns(path):
+    """
+    Values of all the DERIVED_COLUMNS for the path ([[lat, lng], ...])
+    """
+    return {**path_summary(path), **path_simplifications(path)}
+
+
+def resolution_column(resolution):
+    """
+    SQL expression reading the path at the given resolution ("full" or one of
+    RESOLUTIONS), falling back to the closest finer level stored
+    """
+    if resolution in (None, "full"):
+        return "path"
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Invalid resolution: {resolution}")
+    names = list(RESOLUTIONS)
+    finer = names[: names.index(resolution) + 1][::-1]
+    return "COALESCE({}, path)".format(", ".join(f"path_{r}" for r in finer))
+
+
 class Node:
     def __init__(self, trip_id, node_order, lat, lng):
         self.trip_id = trip_id
@@ -22,10 +153,16 @@ class Path:
             self.list.append(new_node)
 
     def keys(self):
-        return ("trip_id", "path")
+        return ("trip_id", "path") + DERIVED_COLUMNS
 
     def values(self):
-        return [self.list[0].trip_id, str([[node.lat, node.lng] for node in self.list])]
+        coords = [[node.lat, node.lng] for node in self.list]
+        derived = derive_path_columns(coords)
+        return [
+            self.list[0].trip_id,
+            encode_path(coords),
+            *(derived[column] for column in DERIVED_COLUMNS),
+        ]
     
     def __len__(self):
         return len(self.list)
@@ -0,0 +1,307 @@
+"""
+Trigram indexes of the airports and train stations, for the autocompletes
+
+Each place is stored in an FTS5 table with the trigram tokenizer, its names
+and codes lowercased and without diacritics, next to a popularity (number of
+trips from or to the place). Queries of 3 characters or more are looked up in
+the index instead of scanning the whole table with LIKE '%x%', and matches of
+the same relevance are ranked by popularity.
+
+The indexes are built at startup, and checked again in the background after
+the first search of each day of every worker: they are rebuilt when their
+source table changed or when they are a day old, to refresh the popularities.
+The documents are built before taking the write lock on the database, which is
+only held to replace the index.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+from collections import Counter
+from datetime import date
+
+from py.db_init import table_exists
+from src.consts import DbNames
+from src.trip_search import MIN_INDEXED_LENGTH, fold
+from src.utils import mainConn, managed_cursor
+
+logger = logging.getLogger(__name__)
+
+RESULTS = 10
+
+# Day of the last check of the indexes by this process
+_checked_on = None
+_check_lock = threading.Lock()
+
+# Airports are saved in the flights as "<flag> <name> (<IATA>)"
+AIRPORT_LABEL = re.compile(r"\(([A-Z0-9]{3})\)\s*$")
+
+AIRPORT_SEARCH = """
+    SELECT airports.* FROM airport_search
+    JOIN airports ON airports.rowid = airport_search.rowid
+    WHERE airport_search MATCH :match
+    ORDER BY
+        airport_search.iata LIKE :pattern DESC,
+        airport_search.ident LIKE :pattern DESC,
+        airport_search.popularity DESC
+    LIMIT :limit
+"""
+
+TRAIN_STATION_SEARCH = """
+    SELECT train_stations.* FROM train_station_search
+    JOIN train_stations ON train_stations.id = train_station_search.rowid
+    WHERE train_station_search MATCH :match
+    ORDER BY
+        CASE
+            WHEN train_station_search.processed_name LIKE :start THEN 1
+            WHEN train_station_search.processed_name LIKE :pattern THEN 2
+            WHEN train_station_search.name LIKE :start THEN 3
+            WHEN train_station_search.name LIKE :pattern THEN 4
+            WHEN train_station_search.latin_city LIKE :start THEN 5
+            WHEN train_station_search.latin_city LIKE :pattern THEN 6
+            WHEN train_station_search.city LIKE :start THEN 7
+            WHEN train_station_search.city LIKE :pattern THEN 8
+            ELSE 10
+        END,
+        train_station_search.popularity DESC
+    LIMIT :limit
+"""
+
+
+def _popularity(cursor, trip_types):
+    """Number of trips from or to each station name"""
+    placeholders = ", ".join("?" * len(trip_types))
+    cursor.execute(
+        f"""
+        SELECT name, COUNT(*) AS trips FROM (
+            SELECT origin_station AS name FROM trip WHERE type IN ({placeholders})
+            UNION ALL
+            SELECT destination_station FROM trip WHERE type IN ({placeholders})
+        )
+        GROUP BY name
+        """,
+        (*trip_types, *trip_types),
+    )
+    return cursor.fetchall()
+
+
+def _airport_documents(cursor):
+    popularity = Counter()
+    for row in _popularity(cursor, ("air", "helicopter")):
+        match = AIRPORT_LABEL.search(row["name"] or "")
+        if match:
+            popularity[match.group(1)] += row["trips"]
+    cursor.execute("SELECT rowid, iata, ident, name, city FROM airports")
+    return [
+        (
+            row["rowid"],
+            fold(row["iata"]),
+            fold(row["ident"]),
+            fold(row["name"]),
+            fold(row["city"]),
+            popularity[row["iata"]],
+        )
+        for row in cursor.fetchall()
+    ]
+
+
+def _train_station_documents(cursor):
+    popularity = {row["name"]: row["trips"] for row in _popularity(cursor, ("train",))}
+    cursor.execute(
+        "SELECT id, name, latin_name, city, latin_city, processed_name FROM train_stations"
+    )
+    return [
+        (
+            row["id"],
+            fold(row["name"]),
+            fold(row["latin_name"]),
+            fold(row["city"]),
+            fold(row["latin_city"]),
+            fold(row["processed_name"]),
+            popularity.get(row["name"], 0),
+        )
+        for row in cursor.fetchall()
+    ]
+
+
+# index table: (source table, id column, indexed columns, documents function)
+INDEXES = {
+    "airport_search": (
+        "airports",
+        "rowid",
+        ("iata", "ident", "name", "city"),
+        _airport_documents,
+    ),
+    "train_station_search": (
+        "train_stations",
+        "id",
+        ("name", "latin_name", "city", "latin_city", "processed_name"),
+        _train_station_documents,
+    ),
+}
+
+
+def build_indexes():
+    """(Re)build the indexes whose source table changed, or which are a day old"""
+    global _checked_on
+    _checked_on = date.today()
+    # own connection, so that the transaction isn't shared with the requests
+    conn = sqlite3.connect(DbNames.MAIN_DB.value, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        _build_indexes(conn)
+    finally:
+        conn.close()
+
+
+def _signature(cursor, index, table, id_column):
+    """Current signature of the source table of the index, and the stored one"""
+    count, last = cursor.execute(
+        f"SELECT COUNT(*), MAX({id_column}) FROM {table}"
+    ).fetchone()
+    row = cursor.execute(
+        "SELECT signature FROM place_search_meta WHERE name = ?", (index,)
+    ).fetchone()
+    return (
+        f"{count}:{last}:{date.today().isoformat()}",
+        row["signature"] if row is not None else None,
+    )
+
+
+def _build_indexes(conn):
+    with managed_cursor(conn) as cursor:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS place_search_meta (name TEXT PRIMARY KEY, signature TEXT)"
+        )
+        conn.commit()
+        for index, (table, id_column, columns, documents) in INDEXES.items():
+            if not table_exists(cursor, table):
+                continue
+            signature, stored = _signature(cursor, index, table, id_column)
+            if stored == signature:
+                continue
+            rows = documents(cursor)
+
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # the workers starting together build each index once
+                signature, stored = _signature(cursor, index, table, id_column)
+                if stored == signature:
+                    conn.rollback()
+                    continue
+                cursor.execute(f"DROP TABLE IF EXISTS {index}")
+                cursor.execute(
+                    f"""
+                    CREATE VIRTUAL TABLE {index} USING fts5(
+                        {", ".join(columns)}, popularity UNINDEXED, tokenize = 'trigram'
+                    )
+                    """
+                )
+                cursor.executemany(
+                    f"INSERT INTO {index} (rowid, {', '.join(columns)}, popularity) "
+                    f"VALUES (?, {', '.join('?' * len(columns))}, ?)",
+                    rows,
+                )
+                cursor.execute(
+                    "INSERT OR REPLACE INTO place_search_meta (name, signature) VALUES (?, ?)",
+                    (index, signature),
+                )
+                conn.commit()
+                logger.info(f"Built the {index} index ({len(rows)} places)")
+            except Exception:
+                conn.rollback()
+                raise
+
+
+def reindex_train_station(station_id):
+    """Update the index after an edit of a train station"""
+    with managed_cursor(mainConn) as cursor:
+        if not table_exists(cursor, "train_station_search"):
+            return
+        popularity = cursor.execute(
+            "SELECT popularity FROM train_station_search WHERE rowid = ?", (station_id,)
+        ).fetchone()
+        cursor.execute(
+            "DELETE FROM train_station_search WHERE rowid = ?", (station_id,)
+        )
+        station = cursor.execute(
+            """
+            SELECT id, name, latin_name, city, latin_city, processed_name
+            FROM train_stations WHERE id = ?
+            """,
+            (station_id,),
+        ).fetchone()
+        if station is not None:
+            cursor.execute(
+                """
+                INSERT INTO train_station_search
+                (rowid, name, latin_name, city, latin_city, processed_name, popularity)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    station["id"],
+                    *(fold(value) for value in tuple(station)[1:]),
+                    popularity[0] if popularity else 0,
+                ),
+            )
+    mainConn.commit()
+
+
+def _refresh_indexes():
+    try:
+        build_indexes()
+    except sqlite3.Error as e:
+        # the current indexes still answer the searches
+        logger.warning(f"Could not refresh the place indexes: {e}")
+
+
+def _refresh():
+    """Check the indexes in the background on the first search of the day"""
+    global _checked_on
+    with _check_lock:
+        if _checked_on == date.today():
+            return
+        _checked_on = date.today()
+    threading.Thread(target=_refresh_indexes, daemon=True).start()
+
+
+def _match(query):
+    return '"' + query.replace('"', '""') + '"'
+
+
+def search_airports(query):
+    """Airports matching the query, None when it is too short for the index"""
+    query = fold(query)
+    if len(query) < MIN_INDEXED_LENGTH:
+        return None
+    _refresh()
+    with managed_cursor(mainConn) as cursor:
+        if not table_exists(cursor, "airport_search"):
+            return None
+        cursor.execute(
+            AIRPORT_SEARCH,
+            {"match": _match(query), "pattern": f"%{query}%", "limit": RESULTS},
+        )
+        return [dict(airport) for airport in cursor.fetchall()]
+
+
+def search_train_stations(query):
+    """Train stations matching the query, None when it is too short for the index"""
+    query = fold(query)
+    if len(query) < MIN_INDEXED_LENGTH:
+        return None
+    _refresh()
+    with managed_cursor(mainConn) as cursor:
+        if not table_exists(cursor, "train_station_search"):
+            return None
+        cursor.execute(
+            TRAIN_STATION_SEARCH,
+            {
+                "match": _match(query),
+                "start": f"{query}%",
+                "pattern": f"%{query}%",
+                "limit": RESULTS,
+            },
+        )
+        return [dict(station) for station in cursor.fetchall()]
@@ -1,11 +1,80 @@
 # src/routing.py
-import requests
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 from flask import make_response
 
 # Import these from wherever they currently live in your project
 # Adjust imports to match your structure.
-from py.utils import getCountryFromCoordinates          # example
+from py import country_index
 from src.graphhopper import convert_graphhopper_to_osrm     # example
+from src import http_client, routing_cache
+
+
+# The bus routers are queried concurrently, the preferred one wins if it gives a
+# valid route before the deadline
+BUS_ROUTER_DEADLINE = 8
+_bus_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="bus-router")
+
+
+def _fetch_bus_route(url):
+    """
+    (response, data, valid) of a bus router, valid is False when it gave no
+    route, response and data are None when it could not be reached
+    """
+    try:
+        response = http_client.get(url, timeout=BUS_ROUTER_DEADLINE, retries=0)
+        data = response.json()
+    except Exception:
+        return None, None, False
+    valid = response.status_code == 200 and data.get("status") != "NoRoute"
+    return response, data, valid
+
+
+def _dispatch_bus_routers(urls):
+    """
+    Query the bus routers (by order of preference) concurrently
+
+    Returns the index and result of the most preferred valid route as soon as
+    all the routers before it have failed, or the best valid route received
+    before the deadline. The index is None when no router gave a route, the
+    result is then the answer of the last router, if any.
+    """
+    futures = {_bus_executor.submit(_fetch_bus_route, url): i for i, url in enumerate(urls)}
+    results = [None] * len(urls)
+    pending = set(futures)
+    deadline = time.monotonic() + BUS_ROUTER_DEADLINE
+    while pending:
+        done, pending = wait(
+            pending,
+            timeout=max(0, deadline - time.monotonic()),
+            return_when=FIRST_COMPLETED,
+        )
+        if not done:
+            break
+        for future in done:
+            results[futures[future]] = future.result()
+        for i, result in enumerate(results):
+            if result is None:
+                # a preferred router is still working on it
+                break
+            if result[2]:
+                return i, result
+
+    for i, result in enumerate(results):
+        if result is not None and result[2]:
+            return i, result
+    return None, results[-1] or (None, None, False)
+
+
+def _cached_response(kind, status, body):
+    """Rebuild the return value of forward_routing_core from a cached entry"""
+    if kind == "response":
+        return make_response(json.loads(body), status)
+    if kind == "json":
+        return json.loads(body)
+    return body
 
 
 def forward_routing_core(routingType, path, flask_request):
@@ -14,13 +83,33 @@ def forward_routing_core(routingType, path, flask_request):
         routingType = "train"
 
     radiuses = None
-    use_new_router = False  # defined for all paths
+    use_new_router = (
+        routingType == "train"
+        and flask_request.args.get("use_new_router", "false").lower() == "true"
+    )
+
+    # Build args from incoming request
+    args = flask_request.query_string.decode("utf-8") if flask_request.query_string else ""
+    # remove use_new_router=true from forwarded query string
+    args = (
+        args.replace("&use_new_router=true", "")
+            .replace("use_new_router=true&", "")
+            .replace("use_new_router=true", "")
+    ).strip("&")
+
+    # Same router, profile, waypoints and options: serve the stored response
+    cache = routing_cache.instance()
+    key = routing_cache.cache_key(
+        f"{routingType}:{'new' if use_new_router else 'default'}", path, args
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        return _cached_response(*cached)
 
     # Determine base URL + (optional) return_code for bus
     return_code = None
 
     if routingType == "train":
-        use_new_router = flask_request.args.get("use_new_router", "false").lower() == "true"
         base = "https://openrailrouting.maahl.net" if use_new_router else "http://routing.trainlog.me:5000"
 
     elif routingType == "ferry":
@@ -77,34 +166,23 @@ def forward_routing_core(routingType, path, flask_request):
             for coord in path.replace("route/v1/driving/", "").split(";")
         ]
 
-        countries = []
-        for wp in coord_pairs:
-            try:
-                countries.append(getCountryFromCoordinates(wp["lat"], wp["lng"])["countryCode"])
-            except Exception:
-                countries.append("UN")
-
-        unique_countries = set(countries)
+        # Country of all the waypoints at once
+        countries = country_index.instance().lookup_codes(
+            [wp["lat"] for wp in coord_pairs], [wp["lng"] for wp in coord_pairs]
+        )
+        unique_countries = {country or "UN" for country in countries}
 
-        base, return_code = routers["fallback"]
+        # Candidate routers by order of preference, with their return code
+        bus_routers = [routers["fallback"]]
         for group in routing_groups:
             if unique_countries.issubset(group["countries"]):
-                base, return_code = group["router"]
+                bus_routers = [group["router"], (routers["fallback"][0], 235)]
                 break
 
     else:
         # Optional: make unknown routing types explicit
         return make_response({"error": f"Unsupported routingType: {routingType}"}, 400)
 
-    # Build args from incoming request
-    args = flask_request.query_string.decode("utf-8") if flask_request.query_string else ""
-    # remove use_new_router=true from forwarded query string
-    args = (
-        args.replace("&use_new_router=true", "")
-            .replace("use_new_router=true&", "")
-            .replace("use_new_router=true", "")
-    ).strip("&")
-
     def build_url(base_url):
         q = f"?{args}" if args else ""
         full_url = f"{base_url}/{path}{q}"
@@ -129,26 +207,33 @@ def forward_routing_core(routingType, path, flask_request):
             full_url += f"&radiuses={radiuses}"
         return full_url
 
-    # Behavior per type
+    # Behavior per type, only successful router responses are cached
     if routingType == "bus":
-        routers_fallback_base = "https://routing.openstreetmap.de/routed-car"
-        try:
-            response = requests.get(build_url(base), timeout=5)
-            if response.status_code != 200:
-                raise Exception("Non-200 response")
-
-            data = response.json()
-            if data.get("status") == "NoRoute":
-                raise Exception("Router responded with NoRoute")
-
-            return make_response(data, return_code)
-        except Exception as e:
-            fallback_url = build_url(routers_fallback_base)
-            return make_response(requests.get(fallback_url).json(), 235)
+        winner, (response, data, valid) = _dispatch_bus_routers(
+            [build_url(bus_base) for bus_base, _ in bus_routers]
+        )
+        if winner is None:
+            if data is None:
+                return make_response(
+                    {"code": "NoRoute", "message": "No bus router answered"}, 502
+                )
+            # the answer of the fallback after a failure is 235, as it always
+            # was, even when the fallback was the only router queried
+            return make_response(data, 235)
+
+        return_code = bus_routers[winner][1]
+        cache.set(key, "response", return_code, response.text)
+        return make_response(data, return_code)
 
     if routingType == "train" and use_new_router:
-        gh_json = requests.get(build_gh_url(base), timeout=10).json()
-        return convert_graphhopper_to_osrm(gh_json)
+        response = http_client.get(build_gh_url(base), timeout=10)
+        osrm_json = convert_graphhopper_to_osrm(response.json())
+        if response.status_code == 200:
+            cache.set(key, "json", 200, json.dumps(osrm_json))
+        return osrm_json
 
     # All other types: just proxy text
-    return requests.get(build_url(base), timeout=10).text
+    response = http_client.get(build_url(base), timeout=10)
+    if response.status_code == 200:
+        cache.set(key, "text", 200, response.text)
+    return response.text
@@ -0,0 +1,151 @@
+"""
+Persistent cache of the router responses of forward_routing_core
+
+Responses are stored compressed in a SQLite database shared by all the workers,
+keyed on the normalized router, the profile, the waypoints rounded to
+COORDINATE_PRECISION decimals and the forwarded options. Entries expire after
+ttl seconds, and the least recently used ones are evicted once the cache grows
+over max_size bytes. Both can be set in the optional routing_cache section of
+config.yaml.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import time
+import zlib
+
+from py.utils import load_config
+from src.sqlite_store import SQLiteStore, per_process
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "cache/routing.db"
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+# 5 decimals is about 1 m, routers snap waypoints much further than that
+COORDINATE_PRECISION = 5
+
+# Don't rewrite the access time of entries used this recently
+ACCESS_RESOLUTION = 60
+
+
+def quantize_coordinates(coordinates):
+    """
+    "lng,lat;lng,lat" waypoints of an OSRM path with rounded coordinates
+    """
+    waypoints = []
+    for waypoint in coordinates.split(";"):
+        try:
+            lng, lat = waypoint.split(",")
+            waypoint = (
+                f"{round(float(lng), COORDINATE_PRECISION)},"
+                f"{round(float(lat), COORDINATE_PRECISION)}"
+            )
+        except ValueError:
+            pass
+        waypoints.append(waypoint)
+    return ";".join(waypoints)
+
+
+def cache_key(router, path, args):
+    """
+    Key of a routing request: the router, the path with quantized waypoints
+    (e.g. route/v1/driving/2.35,48.85;4.83,45.76) and the forwarded options
+    """
+    prefix, _, coordinates = path.rpartition("/")
+    options = "&".join(sorted(arg for arg in args.split("&") if arg))
+    normalized = f"{router}|{prefix}/{quantize_coordinates(coordinates)}|{options}"
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class RoutingCache(SQLiteStore):
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS routes (
+            key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS routes_accessed ON routes (accessed)",
+    )
+
+    def __init__(self, filename=CACHE_FILE, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        super().__init__(filename)
+        self.ttl = ttl
+        self.max_size = max_size
+
+    def get(self, key):
+        """
+        (kind, status, body) of a cached response, None if there is none
+        """
+        try:
+            return self._get(key)
+        except sqlite3.Error as e:
+            # the cache must never prevent routing
+            logger.warning(f"Routing cache read failed: {e}")
+            return None
+
+    def set(self, key, kind, status, body):
+        try:
+            self._set(key, kind, status, body)
+        except sqlite3.Error as e:
+            logger.warning(f"Routing cache write failed: {e}")
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT kind, status, body, created, accessed FROM routes WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            kind, status, body, created, accessed = row
+            if now - created > self.ttl:
+                return None
+            if now - accessed > ACCESS_RESOLUTION:
+                self.conn.execute(
+                    "UPDATE routes SET accessed = ? WHERE key = ?", (now, key)
+                )
+                self.conn.commit()
+        return kind, status, zlib.decompress(body).decode("utf-8")
+
+    def _set(self, key, kind, status, body):
+        now = time.time()
+        compressed = zlib.compress(body.encode("utf-8"))
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO routes
+                (key, kind, status, body, size, created, accessed)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, kind, status, compressed, len(compressed), now, now),
+            )
+            self.conn.commit()
+            self._inserted(now)
+
+    def evict(self, now):
+        """
+        Remove the expired entries, then the least recently used ones beyond
+        max_size
+        """
+        self.conn.execute("DELETE FROM routes WHERE created < ?", (now - self.ttl,))
+        self.evict_least_recent("routes", "accessed", max_size=self.max_size)
+
+
+@per_process
+def instance():
+    """Singleton RoutingCache instance (lazy loading), one per process"""
+    config = load_config().get("routing_cache") or {}
+    return RoutingCache(
+        ttl=config.get("ttl", DEFAULT_TTL),
+        max_size=config.get("max_size", DEFAULT_MAX_SIZE),
+    )
@@ -6,12 +6,15 @@ INSERT INTO denied_logins (
     ip_details,
     details,
     timestamp
-) VALUES (
-    :type,
-    :username,
-    :from_ip,
-    :ip_country,
-    :ip_details,
-    :details,
-    :timestamp
-)
+) VALUES
+{% for i in range(rows) %}
+(
+    :type_{{ i }},
+    :username_{{ i }},
+    :from_ip_{{ i }},
+    :ip_country_{{ i }},
+    :ip_details_{{ i }},
+    :details_{{ i }},
+    :timestamp_{{ i }}
+){% if not loop.last %},{% endif %}
+{% endfor %}
@@ -5,13 +5,18 @@ INSERT INTO suspicious_activity (
     details,
     from_ip,
     ip_country,
-    ip_details
-) VALUES (
-    :url,
-    :type,
-    :offending_part,
-    :details,
-    :from_ip,
-    :ip_country,
-    :ip_details
-)
+    ip_details,
+    timestamp
+) VALUES
+{% for i in range(rows) %}
+(
+    :url_{{ i }},
+    :type_{{ i }},
+    :offending_part_{{ i }},
+    :details_{{ i }},
+    :from_ip_{{ i }},
+    :ip_country_{{ i }},
+    :ip_details_{{ i }},
+    :timestamp_{{ i }}
+){% if not loop.last %},{% endif %}
+{% endfor %}
@@ -0,0 +1,173 @@
+"""
+Flask-Caching backend shared by the gunicorn workers, without a cache server
+
+Values are pickled into a SQLite database in WAL mode: every write is an atomic
+transaction, readers never block the writer, and all the workers (and restarts)
+see the same entries. Expired entries are pruned, then the oldest ones, once the
+cache holds more than CACHE_THRESHOLD entries or CACHE_SQLITE_MAX_SIZE bytes.
+
+Configured with CACHE_TYPE = "src.sqlite_cache.SQLiteCache".
+"""
+
+import logging
+import pickle
+import sqlite3
+import time
+
+from flask_caching.backends.base import BaseCache
+
+from src.sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "cache/flask_cache.db"
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+class SQLiteCache(BaseCache, SQLiteStore):
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            expires REAL NOT NULL,
+            stored REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS cache_stored ON cache (stored)",
+    )
+
+    def __init__(
+        self,
+        filename=CACHE_FILE,
+        threshold=500,
+        max_size=DEFAULT_MAX_SIZE,
+        default_timeout=300,
+        ignore_errors=False,
+    ):
+        BaseCache.__init__(self, default_timeout)
+        SQLiteStore.__init__(self, filename)
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ignore_errors = ignore_errors
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(
+            dict(
+                filename=config.get("CACHE_SQLITE_FILE", CACHE_FILE),
+                threshold=config["CACHE_THRESHOLD"],
+                max_size=config.get("CACHE_SQLITE_MAX_SIZE", DEFAULT_MAX_SIZE),
+                ignore_errors=config["CACHE_IGNORE_ERRORS"],
+            )
+        )
+        return cls(*args, **kwargs)
+
+    def _expires(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        # 0 means the entry never expires
+        return time.time() + timeout if timeout > 0 else 0
+
+    def _execute(self, query, params=(), commit=False):
+        with self._lock:
+            cursor = self.conn.execute(query, params)
+            rows = cursor.fetchall()
+            if commit:
+                self.conn.commit()
+            return rows, cursor.rowcount
+
+    def evict(self, now):
+        self.conn.execute(
+            "DELETE FROM cache WHERE expires != 0 AND expires <= ?", (now,)
+        )
+        self.evict_least_recent(
+            "cache", "stored", max_size=self.max_size, max_entries=self.threshold
+        )
+
+    def _write(self, key, value, timeout, replace):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        try:
+            if replace:
+                self._execute(
+                    """
+                    INSERT OR REPLACE INTO cache (key, value, size, expires, stored)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (key, value, len(value), self._expires(timeout), now),
+                    commit=True,
+                )
+                written = True
+            else:
+                # an expired entry doesn't prevent adding the key
+                _, written = self._execute(
+                    """
+                    INSERT INTO cache (key, value, size, expires, stored)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        value = excluded.value,
+                        size = excluded.size,
+                        expires = excluded.expires,
+                        stored = excluded.stored
+                    WHERE cache.expires != 0 AND cache.expires <= ?
+                    """,
+                    (key, value, len(value), self._expires(timeout), now, now),
+                    commit=True,
+                )
+                written = written > 0
+        except sqlite3.Error as e:
+            if not self.ignore_errors:
+                logger.warning(f"Cache write failed: {e}")
+            return False
+
+        try:
+            with self._lock:
+                self._inserted(now)
+        except sqlite3.Error as e:
+            logger.warning(f"Cache pruning failed: {e}")
+        return written
+
+    def get(self, key):
+        try:
+            rows, _ = self._execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)",
+                (key, time.time()),
+            )
+            return pickle.loads(rows[0][0]) if rows else None
+        except (sqlite3.Error, pickle.PickleError) as e:
+            if not self.ignore_errors:
+                logger.warning(f"Cache read failed: {e}")
+            return None
+
+    def set(self, key, value, timeout=None):
+        return self._write(key, value, timeout, replace=True)
+
+    def add(self, key, value, timeout=None):
+        return self._write(key, value, timeout, replace=False)
+
+    def delete(self, key):
+        try:
+            _, count = self._execute(
+                "DELETE FROM cache WHERE key = ?", (key,), commit=True
+            )
+            return count > 0
+        except sqlite3.Error:
+            return False
+
+    def has(self, key):
+        try:
+            rows, _ = self._execute(
+                "SELECT 1 FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)",
+                (key, time.time()),
+            )
+            return bool(rows)
+        except sqlite3.Error:
+            return False
+
+    def clear(self):
+        try:
+            self._execute("DELETE FROM cache", commit=True)
+            return True
+        except sqlite3.Error:
+            return False
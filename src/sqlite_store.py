@@ -0,0 +1,104 @@
+"""
+Base of the SQLite databases shared by the workers as caches (see
+src/sqlite_cache.py, src/routing_cache.py, src/geocoding_cache.py and
+src/tile_store.py)
+
+A store has one connection per process, in WAL mode so that readers never block
+the writer, and with synchronous=NORMAL since losing the last writes of a cache
+on a power failure only costs cache misses. The threads of a process share the
+connection under a lock, and the store evicts its expired or extra entries once
+every EVICTION_INTERVAL insertions of the process.
+"""
+
+import functools
+import os
+import sqlite3
+import threading
+
+
+def per_process(factory):
+    """
+    Make factory return the same instance on every call in a process, created on
+    first use: the modules are imported before gunicorn forks the workers
+    """
+    instances = {}
+
+    @functools.wraps(factory)
+    def instance():
+        pid = os.getpid()
+        if pid not in instances:
+            instances.clear()
+            instances[pid] = factory()
+        return instances[pid]
+
+    return instance
+
+
+class SQLiteStore:
+    # CREATE statements of the tables and indexes of the store
+    SCHEMA = ()
+
+    # evict runs once every this many insertions of a process
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._insertions = 0
+        self._conn = None
+        self._pid = None
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    @property
+    def conn(self):
+        # one connection per process, stores may be created before gunicorn forks
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.filename, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _inserted(self, now):
+        """To be called after each insertion, with the lock held"""
+        self._insertions += 1
+        if self._insertions % self.EVICTION_INTERVAL == 0:
+            self.evict(now)
+
+    def evict(self, now):
+        """Remove the expired entries, and those beyond the limits of the store"""
+
+    def evict_least_recent(self, table, recency, max_size=None, max_entries=None):
+        """
+        Remove the rows of table beyond max_size bytes (summing their size
+        column) or max_entries rows, keeping the most recent ones according to
+        the recency column
+        """
+        columns, limits, params = [], [], []
+        if max_size is not None:
+            columns.append("SUM(size) OVER recent AS total")
+            limits.append("total > ?")
+            params.append(max_size)
+        if max_entries is not None:
+            columns.append("ROW_NUMBER() OVER recent AS position")
+            limits.append("position > ?")
+            params.append(max_entries)
+        if not limits:
+            return
+        self.conn.execute(
+            f"""
+            DELETE FROM {table} WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, {", ".join(columns)}
+                    FROM {table}
+                    WINDOW recent AS (ORDER BY {recency} DESC)
+                )
+                WHERE {" OR ".join(limits)}
+            )
+            """,
+            params,
+        )
+        self.conn.commit()
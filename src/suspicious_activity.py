@@ -3,44 +3,86 @@ import logging
 from datetime import datetime, timedelta
 
 from py import utils
+from src.event_queue import EventQueue
 from src.pg import pg_session
 from src.sql import suspicious_activity
 
 logger = logging.getLogger(__name__)
 
 
+def _ip_details(ips):
+    """ipinfo.io details of each ip, looked up once per batch"""
+    details = {}
+    for ip in set(ips):
+        try:
+            details[ip] = utils.getIpDetails(ip)
+        except Exception as e:
+            logger.warning(f"Could not get the details of {ip}: {e}")
+            details[ip] = {"country": "UN"}
+    return details
+
+
+def _insert_events(template, events):
+    """Insert a batch of events in one multi-row INSERT"""
+    ip_details = _ip_details(event["from_ip"] for event in events)
+    params = {}
+    for i, event in enumerate(events):
+        ip_data = ip_details[event["from_ip"]]
+        event = {
+            **event,
+            "ip_country": ip_data.get("country") or "UN",
+            "ip_details": json.dumps(ip_data),
+        }
+        params.update({f"{key}_{i}": value for key, value in event.items()})
+
+    with pg_session() as pg:
+        pg.execute(template(rows=len(events)), params)
+
+
+denied_logins_queue = EventQueue(
+    "denied_logins",
+    lambda events: _insert_events(suspicious_activity.insert_denied_login, events),
+)
+suspicious_activity_queue = EventQueue(
+    "suspicious_activity",
+    lambda events: _insert_events(
+        suspicious_activity.insert_suspicious_activity, events
+    ),
+)
+
+
 def log_denied_login(
     type,
     username,
     details,
     from_ip,
 ):
-    ip_data = utils.getIpDetails(from_ip)
-    ip_country = ip_data["country"] if ip_data["country"] is not None else "UN"
-    ip_details = json.dumps(ip_data)
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
     logger.warning(f'Failed login attempt for user "{username}": {type}')
 
-    with pg_session() as pg:
-        pg.execute(
-            suspicious_activity.insert_denied_login(),
-            {
-                "type": type,
-                "username": username,
-                "from_ip": from_ip,
-                "ip_country": ip_country,
-                "ip_details": ip_details,
-                "details": details,
-                "timestamp": timestamp,
-            },
-        )
+    denied_logins_queue.put(
+        {
+            "type": type,
+            "username": username,
+            "from_ip": from_ip,
+            "details": details,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    )
 
 
 def check_denied_login(ip, username):
     one_hour_ago = datetime.now() - timedelta(hours=1)
     timestamp_str = one_hour_ago.strftime("%Y-%m-%d %H:%M:%S")
 
+    # the attempts of this process not inserted yet are counted from the queue
+    pending_username_errors = denied_logins_queue.pending(
+        lambda event: event["username"] == username
+        and event["timestamp"] > timestamp_str
+    )
+    pending_ip_errors = denied_logins_queue.pending(
+        lambda event: event["from_ip"] == ip and event["timestamp"] > timestamp_str
+    )
+
     with pg_session() as pg:
         # Check errors with the same username in the past hour
         username_errors = pg.execute(
@@ -66,6 +108,9 @@ def check_denied_login(ip, username):
             },
         ).scalar()
 
+    username_errors += pending_username_errors
+    ip_errors += pending_ip_errors
+
     if username_errors > 10 or ip_errors > 50:
         return False
 
@@ -80,29 +125,20 @@ def list_denied_logins():
 
 
 def log_suspicious_activity(url, error_type, offending_part, from_ip, details=None):
-    ip_data = utils.getIpDetails(from_ip)
-    ip_country = ip_data["country"] if ip_data["country"] is not None else "UN"
-    ip_details = json.dumps(ip_data)
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
     logger.info(
-        f"Suspicious activity from {from_ip} ({ip_country}: {error_type}: {offending_part} ({url})"
+        f"Suspicious activity from {from_ip}: {error_type}: {offending_part} ({url})"
     )
 
-    with pg_session() as pg:
-        pg.execute(
-            suspicious_activity.insert_suspicious_activity(),
-            {
-                "url": url,
-                "type": error_type,
-                "offending_part": offending_part,
-                "from_ip": from_ip,
-                "ip_country": ip_country,
-                "ip_details": ip_details,
-                "details": details,
-                "timestamp": timestamp,
-            },
-        )
+    suspicious_activity_queue.put(
+        {
+            "url": url,
+            "type": error_type,
+            "offending_part": offending_part,
+            "from_ip": from_ip,
+            "details": details,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    )
 
 
 def list_suspicious_activity(limit):
@@ -0,0 +1,245 @@
+"""
+Shared on-disk store of the raster tiles proxied by /tile
+
+Tiles are kept in an MBTiles-style SQLite database (tiles indexed by zoom_level,
+tile_column and TMS tile_row, plus a metadata table) shared by all the workers
+and surviving restarts. Each tile remembers the validators sent by the tile
+server, so stale tiles are revalidated with a conditional request instead of
+being downloaded again, and served as is if the server can't be reached. The
+least recently used tiles are evicted once the store grows over max_size bytes.
+"""
+
+import logging
+import sqlite3
+import time
+from functools import lru_cache
+
+from py.utils import load_config
+from src import http_client
+from src.sqlite_store import SQLiteStore, per_process
+
+logger = logging.getLogger(__name__)
+
+STORE_FILE = "cache/tiles.mbtiles"
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+# Tiles are revalidated after the max-age given by the server, or this long
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+# Don't rewrite the access time of tiles used this recently
+ACCESS_RESOLUTION = 3600
+
+# Deepest zoom level of the tile servers
+MAX_ZOOM = 22
+
+JAWG_STYLES = (
+    "jawg-streets",
+    "jawg-lagoon",
+    "jawg-sunny",
+    "jawg-light",
+    "jawg-terrain",
+    "jawg-dark",
+)
+THUNDERFOREST_STYLES = ("thunderforest-transport",)
+STYLES = JAWG_STYLES + THUNDERFOREST_STYLES
+
+
+@lru_cache(maxsize=1)
+def api_keys():
+    config = load_config()
+    return (
+        config.get("jawg", {}).get("api_key", ""),
+        config.get("thunderforest", {}).get("api_key", ""),
+    )
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 1 << z and 0 <= y < 1 << z
+
+
+def tile_url(style, z, x, y, r):
+    """URL of a tile on its tile server, None for unknown styles"""
+    jawg_key, thunderforest_key = api_keys()
+    # Keys may be empty, which is fine
+    if style in JAWG_STYLES:
+        return (
+            f"https://tile.jawg.io/{style}/{z}/{x}/{y}{r}.png?access-token={jawg_key}"
+        )
+    if style in THUNDERFOREST_STYLES:
+        return f"https://tile.thunderforest.com/transport/{z}/{x}/{y}.png?apikey={thunderforest_key}"
+    return None
+
+
+def tile_scale(style, r):
+    """Part of r used in the URL of the style, thunderforest ignores it"""
+    return "" if style in THUNDERFOREST_STYLES else r
+
+
+def _max_age(response):
+    for directive in response.headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name == "max-age" and value.isdigit():
+            return int(value)
+    return DEFAULT_MAX_AGE
+
+
+class TileStore(SQLiteStore):
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)",
+        """
+        CREATE TABLE IF NOT EXISTS tiles (
+            style TEXT NOT NULL,
+            scale TEXT NOT NULL,
+            zoom_level INTEGER NOT NULL,
+            tile_column INTEGER NOT NULL,
+            tile_row INTEGER NOT NULL,
+            tile_data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            expires REAL NOT NULL,
+            accessed REAL NOT NULL,
+            PRIMARY KEY (style, scale, zoom_level, tile_column, tile_row)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS tiles_accessed ON tiles (accessed)",
+        """
+        INSERT OR IGNORE INTO metadata (name, value) VALUES
+        ('name', 'Trainlog tile cache'), ('format', 'png'), ('type', 'baselayer')
+        """,
+    )
+
+    # tiles are small and many, the eviction runs less often
+    EVICTION_INTERVAL = 500
+
+    def __init__(self, filename=STORE_FILE, max_size=DEFAULT_MAX_SIZE):
+        super().__init__(filename)
+        self.max_size = max_size
+
+    @staticmethod
+    def _key(style, z, x, y, r):
+        # MBTiles rows count from the bottom of the map (TMS)
+        return style, tile_scale(style, r), z, x, (1 << z) - 1 - y
+
+    def _read(self, key):
+        with self._lock:
+            return self.conn.execute(
+                """
+                SELECT tile_data, etag, last_modified, expires, accessed FROM tiles
+                WHERE style = ? AND scale = ? AND zoom_level = ? AND tile_column = ?
+                AND tile_row = ?
+                """,
+                key,
+            ).fetchone()
+
+    def _write(self, key, data, etag, last_modified, expires):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO tiles
+                (style, scale, zoom_level, tile_column, tile_row, tile_data, size,
+                 etag, last_modified, expires, accessed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (*key, data, len(data), etag, last_modified, expires, now),
+            )
+            self.conn.commit()
+            self._inserted(now)
+
+    def _touch(self, key, expires=None):
+        with self._lock:
+            if expires is None:
+                self.conn.execute(
+                    """
+                    UPDATE tiles SET accessed = ? WHERE style = ? AND scale = ?
+                    AND zoom_level = ? AND tile_column = ? AND tile_row = ?
+                    """,
+                    (time.time(), *key),
+                )
+            else:
+                self.conn.execute(
+                    """
+                    UPDATE tiles SET accessed = ?, expires = ? WHERE style = ?
+                    AND scale = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?
+                    """,
+                    (time.time(), expires, *key),
+                )
+            self.conn.commit()
+
+    def evict(self, now):
+        """Remove the least recently used tiles beyond max_size"""
+        self.evict_least_recent("tiles", "accessed", max_size=self.max_size)
+
+    def has_tile(self, style, z, x, y, r=""):
+        return self._read(self._key(style, z, x, y, r)) is not None
+
+    def get_tile(self, style, z, x, y, r=""):
+        """
+        PNG data of a tile, from the store when it is fresh, else from the tile
+        server (revalidating the stored tile if there is one). None if the tile
+        server doesn't have it.
+        """
+        url = tile_url(style, z, x, y, r)
+        if url is None:
+            return None
+        key = self._key(style, z, x, y, r)
+        now = time.time()
+
+        try:
+            row = self._read(key)
+        except sqlite3.Error as e:
+            logger.warning(f"Tile store read failed: {e}")
+            row = None
+
+        headers = {}
+        if row is not None:
+            data, etag, last_modified, expires, accessed = row
+            if now < expires:
+                if now - accessed > ACCESS_RESOLUTION:
+                    self._safe(self._touch, key)
+                return data
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        try:
+            response = http_client.get(url, headers=headers)
+        except Exception as e:
+            if row is None:
+                raise
+            # serve the stale tile rather than nothing
+            logger.warning(f"Tile revalidation failed: {e}")
+            return row[0]
+
+        if response.status_code == 304 and row is not None:
+            self._safe(self._touch, key, now + _max_age(response))
+            return row[0]
+        if response.status_code != 200:
+            return row[0] if row is not None and response.status_code >= 500 else None
+
+        self._safe(
+            self._write,
+            key,
+            response.content,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            now + _max_age(response),
+        )
+        return response.content
+
+    @staticmethod
+    def _safe(method, *args):
+        # the store must never prevent serving tiles
+        try:
+            method(*args)
+        except sqlite3.Error as e:
+            logger.warning(f"Tile store write failed: {e}")
+
+
+@per_process
+def instance():
+    """Singleton TileStore instance (lazy loading), one per process"""
+    config = load_config().get("tile_store") or {}
+    return TileStore(max_size=config.get("max_size", DEFAULT_MAX_SIZE))
@@ -0,0 +1,115 @@
+"""
+Timezone resolution of coordinates
+
+A single TimezoneFinder is shared by the whole process (building one loads its
+polygon data), and lookups are cached on coordinates rounded to
+COORDINATE_PRECISION decimals, so repeated stations and airports are free.
+"""
+
+from functools import lru_cache
+
+import pytz
+from timezonefinder import TimezoneFinder
+
+# 4 decimals is about 10 m, far below the precision of the timezone polygons
+COORDINATE_PRECISION = 4
+
+# Zones officially on UTC+8 even though timezonefinder reports local solar time
+UTC8_ZONES = ("Asia/Urumqi", "Asia/Kashgar")
+
+_FINDER = None
+
+
+def finder():
+    """Process-wide TimezoneFinder instance (lazy loading)"""
+    global _FINDER
+    if _FINDER is None:
+        _FINDER = TimezoneFinder()
+    return _FINDER
+
+
+def quantize(lat, lng):
+    return (
+        round(float(lat), COORDINATE_PRECISION),
+        round(float(lng), COORDINATE_PRECISION),
+    )
+
+
+@lru_cache(maxsize=65536)
+def _timezone_name(lat, lng):
+    return finder().timezone_at(lat=lat, lng=lng)
+
+
+def timezone_name(lat, lng):
+    """
+    Name of the timezone at the given coordinates, None if there is none
+    """
+    return _timezone_name(*quantize(lat, lng))
+
+
+@lru_cache(maxsize=1024)
+def _timezone(name):
+    if name in UTC8_ZONES:
+        # Force UTC+8 manually
+        return pytz.FixedOffset(480)  # 480 minutes = 8 hours
+    return pytz.timezone(name)
+
+
+def get_timezone(lat, lng):
+    """
+    pytz timezone at the given coordinates
+    """
+    return _timezone(timezone_name(lat, lng))
+
+
+def _utc_datetime(timezone, dateTime):
+    localized_datetime = timezone.localize(dateTime)
+    return localized_datetime.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def _local_datetime(timezone, dateTime):
+    return dateTime.astimezone(timezone).replace(tzinfo=None)
+
+
+def to_utc(lat, lng, dateTime):
+    """
+    Naive UTC datetime of a naive local datetime at the given coordinates
+    """
+    return _utc_datetime(get_timezone(lat, lng), dateTime)
+
+
+def to_local(lat, lng, dateTime):
+    """
+    Naive local datetime at the given coordinates of an aware datetime
+    """
+    return _local_datetime(get_timezone(lat, lng), dateTime)
+
+
+def _convert_batch(convert, items):
+    timezones = {}
+    results = []
+    for lat, lng, dateTime in items:
+        try:
+            key = quantize(lat, lng)
+            if key not in timezones:
+                timezones[key] = _timezone(_timezone_name(*key))
+            results.append(convert(timezones[key], dateTime))
+        except Exception:
+            results.append(None)
+    return results
+
+
+def to_utc_batch(items):
+    """
+    to_utc of many (lat, lng, dateTime) tuples, each distinct location being
+    resolved once. Items that cannot be converted give None.
+    """
+    return _convert_batch(_utc_datetime, items)
+
+
+def to_local_batch(items):
+    """
+    to_local of many (lat, lng, dateTime) tuples, each distinct location being
+    resolved once. Items that cannot be converted give None.
+    """
+    return _convert_batch(_local_datetime, items)
@@ -0,0 +1,251 @@
+"""
+Completion of trip rows for display, for whole lists of trips at once
+
+Dates and durations are formatted in Python, and everything else a trip needs
+(tickets, prices in the currency of the viewer, operator logos, carbon
+footprints) is resolved with one query or one bulk computation per list,
+rather than a few queries per trip.
+"""
+
+from datetime import datetime
+
+from py.currency import convert_prices
+from py.sql import getTicketsById, getTripsById
+from src.carbon import calculate_carbon_footprints
+from src.utils import mainConn, managed_cursor
+
+# Ids per IN clause, below the SQLite variable limit
+BATCH_SIZE = 900
+
+
+def _batches(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), BATCH_SIZE):
+        yield ids[i : i + BATCH_SIZE]
+
+
+def get_trips_by_id(trip_ids):
+    """Trips (as dicts, with their operator logo and time) by uid"""
+    trips = {}
+    with managed_cursor(mainConn) as cursor:
+        for batch in _batches(set(trip_ids)):
+            cursor.execute(
+                getTripsById.format(trip_ids=", ".join("?" * len(batch))), batch
+            )
+            trips.update((row["uid"], dict(row)) for row in cursor.fetchall())
+    return trips
+
+
+def get_tickets_by_id(ticket_ids):
+    tickets = {}
+    with managed_cursor(mainConn) as cursor:
+        for batch in _batches(set(ticket_ids)):
+            cursor.execute(
+                getTicketsById.format(ticket_ids=", ".join("?" * len(batch))), batch
+            )
+            tickets.update((row["uid"], row) for row in cursor.fetchall())
+    return tickets
+
+
+def format_trip_dates(trip):
+    """Start date, times and duration of a trip, as shown in the trips table"""
+    trip_duration = ["", ""]
+    if trip["start_datetime"] not in (1, -1) and trip["end_datetime"] not in (
+        1,
+        -1,
+    ):
+        if trip["type"] in ("poi", "accommodation", "restaurant"):
+            trip["destination_station"] = ""
+        start_datetime = datetime.strptime(trip["start_datetime"], "%Y-%m-%d %H:%M:%S")
+        end_datetime = datetime.strptime(trip["end_datetime"], "%Y-%m-%d %H:%M:%S")
+        start_date = start_datetime.date()
+        end_date = end_datetime.date()
+        if start_datetime.second == 0 and end_datetime.second == 0:
+            start_time = start_datetime.strftime("%H:%M")
+            end_time = end_datetime.strftime("%H:%M")
+
+            if trip["utc_start_datetime"] is None:
+                trip_duration = [
+                    "calc",
+                    (end_datetime - start_datetime).total_seconds(),
+                ]
+            else:
+                utc_start_datetime = datetime.strptime(
+                    trip["utc_start_datetime"], "%Y-%m-%d %H:%M:%S"
+                )
+                utc_end_datetime = datetime.strptime(
+                    trip["utc_end_datetime"], "%Y-%m-%d %H:%M:%S"
+                )
+                trip_duration = [
+                    "calc",
+                    (utc_end_datetime - utc_start_datetime).total_seconds(),
+                ]
+
+            if end_date != start_date:
+                days_diff = end_date - start_date
+                end_time += "(+{})".format(days_diff.days)
+        else:
+            start_time = end_time = ""
+            if trip["manual_trip_duration"] is not None:
+                trip_duration = ["man", trip["manual_trip_duration"]]
+            elif trip["estimated_trip_duration"] is not None:
+                trip_duration = ["est", trip["estimated_trip_duration"]]
+
+        start_date = start_date.strftime("%Y-%m-%d")
+    else:
+        start_date = start_time = end_time = ""
+        if trip["manual_trip_duration"] is not None:
+            trip_duration = ["man", trip["manual_trip_duration"]]
+        elif trip["estimated_trip_duration"] is not None:
+            trip_duration = ["est", trip["estimated_trip_duration"]]
+
+    trip["start_date"] = start_date
+    trip["start_time"] = start_time
+    trip["end_time"] = end_time
+    trip["trip_duration"] = trip_duration
+
+
+def _pick_logo(logos, utc_filtered_start_datetime):
+    """
+    Logo of an operator at the start of a trip: the oldest one for past trips
+    without date, the latest one for future trips without date, else the latest
+    one effective at the start (logos without date come first in ascending
+    order, last in descending order)
+    """
+    if not logos:
+        return None
+    if utc_filtered_start_datetime == -1:
+        undated = [logo for logo in logos if logo["effective_date"] is None]
+        if undated:
+            return undated[0]["logo_url"]
+        return min(logos, key=lambda logo: logo["effective_date"])["logo_url"]
+    if utc_filtered_start_datetime != 1:
+        logos = [
+            logo
+            for logo in logos
+            if logo["effective_date"] is None
+            or logo["effective_date"] <= utc_filtered_start_datetime
+        ]
+    dated = [logo for logo in logos if logo["effective_date"] is not None]
+    if dated:
+        return max(dated, key=lambda logo: logo["effective_date"])["logo_url"]
+    return logos[0]["logo_url"] if logos else None
+
+
+def add_multi_operators(trips):
+    """
+    multi_operators list of the trips with several operators, with the logo
+    of each operator
+    """
+    multi_operator_trips = [trip for trip in trips if "," in str(trip["operator"])]
+    names = {
+        name.strip()
+        for trip in multi_operator_trips
+        for name in trip["operator"].split(",")
+    }
+    if not names:
+        return
+
+    operators = {}
+    logos = {}
+    with managed_cursor(mainConn) as cursor:
+        for batch in _batches(names):
+            cursor.execute(
+                f"SELECT * FROM operators WHERE short_name IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            for row in cursor.fetchall():
+                operators.setdefault(row["short_name"], dict(row))
+        operator_ids = [operator["uid"] for operator in operators.values()]
+        for batch in _batches(operator_ids):
+            cursor.execute(
+                f"""
+                SELECT operator_id, logo_url, effective_date FROM operator_logos
+                WHERE operator_id IN ({", ".join("?" * len(batch))})
+                """,
+                batch,
+            )
+            for row in cursor.fetchall():
+                logos.setdefault(row["operator_id"], []).append(row)
+
+    for trip in multi_operator_trips:
+        operator_logos = []
+        for name in trip["operator"].split(","):
+            operator = operators.get(name.strip())
+            if operator:
+                operator_logos.append(
+                    {
+                        "operator_name": operator["short_name"],
+                        "logo_url": _pick_logo(
+                            logos.get(operator["uid"]),
+                            trip["utc_filtered_start_datetime"],
+                        ),
+                    }
+                )
+        trip["multi_operators"] = operator_logos
+
+        # Remove operator_name and logo_url from trip if they exist
+        trip.pop("operator_name", None)
+        trip.pop("logo_url", None)
+
+
+def hydrate_trips(trips, user_currency, multi_operators=False, carbon=False):
+    """
+    Complete trip dicts in place for display: formatted dates, ticket, prices
+    in user_currency, and optionally the logos of each operator of the trips
+    with several operators and the carbon footprints.
+    """
+    ticket_ids = {
+        trip["ticket_id"] for trip in trips if trip["ticket_id"] not in (None, "")
+    }
+    tickets = get_tickets_by_id(ticket_ids) if ticket_ids else {}
+
+    pending_prices = []
+    for trip in trips:
+        format_trip_dates(trip)
+        trip["user_currency"] = user_currency
+        if trip.get("price") not in (None, ""):
+            pending_prices.append(
+                (
+                    trip,
+                    "price_in_user_currency",
+                    trip["price"],
+                    trip["currency"],
+                    trip["purchasing_date"],
+                )
+            )
+
+        ticket = tickets.get(trip["ticket_id"])
+        if ticket is not None:
+            trip["ticket"] = ticket["name"]
+            trip["ticket_price"] = ticket["price"] / ticket["trip_count"]
+            trip["ticket_currency"] = ticket["currency"]
+            pending_prices.append(
+                (
+                    trip,
+                    "ticket_price_in_user_currency",
+                    trip["ticket_price"],
+                    trip["ticket_currency"],
+                    ticket["purchasing_date"],
+                )
+            )
+
+        if trip["operator"] is None or trip["operator"] == "":
+            trip["operator"] = ""
+
+        if trip["line_name"] is None or trip["line_name"] == "":
+            trip["line_name"] = ""
+
+    converted_prices = convert_prices(
+        [(price, currency, date) for _, _, price, currency, date in pending_prices],
+        user_currency,
+    )
+    for (trip, key, *_), converted in zip(pending_prices, converted_prices):
+        trip[key] = converted
+
+    if multi_operators:
+        add_multi_operators(trips)
+
+    if carbon:
+        for trip, footprint in zip(trips, calculate_carbon_footprints(trips)):
+            trip["carbon_footprint"] = round(footprint, 6)
@@ -0,0 +1,120 @@
+"""
+Keyset pagination of the trips table
+
+Pages are read by seeking past the sort key of the last trip of the previous
+page (plus its uid, so that every trip has a distinct position) instead of
+sorting and skipping all the trips before the offset. The cursors are opaque
+tokens handed to the API clients, and remembered for the offsets of the pages
+already served, so that the DataTables table (which only knows offsets) seeks
+too when it moves to the next or previous page.
+
+The number of matching trips is computed once per listing signature (user,
+filters, and a fingerprint of the trips of the user, which changes when they
+are written).
+"""
+
+import base64
+import hashlib
+import json
+
+# How long counts and cursors are reused, which also bounds how late the
+# counts are when trips move from the future to the past
+TIMEOUT = 300
+
+FINGERPRINT_QUERY = """
+    SELECT
+        COUNT(*),
+        MAX(last_modified),
+        TOTAL(uid),
+        (
+            SELECT COUNT(*) FROM tags_associations
+            JOIN tags ON tags.uid = tags_associations.tag_id
+            WHERE tags.username = :username
+        )
+    FROM trip
+    WHERE username = :username
+"""
+
+
+def sort_keys(sort_column_name):
+    """(expression, nullable) of the sort keys of a column, uid excluded"""
+    if sort_column_name == "start_datetime":
+        return [
+            ("utc_filtered_start_datetime = 1", False),
+            ("utc_filtered_start_datetime", False),
+        ]
+    return [(sort_column_name, True)]
+
+
+def sort_columns(keys):
+    """Select list exposing the values of the sort keys as _sort_i"""
+    return ", ".join(
+        f"{expression} AS _sort_{i}" for i, (expression, _) in enumerate(keys)
+    )
+
+
+def order_by(keys, direction):
+    return "ORDER BY " + ", ".join(
+        f"{expression} {direction}" for expression, _ in keys + [("uid", False)]
+    )
+
+
+def seek_condition(keys, direction, values, params):
+    """
+    Condition selecting the trips after the cursor values in the sort order,
+    the parameters are added to params. SQLite sorts NULL first in ascending
+    order and last in descending order.
+    """
+    keys = keys + [("uid", False)]
+
+    def after(i):
+        expression, nullable = keys[i]
+        param = f"seek_{i}"
+        value = values[i]
+        params[param] = value
+        # expressions such as "x = 1" must not bind to the comparison
+        expression = f"({expression})"
+        if value is None:
+            beyond = f"{expression} IS NOT NULL" if direction == "asc" else "0"
+            equal = f"{expression} IS NULL"
+        else:
+            operator = ">" if direction == "asc" else "<"
+            beyond = f"{expression} {operator} :{param}"
+            if nullable and direction == "desc":
+                beyond = f"({beyond} OR {expression} IS NULL)"
+            equal = f"{expression} = :{param}"
+        if i == len(keys) - 1:
+            return beyond
+        return f"{beyond} OR ({equal} AND ({after(i + 1)}))"
+
+    return after(0)
+
+
+def encode_cursor(row, keys):
+    """Cursor of the position of a row selected with sort_columns"""
+    values = [row[f"_sort_{i}"] for i in range(len(keys))] + [row["uid"]]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, keys):
+    """Values of a cursor, None if it is not a cursor of these sort keys"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != len(keys) + 1:
+        return None
+    if not all(
+        value is None or isinstance(value, (str, int, float)) for value in values
+    ):
+        return None
+    return values
+
+
+def fingerprint(cursor, username):
+    cursor.execute(FINGERPRINT_QUERY, {"username": username})
+    return tuple(cursor.fetchone())
+
+
+def signature(*parts):
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
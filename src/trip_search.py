@@ -0,0 +1,190 @@
+"""
+Full-text index of the trips, used by the search of the trips table
+
+The searchable text of each trip (stations, operator, line, material with its
+airliner details, notes, tags...) is stored lowercased and without diacritics
+in the trip_search FTS5 table (see py/db_init.setup_trip_search), whose rowid
+is the uid of the trip. Searches of 3 characters or more are answered by the
+trigram index instead of folding every column of every trip in Python.
+
+src/trips.py reindexes the trips it writes. Other writes (duplicates, tags,
+bulk updates...) are caught by triggers listing the trip in trip_search_stale,
+and reindexed just before their owner searches.
+"""
+
+import threading
+
+from py.db_init import TRIP_SEARCH_COLUMNS
+from py.utils import remove_diacritics
+from src.utils import mainConn, managed_cursor
+
+# Trips reindexed per statement
+BATCH_SIZE = 500
+
+# Shortest term the trigram index can look up, shorter ones are matched by
+# scanning the index rows of the user
+MIN_INDEXED_LENGTH = 3
+
+# Columns searched by the global search of the table
+GLOBAL_SEARCH_COLUMNS = (
+    "type",
+    "origin_station",
+    "destination_station",
+    "operator",
+    "line_name",
+    "countries",
+    "material",
+    "reg",
+    "notes",
+    "start_datetime",
+    "end_datetime",
+    "tags",
+)
+
+# Index column searched by the partial search of each column of the table
+TABLE_COLUMNS = {
+    "type": "type",
+    "origin_station": "origin_station",
+    "destination_station": "destination_station",
+    "operator": "operator",
+    "line_name": "line_name",
+    "countries": "countries",
+    "visibility": "visibility",
+    "material_type": "material",
+    "reg": "reg",
+    "seat": "seat",
+    "notes": "notes",
+}
+
+GET_SEARCHED_TEXT = """
+    SELECT
+        trip.uid,
+        trip.type,
+        trip.origin_station,
+        trip.destination_station,
+        trip.operator,
+        trip.line_name,
+        trip.countries,
+        trip.visibility,
+        trip.material_type,
+        airliners.iata,
+        airliners.manufacturer,
+        airliners.model,
+        trip.reg,
+        trip.seat,
+        trip.notes,
+        trip.start_datetime,
+        trip.end_datetime,
+        (
+            SELECT group_concat(tags.name, char(10))
+            FROM tags_associations
+            JOIN tags ON tags.uid = tags_associations.tag_id
+            WHERE tags_associations.trip_id = trip.uid
+        ) AS tags
+    FROM trip
+    LEFT JOIN airliners ON trip.material_type = airliners.iata
+    WHERE trip.uid IN ({placeholders})
+"""
+
+_lock = threading.Lock()
+
+
+def fold(text):
+    """Text as stored in the index: lowercased, without diacritics"""
+    return remove_diacritics(str(text)).lower() if text is not None else ""
+
+
+def _document(row):
+    # one line per value, so that a search can't match across two values
+    material = "\n".join(
+        fold(row[key])
+        for key in ("material_type", "iata", "manufacturer", "model")
+        if row[key] is not None
+    )
+    values = {key: fold(row[key]) for key in row.keys() if key != "uid"}
+    values["material"] = material
+    return (row["uid"], *(values[column] for column in TRIP_SEARCH_COLUMNS))
+
+
+def index_trips(trip_ids):
+    """(Re)index the searchable text of trips"""
+    trip_ids = [int(trip_id) for trip_id in trip_ids]
+    columns = ", ".join(TRIP_SEARCH_COLUMNS)
+    with _lock:
+        for i in range(0, len(trip_ids), BATCH_SIZE):
+            batch = trip_ids[i : i + BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            with managed_cursor(mainConn) as cursor:
+                rows = cursor.execute(
+                    GET_SEARCHED_TEXT.format(placeholders=placeholders), batch
+                ).fetchall()
+                cursor.execute(
+                    f"DELETE FROM trip_search WHERE rowid IN ({placeholders})", batch
+                )
+                cursor.executemany(
+                    f"INSERT INTO trip_search (rowid, {columns}) "
+                    f"VALUES (?, {', '.join('?' * len(TRIP_SEARCH_COLUMNS))})",
+                    [_document(row) for row in rows],
+                )
+                cursor.execute(
+                    f"DELETE FROM trip_search_stale WHERE trip_id IN ({placeholders})",
+                    batch,
+                )
+            mainConn.commit()
+
+
+def index_trip(trip_id):
+    index_trips([trip_id])
+
+
+def refresh(username):
+    """Reindex the trips of a user written since they were last indexed"""
+    with managed_cursor(mainConn) as cursor:
+        stale = cursor.execute(
+            """
+            SELECT trip_search_stale.trip_id FROM trip_search_stale
+            JOIN trip ON trip.uid = trip_search_stale.trip_id
+            WHERE trip.username = ?
+            """,
+            (username,),
+        ).fetchall()
+    if stale:
+        index_trips(row[0] for row in stale)
+
+
+def search_condition(search_value, column_searches, params):
+    """
+    Condition on trip.uid for the global search and the partial column
+    searches {column: term} of the trips table, None if there is nothing to
+    search. The parameters of the condition are added to params, which must
+    contain the username.
+    """
+    conditions = []
+    short_terms = False
+
+    search_value = fold(search_value)
+    if len(search_value) >= MIN_INDEXED_LENGTH:
+        phrase = search_value.replace('"', '""')
+        params["search_match"] = f'{{{" ".join(GLOBAL_SEARCH_COLUMNS)}}} : "{phrase}"'
+        conditions.append("trip_search MATCH :search_match")
+    elif search_value:
+        params["search"] = f"%{search_value}%"
+        conditions.append(
+            "("
+            + " OR ".join(f"{column} LIKE :search" for column in GLOBAL_SEARCH_COLUMNS)
+            + ")"
+        )
+        short_terms = True
+
+    for column, term in column_searches.items():
+        term = fold(term)
+        params[f"search_{column}"] = f"%{term}%"
+        conditions.append(f"{column} LIKE :search_{column}")
+        short_terms = short_terms or len(term) < MIN_INDEXED_LENGTH
+
+    if not conditions:
+        return None
+    if short_terms:
+        # not indexed, only scan the index rows of the user
+        conditions.append("rowid IN (SELECT uid FROM trip WHERE username = :username)")
+    return f"uid IN (SELECT rowid FROM trip_search WHERE {' AND '.join(conditions)})"
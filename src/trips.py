@@ -7,8 +7,22 @@ from flask import abort, request
 
 from py.sql import deletePathQuery, getUserLines, saveQuery, updatePath, updateTripQuery
 from py.utils import getCountriesFromPath
+from src import trip_search
 from src.consts import TripTypes
-from src.paths import Path
+from src.coverage import (
+    delete_trip_coverage,
+    duplicate_trip_coverage,
+    index_trip_coverage,
+    refresh_trip_percents,
+)
+from src.visited_squares import (
+    delete_trip_squares,
+    duplicate_trip_squares,
+    index_trip_squares,
+    update_world_squares_percent,
+)
+from src.path_codec import decode_path, encode_path
+from src.paths import DERIVED_COLUMNS, Path, derive_path_columns
 from src.pg import get_or_create_pg_session, pg_session
 from src.sql.trips import (
     attach_ticket_query,
@@ -98,7 +112,7 @@ class Trip:
         self.ticket_id = ticket_id
         self.is_project = is_project
         self.path = path
-        self.carbon = calculate_carbon_footprint_for_trip(vars(self), path) if path else None
+        self.carbon = calculate_carbon_footprint_for_trip(vars(self)) if path else None
         self.visibility = visibility
 
     def keys(self):
@@ -259,8 +273,6 @@ def _create_trip_in_sqlite(trip: Trip):
         # Commit both transactions
         mainConn.commit()
         pathConn.commit()
-
-        return trip_id
     except Exception as e:
         # Rollback both transactions in case of error
         mainConn.rollback()
@@ -268,6 +280,18 @@ def _create_trip_in_sqlite(trip: Trip):
         # Optionally, log the error or handle it as needed
         raise e
 
+    _index_trip(trip_id)
+    trip_search.index_trip(trip_id)
+    return trip_id
+
+
+def _index_trip(trip_id):
+    """
+    Update the indexes derived from the path of a trip
+    """
+    index_trip_coverage(trip_id)
+    index_trip_squares(trip_id)
+
 
 def duplicate_trip(trip_id: int):
     with pg_session() as pg:
@@ -308,15 +332,21 @@ def _duplicate_trip_in_sqlite(trip_id):
             insert_query = f"INSERT INTO trip ({columns_str}) VALUES ({placeholders})"
             cursor.execute(insert_query, row_to_duplicate)
             new_trip_id = cursor.lastrowid
+    path_columns = ", ".join(("path",) + DERIVED_COLUMNS)
     with managed_cursor(pathConn) as cursor:
-        cursor.execute("select path from paths where trip_id = ?", (trip_id,))
-        path_to_duplicate = cursor.fetchone()["path"]
         cursor.execute(
-            "insert into paths (trip_id, path) VALUES (?, ?)",
-            (new_trip_id, path_to_duplicate),
+            f"select {path_columns} from paths where trip_id = ?", (trip_id,)
+        )
+        path_to_duplicate = tuple(cursor.fetchone())
+        cursor.execute(
+            f"insert into paths (trip_id, {path_columns}) "
+            f"VALUES (?, {', '.join(['?'] * len(path_to_duplicate))})",
+            (new_trip_id, *path_to_duplicate),
         )
     mainConn.commit()
     pathConn.commit()
+    duplicate_trip_coverage(trip_id, new_trip_id)
+    duplicate_trip_squares(trip_id, new_trip_id)
     return new_trip_id
 
 
@@ -389,7 +419,7 @@ def _update_trip_in_sqlite(
     if "path" in formData.keys():
         path = [[coord["lat"], coord["lng"]] for coord in json.loads(formData["path"])]
     else:
-        path = json.loads(pathResult["path"])
+        path = decode_path(pathResult["path"])
 
     limits = [
         {
@@ -464,9 +494,24 @@ def _update_trip_in_sqlite(
         cursor.execute(formattedUpdateQuery, {**updateData})
     if path:
         with managed_cursor(pathConn) as cursor:
-            cursor.execute(updatePath, {"trip_id": int(tripId), "path": str(path)})
+            cursor.execute(
+                updatePath,
+                {
+                    "trip_id": int(tripId),
+                    "path": encode_path(path),
+                    **derive_path_columns(path),
+                },
+            )
         pathConn.commit()
     mainConn.commit()
+    trip_search.index_trip(tripId)
+
+    if path and ("path" in formData.keys() or "countries" in updateData):
+        _index_trip(tripId)
+    else:
+        # dates may have changed whether the trip counts in the percents
+        refresh_trip_percents(tripId)
+        update_world_squares_percent(row["username"])
 
 
 def delete_trip(trip_id: int, username: str):
@@ -503,6 +548,8 @@ def _delete_trip_in_sqlite(username, tripId):
         cursor.execute(deletePathQuery, {"trip_id": tripId})
     mainConn.commit()
     pathConn.commit()
+    delete_trip_coverage(tripId, username)
+    delete_trip_squares(tripId, username)
 
 
 def update_trip_type(trip_id, new_type: TripTypes):
@@ -520,6 +567,7 @@ def update_trip_type_in_sqlite(trip_id, new_type: TripTypes):
             {"newType": new_type.value, "tripId": trip_id},
         )
     mainConn.commit()
+    _index_trip(trip_id)
 
 
 def delete_ticket_from_db(username, ticket_id):
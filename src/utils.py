@@ -3,19 +3,18 @@ import re
 import smtplib
 import sqlite3
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from functools import wraps
 from glob import glob
 from inspect import getcallargs
 
-import pytz
 import requests
-from flask import abort, redirect, request, session, url_for
-from timezonefinder import TimezoneFinder
+from flask import abort, g, has_app_context, redirect, request, session, url_for
 
 from py.sql import getCurrentTrip
 from py.utils import load_config
+from src import timezones
 from src.consts import DbNames
 from src.users import Friendship, User, authDb
 
@@ -28,9 +27,17 @@ mainConn.row_factory = sqlite3.Row
 authConn = sqlite3.connect(DbNames.AUTH_DB.value, check_same_thread=False)
 authConn.row_factory = sqlite3.Row
 
+# Users joined with their trip statistics (see src/admin_users.py)
+adminConn = sqlite3.connect(DbNames.AUTH_DB.value, check_same_thread=False)
+adminConn.row_factory = sqlite3.Row
+adminConn.execute("ATTACH DATABASE ? AS trips", (DbNames.MAIN_DB.value,))
+
 
 owner = load_config()["owner"]["username"]
 
+# last_login is only written when it is older than this
+LAST_LOGIN_RESOLUTION = timedelta(hours=1)
+
 
 def getNameFromPath(path):
     return re.search(r"[A-Za-z0-9_\-\.]+(?=\.[A-Za-z0-9]+$)", path).group(0)
@@ -70,6 +77,48 @@ def getUser():
     return session.get("logged_in") if session.get("logged_in") else "public"
 
 
+def _request_memo(name):
+    """
+    Dict kept for the duration of the current request (empty outside of one)
+    """
+    if not has_app_context():
+        return {}
+    if name not in g:
+        setattr(g, name, {})
+    return getattr(g, name)
+
+
+def get_user(username):
+    """
+    User with this username (None if there is none), loaded once per request
+    """
+    users = _request_memo("users_ctx")
+    if username not in users:
+        users[username] = User.query.filter_by(username=username).first()
+    return users[username]
+
+
+def get_friend_usernames(username):
+    """
+    Usernames of the accepted friends of the user, loaded once per request
+    """
+    friends = _request_memo("friends_ctx")
+    if username not in friends:
+        user = get_user(username)
+        friends[username] = (
+            set()
+            if user is None
+            else {
+                friend_username
+                for (friend_username,) in authDb.session.query(User.username)
+                .join(Friendship, User.uid == Friendship.friend_id)
+                .filter(Friendship.user_id == user.uid, Friendship.accepted != None)  # noqa: E711
+                .all()
+            }
+        )
+    return friends[username]
+
+
 def isCurrentTrip(username):
     with managed_cursor(mainConn) as cursor:
         trip = cursor.execute(getCurrentTrip, {"username": username}).fetchone()
@@ -114,33 +163,11 @@ def processDates(newTrip, newPath):
 
 
 def getUtcDatetime(lat, lng, dateTime):
-    tf = TimezoneFinder()
-    timezone_str = tf.timezone_at(lat=lat, lng=lng)
-
-    # Handle override for specific zones
-    if timezone_str in ["Asia/Urumqi", "Asia/Kashgar"]:
-        # Force UTC+8 manually
-        timezone = pytz.FixedOffset(480)  # 480 minutes = 8 hours
-        localized_datetime = timezone.localize(dateTime)
-    else:
-        timezone = pytz.timezone(timezone_str)
-        localized_datetime = timezone.localize(dateTime)
-
-    utc_datetime = localized_datetime.astimezone(pytz.utc).replace(tzinfo=None)
-    return utc_datetime
+    return timezones.to_utc(lat, lng, dateTime)
 
 
 def getLocalDatetime(lat, lng, dateTime):
-    # Instantiate TimezoneFinder and find timezone for given lat, lng
-    tf = TimezoneFinder()
-    timezone_str = tf.timezone_at(lat=lat, lng=lng)
-
-    if timezone_str in ["Asia/Urumqi", "Asia/Kashgar"]:
-        local_timezone = pytz.FixedOffset(480)  # 480 minutes = 8 hours
-    else:
-        local_timezone = pytz.timezone(timezone_str)
-    local_datetime = dateTime.astimezone(local_timezone).replace(tzinfo=None)
-    return local_datetime
+    return timezones.to_local(lat, lng, dateTime)
 
 
 def get_user_id(username):
@@ -292,22 +319,15 @@ def public_required(f):
     def decorated_function(*args, **kwargs):
         inspection = getcallargs(f, *args, **kwargs)
         username = inspection["username"]
-        user = User.query.filter_by(username=username).first()
+        user = get_user(username)
 
-        friends = (
-            authDb.session.query(User.uid, User.username)
-            .join(Friendship, User.uid == Friendship.friend_id)
-            .filter(Friendship.user_id == user.uid, Friendship.accepted != None)  # noqa: E711
-            .all()
-        )
-        friendsList = [username for (uid, username) in friends]
         if user is None:
             abort(404)
         elif (
             not user.is_public()
             and not session.get(owner)
             and username != getUser()
-            and getUser() not in friendsList
+            and getUser() not in get_friend_usernames(username)
         ):
             abort(401)
         else:
@@ -321,7 +341,7 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         inspection = getcallargs(f, *args, **kwargs)
         username = inspection["username"]
-        user = User.query.filter_by(username=username).first()
+        user = get_user(username)
 
         if not session.get("logged_in"):
             return redirect(url_for("login", next=request.path))
@@ -330,8 +350,11 @@ def login_required(f):
         elif not (session.get(username) or session.get(owner)):
             abort(401)
 
-        user.last_login = datetime.utcnow()
-        authDb.session.commit()
+        # Avoid a write to auth.db on every request
+        now = datetime.utcnow()
+        if user.last_login is None or now - user.last_login > LAST_LOGIN_RESOLUTION:
+            user.last_login = now
+            authDb.session.commit()
         return f(*args, **kwargs)
 
     return decorated_function
@@ -459,26 +482,8 @@ def get_default_trip_visibility(x):
 def current_user_is_friend_with(target_username):
     current_user = getUser()
     if current_user != "public":
-        current_user_id = User.query.filter_by(username=current_user).first().uid
-        target_user_id = (
-            authDb.session.query(User.uid, User.username)
-            .filter(User.username == target_username)
-            .first()
-            .uid
-        )
-        return (
-            current_user_id == target_user_id
-            or (
-                authDb.session.query(User.uid, User.username)
-                .join(Friendship, User.uid == Friendship.friend_id)
-                .filter(
-                    Friendship.user_id == target_user_id,
-                    Friendship.friend_id == current_user_id,
-                    Friendship.accepted is not None,
-                )
-                .first()
-            )
-            is not None
+        return current_user == target_username or current_user in get_friend_usernames(
+            target_username
         )
     else:
         return 0
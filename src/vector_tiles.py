@@ -0,0 +1,201 @@
+import hashlib
+import math
+import os
+import shutil
+import time
+
+import mapbox_vector_tile
+import numpy as np
+from shapely.geometry import LineString, Point, box
+
+from py.utils import interpolate_points_if_gaps
+from src.path_codec import decode_path
+
+TILE_CACHE_DIR = "cache/trip_tiles"
+# Cached versions of a user's tiles that haven't been used for this long are removed
+TILE_CACHE_MAX_AGE = 7 * 24 * 3600
+
+EXTENT = 4096
+# Geometries are clipped a bit outside the tile so that lines don't show seams
+BUFFER = 64
+
+# Half the circumference of the earth in web mercator meters
+ORIGIN_SHIFT = 20037508.342789244
+MAX_LATITUDE = 85.0511287798
+
+# Properties of the trips (as returned by getUniqueUserTrips) kept in the tiles
+TRIP_PROPERTIES = (
+    "uid",
+    "type",
+    "origin_station",
+    "destination_station",
+    "past",
+    "current",
+    "plannedFuture",
+    "future",
+    "count",
+)
+
+
+def tile_resolution(z):
+    """
+    Coarsest stored path resolution (see src/paths.RESOLUTIONS) that is still
+    finer than a screen pixel at zoom level z
+    """
+    if z <= 6:
+        return "low"
+    if z <= 9:
+        return "medium"
+    if z <= 12:
+        return "high"
+    return "full"
+
+
+def tile_bounds(z, x, y):
+    """
+    Web mercator bounds (minx, miny, maxx, maxy) of the given tile
+    """
+    size = 2 * ORIGIN_SHIFT / 2**z
+    minx = -ORIGIN_SHIFT + x * size
+    maxy = ORIGIN_SHIFT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_lnglat_bounds(z, x, y, buffer=0):
+    """
+    (min_lng, min_lat, max_lng, max_lat) of the given tile, extended by buffer
+    tile units on each side
+    """
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    margin = (maxx - minx) * buffer / EXTENT
+    min_lng, min_lat = mercator_to_lnglat(minx - margin, miny - margin)
+    max_lng, max_lat = mercator_to_lnglat(maxx + margin, maxy + margin)
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def mercator_to_lnglat(mx, my):
+    lng = mx / ORIGIN_SHIFT * 180
+    lat = math.degrees(
+        2 * math.atan(math.exp(my / ORIGIN_SHIFT * math.pi)) - math.pi / 2
+    )
+    return lng, lat
+
+
+def project(coords):
+    """
+    Project an (n, 2) array of [lat, lng] to web mercator (x, y)
+    """
+    lat = np.clip(coords[:, 0], -MAX_LATITUDE, MAX_LATITUDE)
+    x = coords[:, 1] * ORIGIN_SHIFT / 180
+    y = np.log(np.tan(np.radians(90 + lat) / 2)) * ORIGIN_SHIFT / math.pi
+    return np.column_stack((x, y))
+
+
+def trip_geometry(trip, path):
+    """
+    Web mercator geometry of a trip. Flights stored as two nodes are drawn as
+    great circles on the map, so they are densified the same way here.
+    """
+    if trip["type"] in ("air", "helicopter") and len(path) == 2:
+        path = [list(node) for node in interpolate_points_if_gaps(path)]
+    coords = project(np.asarray(path, dtype=np.float64).reshape(-1, 2))
+    if len(coords) == 1:
+        return Point(coords[0])
+    return LineString(coords)
+
+
+def encode_trips_tile(trips, paths, z, x, y):
+    """
+    Build the MVT tile (z, x, y) of the given trips
+
+    trips are rows from getUniqueUserTrips, paths maps trip ids to the raw
+    value of the paths table. Geometries are clipped to the tile (plus a small
+    buffer) and simplified to a tolerance of one tile unit.
+    """
+    bounds = tile_bounds(z, x, y)
+    minx, miny, maxx, maxy = bounds
+    unit = (maxx - minx) / EXTENT
+    clip_box = box(
+        minx - BUFFER * unit,
+        miny - BUFFER * unit,
+        maxx + BUFFER * unit,
+        maxy + BUFFER * unit,
+    )
+
+    features = []
+    for trip in trips:
+        path = decode_path(paths.get(trip["uid"]))
+        if not path:
+            continue
+        geometry = trip_geometry(trip, path).intersection(clip_box)
+        if geometry.is_empty:
+            continue
+        features.append(
+            {
+                "id": trip["uid"],
+                "geometry": geometry.simplify(unit, preserve_topology=False),
+                "properties": {
+                    key: trip[key] for key in TRIP_PROPERTIES if trip[key] is not None
+                },
+            }
+        )
+
+    return mapbox_vector_tile.encode(
+        [{"name": "trips", "features": features}],
+        default_options={"quantize_bounds": bounds, "extents": EXTENT},
+    )
+
+
+def trips_version(trips, *args):
+    """
+    Hash identifying a selection of trips, used to invalidate cached tiles as
+    soon as a trip is added, edited or removed, or when any property written in
+    the tiles changes (past, current and future move with the current time)
+    """
+    digest = hashlib.sha1(repr(args).encode("utf-8"))
+    for trip in trips:
+        values = [trip["last_modified"], *(trip[key] for key in TRIP_PROPERTIES)]
+        digest.update(f"{values!r};".encode())
+    return digest.hexdigest()
+
+
+def tile_cache_path(username, version, z, x, y):
+    return os.path.join(TILE_CACHE_DIR, username, version, str(z), str(x), f"{y}.pbf")
+
+
+def get_cached_tile(username, version, z, x, y):
+    try:
+        with open(tile_cache_path(username, version, z, x, y), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def store_cached_tile(username, version, z, x, y, tile):
+    version_dir = os.path.join(TILE_CACHE_DIR, username, version)
+    if not os.path.exists(version_dir):
+        prune_tile_cache(username)
+
+    file_path = tile_cache_path(username, version, z, x, y)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    # write to a temporary file first so that other workers never read a partial tile
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(tile)
+    os.replace(tmp_path, file_path)
+    os.utime(version_dir)
+
+
+def prune_tile_cache(username):
+    """
+    Remove the cached versions of a user's tiles that haven't been used recently
+    """
+    user_dir = os.path.join(TILE_CACHE_DIR, username)
+    if not os.path.isdir(user_dir):
+        return
+    now = time.time()
+    for version in os.listdir(user_dir):
+        version_dir = os.path.join(user_dir, version)
+        if now - os.path.getmtime(version_dir) > TILE_CACHE_MAX_AGE:
+            shutil.rmtree(version_dir, ignore_errors=True)
@@ -0,0 +1,166 @@
+"""
+Index of the 1°x1° squares of the world grid visited by each trip
+
+The squares of a trip are computed once, when its path is written, and stored in
+the visited_squares table, so the map of a user is a single grouped query.
+"""
+
+import math
+from datetime import datetime
+
+from py.sql import upsertPercent
+from py.utils import interpolate_great_circle
+from src.path_codec import decode_path
+from src.utils import mainConn, managed_cursor, pathConn
+
+# Statuses of a square, from the weakest to the strongest. A square visited by
+# several trips keeps the strongest status.
+SQUARE_STATUSES = ("air", "passed", "stopped")
+AIR, PASSED, STOPPED = range(1, len(SQUARE_STATUSES) + 1)
+
+AIR_TYPES = ("air", "helicopter")
+
+TOTAL_SQUARES = 180 * 360  # entire world grid
+
+GET_VISITED_SQUARES = """
+    SELECT visited_squares.lat, visited_squares.lng, MAX(visited_squares.status) AS status
+    FROM trip
+    JOIN visited_squares ON visited_squares.trip_id = trip.uid
+    WHERE trip.username = :username
+    AND trip.start_datetime NOT IN (1)
+    AND (
+        CASE
+            WHEN trip.utc_start_datetime IS NOT NULL THEN trip.utc_start_datetime
+            ELSE trip.start_datetime
+        END
+    ) < :now
+    GROUP BY visited_squares.lat, visited_squares.lng
+"""
+
+
+def square(lat, lng):
+    return math.floor(lat), math.floor(lng)
+
+
+def trip_squares(path, trip_type):
+    """
+    Squares visited by a path, as a dict {(lat, lng): status}
+
+    Both ends of the path are stops, flights only mark the squares they fly
+    over as "air", densified along great circles when the path has
+    intermediate nodes.
+    """
+    squares = {}
+
+    def visit(lat, lng, status):
+        key = square(lat, lng)
+        squares[key] = max(squares.get(key, 0), status)
+
+    is_air = trip_type in AIR_TYPES
+    for i, (lat, lng) in enumerate(path):
+        visit(lat, lng, AIR if is_air else PASSED)
+        if i in (0, len(path) - 1):
+            visit(lat, lng, STOPPED)
+        if is_air and len(path) > 2 and i < len(path) - 1:
+            for inter_lat, inter_lng in interpolate_great_circle(
+                (lat, lng), tuple(path[i + 1]), max_distance_km=50
+            ):
+                visit(inter_lat, inter_lng, AIR)
+    return squares
+
+
+def index_trip_squares(trip_id, refresh_percent=True):
+    """
+    (Re)compute the squares visited by a trip, to be called whenever its path
+    or type change
+    """
+    with managed_cursor(mainConn) as cursor:
+        trip = cursor.execute(
+            "SELECT username, type FROM trip WHERE uid = ?", (trip_id,)
+        ).fetchone()
+
+    rows = []
+    if trip is not None:
+        with managed_cursor(pathConn) as cursor:
+            path_row = cursor.execute(
+                "SELECT path FROM paths WHERE trip_id = ?", (trip_id,)
+            ).fetchone()
+        path = decode_path(path_row["path"]) if path_row else []
+        rows = [
+            (trip_id, lat, lng, status)
+            for (lat, lng), status in trip_squares(path, trip["type"]).items()
+        ]
+
+    with managed_cursor(mainConn) as cursor:
+        cursor.execute("DELETE FROM visited_squares WHERE trip_id = ?", (trip_id,))
+        cursor.executemany(
+            "INSERT INTO visited_squares (trip_id, lat, lng, status) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+    mainConn.commit()
+
+    if refresh_percent and trip is not None:
+        update_world_squares_percent(trip["username"])
+
+
+def duplicate_trip_squares(trip_id, new_trip_id):
+    with managed_cursor(mainConn) as cursor:
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO visited_squares (trip_id, lat, lng, status)
+            SELECT ?, lat, lng, status FROM visited_squares WHERE trip_id = ?
+            """,
+            (new_trip_id, trip_id),
+        )
+    mainConn.commit()
+
+
+def delete_trip_squares(trip_id, username):
+    with managed_cursor(mainConn) as cursor:
+        cursor.execute("DELETE FROM visited_squares WHERE trip_id = ?", (trip_id,))
+    mainConn.commit()
+    update_world_squares_percent(username)
+
+
+def get_visited_squares(username):
+    """
+    Squares visited by the past trips of the user, as a dict {(lat, lng): status}
+    """
+    with managed_cursor(mainConn) as cursor:
+        rows = cursor.execute(
+            GET_VISITED_SQUARES, {"username": username, "now": datetime.now()}
+        ).fetchall()
+    return {
+        (row["lat"], row["lng"]): SQUARE_STATUSES[row["status"] - 1] for row in rows
+    }
+
+
+def squares_percentages(visited_squares):
+    """
+    Share of the world grid visited by land (passed or stopped) and only by air
+    """
+    land = sum(1 for status in visited_squares.values() if status != "air")
+    air = len(visited_squares) - land
+    return (land / TOTAL_SQUARES) * 100, (air / TOTAL_SQUARES) * 100
+
+
+def update_world_squares_percent(username, land_percentage=None):
+    """
+    Store the land percentage of the user in the percents table, if it changed
+    """
+    if land_percentage is None:
+        land_percentage = squares_percentages(get_visited_squares(username))[0]
+    percent = round(land_percentage, 2)
+
+    with managed_cursor(mainConn) as cursor:
+        stored = cursor.execute(
+            "SELECT percent FROM percents WHERE username = ? AND cc = 'world_squares'",
+            (username,),
+        ).fetchall()
+        if len(stored) == 1 and stored[0]["percent"] == percent:
+            return
+        cursor.execute(
+            upsertPercent,
+            {"username": username, "cc": "world_squares", "percent": percent},
+        )
+    mainConn.commit()
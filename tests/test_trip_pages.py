@@ -0,0 +1,84 @@
+import base64
+import sqlite3
+
+import pytest
+
+from src import trip_pages
+
+PAGE_SIZE = 7
+
+# Undated trips (1), past trips without date (-1) and dated trips, with
+# repeated and NULL values in the other sort columns
+TRIPS = [
+    (
+        uid,
+        [1, -1, f"2024-0{uid % 9 + 1}-1{uid % 3} 08:00:00"][uid % 3],
+        [None, "SNCF", "DB", "SBB"][uid % 4],
+        uid % 5 * 10,
+        None if uid % 6 == 0 else uid % 4 * 1.5,
+    )
+    for uid in range(1, 60)
+]
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        """
+        CREATE TABLE trips (
+            uid INTEGER PRIMARY KEY,
+            utc_filtered_start_datetime DATETIME,
+            operator TEXT,
+            trip_length INTEGER,
+            price FLOAT
+        )
+        """
+    )
+    conn.executemany("INSERT INTO trips VALUES (?, ?, ?, ?, ?)", TRIPS)
+    yield conn
+    conn.close()
+
+
+def select(keys, direction, condition="1"):
+    return (
+        f"SELECT *, {trip_pages.sort_columns(keys)} FROM trips WHERE {condition} "
+        f"{trip_pages.order_by(keys, direction)} LIMIT :limit OFFSET :offset"
+    )
+
+
+@pytest.mark.parametrize("direction", ["asc", "desc"])
+@pytest.mark.parametrize(
+    "column", ["start_datetime", "operator", "trip_length", "price"]
+)
+def test_keyset_pages_match_offset_pages(db, column, direction):
+    keys = trip_pages.sort_keys(column)
+    expected = [
+        row["uid"]
+        for row in db.execute(select(keys, direction), {"limit": -1, "offset": 0})
+    ]
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": PAGE_SIZE, "offset": 0}
+        condition = "1"
+        if cursor is not None:
+            values = trip_pages.decode_cursor(cursor, keys)
+            condition = trip_pages.seek_condition(keys, direction, values, params)
+        rows = db.execute(select(keys, direction, condition), params).fetchall()
+        if not rows:
+            break
+        seen += [row["uid"] for row in rows]
+        cursor = trip_pages.encode_cursor(rows[-1], keys)
+
+    assert seen == expected
+
+
+@pytest.mark.parametrize("values", ["[{}, 1, 2]", "[[1], 1, 2]", "[1, 2]", '"x"'])
+def test_decode_cursor_rejects_invalid_values(values):
+    keys = trip_pages.sort_keys("start_datetime")
+    cursor = base64.urlsafe_b64encode(values.encode()).decode()
+    assert trip_pages.decode_cursor(cursor, keys) is None
+    assert trip_pages.decode_cursor("not a cursor!", keys) is None